@@ -45,6 +45,13 @@ def create_app(config_name=None):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     
+    # 属性值存储方式写错时直接拒绝启动，避免按宽表读取却以为在读稀疏表
+    from app.services.classify_projection import SX_STORAGE_MODES
+    if app.config.get('CLASSIFY_SX_STORAGE') not in SX_STORAGE_MODES:
+        raise ValueError(
+            f"CLASSIFY_SX_STORAGE 必须是 {', '.join(SX_STORAGE_MODES)} 之一: {app.config.get('CLASSIFY_SX_STORAGE')!r}"
+        )
+    
     # 设置自定义JSON编码器
     app.json_encoder = CustomJSONEncoder
     
@@ -93,11 +100,19 @@ def create_app(config_name=None):
     app.register_blueprint(errors_bp)
     
     # 设置中间件
-    from app.utils.middleware import setup_request_logging, setup_error_logging, setup_performance_monitoring
+    from app.utils.middleware import (
+        setup_request_logging, setup_error_logging, setup_performance_monitoring, setup_sql_statement_counter
+    )
     
     setup_request_logging(app)
     setup_error_logging(app)
     setup_performance_monitoring(app)
+    setup_sql_statement_counter(app)
+    
+    # 启动后台解析任务线程池，继续执行上次进程遗留的任务
+    if app.config.get('PARSE_JOB_ASYNC', True) and app.config.get('PARSE_JOB_AUTOSTART', True):
+        from app.services.parse_job_service import start_parse_job_workers
+        start_parse_job_workers(app)
     
     logger.info("Application initialized successfully")
     
@@ -2,7 +2,7 @@
 字典管理API资源 - 符合OpenAPI标准的分层架构
 Controller层只与DTO和Service交互，不直接操作Entity
 """
-from flask import request
+from flask import request, current_app
 from flask_restx import Resource, fields
 from app.services.dict_service import DictService
 from app.dto.dict import (
@@ -23,6 +23,7 @@ from app.dto.dict import (
     # 通用 DTO
     ErrorResponse, ErrorCode, PaginatedResponse
 )
+from app.services.bulk_upsert import NDJSON_MIMETYPES, iter_ndjson
 from app.swagger import api
 from app.utils.decorators import paginated_response
 
@@ -215,6 +216,68 @@ rcj_mc2ejflid_update_model = api.model('RcjMC2EjflidUpdate', {
     'orignal_rcjmc': fields.String(description='原始人材机名称')
 })
 
+# 批量新增或更新响应模型
+bulk_upsert_item_model = api.model('BulkUpsertItem', {
+    'index': fields.Integer(description='记录在请求中的序号，从0开始'),
+    'status': fields.String(description='created: 新增，updated: 已存在并更新，error: 未写入'),
+    'id': fields.Integer(description='记录ID'),
+    'error': fields.String(description='未写入的原因')
+})
+
+bulk_upsert_response_model = api.model('BulkUpsertResponse', {
+    'total': fields.Integer(description='记录总数'),
+    'created': fields.Integer(description='新增数'),
+    'updated': fields.Integer(description='更新数'),
+    'failed': fields.Integer(description='失败数'),
+    'results': fields.List(fields.Nested(bulk_upsert_item_model), description='逐条结果，与请求顺序一致')
+})
+
+
+def read_bulk_rows():
+    """
+    读取批量请求体：JSON数组，或NDJSON（Content-Type为application/x-ndjson，每行一个对象，边读边处理）
+
+    Returns:
+        记录的迭代器；请求体不是JSON数组时返回None
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        return iter_ndjson(request.stream)
+    data = request.get_json(silent=True)
+    return data if isinstance(data, list) else None
+
+
+# 名称查找模型
+rcj_mc_lookup_request_model = api.model('RcjMCLookupRequest', {
+    'names': fields.List(fields.String, required=True, description='人材机名称列表')
+})
+
+rcj_mc_lookup_item_model = api.model('RcjMCLookupItem', {
+    'name': fields.String(description='查找的名称'),
+    'ejflid': fields.String(description='二级分类ID，找不到时为空'),
+    'ejflmc': fields.String(description='二级分类名称'),
+    'match': fields.String(description='exact: 原样匹配，normalized: 归一后匹配'),
+    'source': fields.String(description='mc2ejflid: 名称映射，classify: 名称分类')
+})
+
+rcj_mc_lookup_response_model = api.model('RcjMCLookupResponse', {
+    'data': fields.List(fields.Nested(rcj_mc_lookup_item_model), description='与请求顺序一致的查找结果'),
+    'matched': fields.Integer(description='找到二级分类的名称数')
+})
+
+# 名称搜索模型
+rcj_mc_search_item_model = api.model('RcjMCSearchItem', {
+    'name': fields.String(description='名称'),
+    'source': fields.String(description='mc2ejflid: 名称映射，classify: 名称分类'),
+    'id': fields.Integer(description='名称映射或名称分类的记录ID'),
+    'ejflid': fields.String(description='二级分类ID'),
+    'ejflmc': fields.String(description='二级分类名称'),
+    'score': fields.Float(description='相似度(0-1)，共有字符二元组的Dice系数')
+})
+
+rcj_mc_search_response_model = api.model('RcjMCSearchResponse', {
+    'data': fields.List(fields.Nested(rcj_mc_search_item_model), description='按相似度从高到低排列的候选')
+})
+
 # 人材机名称分类模型
 rcj_mc_classify_model = api.model('RcjMCClassify', {
     'id': fields.Integer(description='分类ID'),
@@ -787,6 +850,61 @@ class RcjMC2EjflidListResource(Resource):
             err = ErrorResponse(code=ErrorCode.INTERNAL_ERROR, message='服务器内部错误', details={'error': str(e)})
             return err.to_dict(), 500
 
+@dict_ns.route('/rcj-mc2ejflids/bulk')
+class RcjMC2EjflidBulkResource(Resource):
+    """人材机名称映射批量导入资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dict_service = DictService()
+    
+    @dict_ns.doc('批量新增或更新人材机名称映射')
+    @dict_ns.expect([rcj_mc2ejflid_create_model])
+    @dict_ns.response(200, '处理完成，逐条结果见results', bulk_upsert_response_model)
+    @dict_ns.response(400, '请求错误', error_model)
+    def post(self):
+        """批量新增或更新人材机名称映射，请求体为JSON数组或NDJSON"""
+        rows = read_bulk_rows()
+        if rows is None:
+            err = ErrorResponse(code=ErrorCode.VALIDATION_ERROR, message='请求体必须是JSON数组或NDJSON')
+            return err.to_dict(), 400
+        try:
+            result = self.dict_service.bulk_upsert_rcj_mc2ejflids(rows)
+            return result.to_dict(), 200
+        except Exception as e:
+            err = ErrorResponse(code=ErrorCode.INTERNAL_ERROR, message='服务器内部错误', details={'error': str(e)})
+            return err.to_dict(), 500
+
+@dict_ns.route('/rcj-mc2ejflids/lookup')
+class RcjMC2EjflidLookupResource(Resource):
+    """人材机名称批量查找资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dict_service = DictService()
+    
+    @dict_ns.doc('按人材机名称批量查找二级分类')
+    @dict_ns.expect(rcj_mc_lookup_request_model)
+    @dict_ns.response(200, '查找完成', rcj_mc_lookup_response_model)
+    @dict_ns.response(400, '请求错误', error_model)
+    def post(self):
+        """按人材机名称批量查找二级分类，先按原样、再按归一后的名称匹配名称映射和名称分类"""
+        data = request.get_json(silent=True)
+        names = data.get('names') if isinstance(data, dict) else None
+        if not isinstance(names, list) or not all(name is None or isinstance(name, str) for name in names):
+            err = ErrorResponse(code=ErrorCode.VALIDATION_ERROR, message='names必须是字符串数组')
+            return err.to_dict(), 400
+        max_names = current_app.config.get('DICT_LOOKUP_MAX_NAMES', 50000)
+        if len(names) > max_names:
+            err = ErrorResponse(code=ErrorCode.VALIDATION_ERROR, message=f'一次最多查找{max_names}个名称')
+            return err.to_dict(), 400
+        try:
+            results = self.dict_service.lookup_rcj_mc_ejflids(names)
+            return {'data': results, 'matched': sum(1 for item in results if item['ejflid'])}, 200
+        except Exception as e:
+            err = ErrorResponse(code=ErrorCode.INTERNAL_ERROR, message='服务器内部错误', details={'error': str(e)})
+            return err.to_dict(), 500
+
 @dict_ns.route('/rcj-mc2ejflids/<int:mapping_id>')
 @dict_ns.param('mapping_id', '映射ID')
 class RcjMC2EjflidResource(Resource):
@@ -888,6 +1006,31 @@ class RcjMCClassifyListResource(Resource):
             err = ErrorResponse(code=ErrorCode.INTERNAL_ERROR, message='服务器内部错误', details={'error': str(e)})
             return err.to_dict(), 500
 
+@dict_ns.route('/rcj-mc-classifies/bulk')
+class RcjMCClassifyBulkResource(Resource):
+    """人材机名称分类批量导入资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dict_service = DictService()
+    
+    @dict_ns.doc('批量新增或更新人材机名称分类')
+    @dict_ns.expect([rcj_mc_classify_create_model])
+    @dict_ns.response(200, '处理完成，逐条结果见results', bulk_upsert_response_model)
+    @dict_ns.response(400, '请求错误', error_model)
+    def post(self):
+        """批量新增或更新人材机名称分类，请求体为JSON数组或NDJSON"""
+        rows = read_bulk_rows()
+        if rows is None:
+            err = ErrorResponse(code=ErrorCode.VALIDATION_ERROR, message='请求体必须是JSON数组或NDJSON')
+            return err.to_dict(), 400
+        try:
+            result = self.dict_service.bulk_upsert_rcj_mc_classifies(rows)
+            return result.to_dict(), 200
+        except Exception as e:
+            err = ErrorResponse(code=ErrorCode.INTERNAL_ERROR, message='服务器内部错误', details={'error': str(e)})
+            return err.to_dict(), 500
+
 @dict_ns.route('/rcj-mc-classifies/<int:classify_id>')
 @dict_ns.param('classify_id', '分类ID')
 class RcjMCClassifyResource(Resource):
@@ -940,3 +1083,49 @@ class RcjMCClassifyResource(Resource):
             err = ErrorResponse(code=ErrorCode.NOT_FOUND, message='分类不存在')
             return err.to_dict(), 404
         return '', 204
+
+
+@dict_ns.route('/cache')
+class DictCacheResource(Resource):
+    """字典缓存资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dict_service = DictService()
+    
+    @dict_ns.doc('获取字典缓存统计')
+    @dict_ns.response(200, '获取成功')
+    def get(self):
+        """获取字典快照缓存的命中、未命中次数及当前快照信息"""
+        return self.dict_service.get_dict_cache_stats(), 200
+
+
+@dict_ns.route('/search')
+class RcjMCSearchResource(Resource):
+    """人材机名称模糊搜索资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dict_service = DictService()
+    
+    @dict_ns.doc('模糊搜索人材机名称')
+    @dict_ns.param('q', '搜索的名称', type=str, required=True)
+    @dict_ns.param('k', '返回的候选数', type=int, default=10)
+    @dict_ns.response(200, '搜索成功', rcj_mc_search_response_model)
+    @dict_ns.response(400, '请求错误', error_model)
+    def get(self):
+        """在名称映射和名称分类中模糊搜索与q相似的名称，用于没有原样匹配的名称的候选推荐"""
+        query = request.args.get('q', '', type=str).strip()
+        k = request.args.get('k', 10, type=int)
+        max_k = current_app.config.get('DICT_SEARCH_MAX_K', 100)
+        if not query:
+            err = ErrorResponse(code=ErrorCode.VALIDATION_ERROR, message='缺少搜索内容q')
+            return err.to_dict(), 400
+        if not 1 <= k <= max_k:
+            err = ErrorResponse(code=ErrorCode.VALIDATION_ERROR, message=f'k必须是1到{max_k}之间的整数')
+            return err.to_dict(), 400
+        try:
+            return {'data': self.dict_service.search_rcj_mc_names(query, k)}, 200
+        except Exception as e:
+            err = ErrorResponse(code=ErrorCode.INTERNAL_ERROR, message='服务器内部错误', details={'error': str(e)})
+            return err.to_dict(), 500
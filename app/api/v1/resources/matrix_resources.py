@@ -2,9 +2,14 @@
 矩阵管理API资源 - 符合OpenAPI标准的分层架构
 Controller层只与DTO和Service交互，不直接操作Entity
 """
-from flask import request
+import json
+from flask import Response, current_app, request, send_file, stream_with_context
 from flask_restx import Resource, fields
 from app.services.matrix_service import MatrixService
+from app.services.m3_export import M3ExportService, ExportUnavailableError, EXPORT_FORMATS
+from app.services.m3_stats import M3StatsService, StatsUnavailableError, DEFAULT_PERCENTILES
+from app.services.parse_job_service import ParseJobService
+from app.services.import_13jt_dynamic import IMPORT_MODES
 from app.services.dict_service import DictService
 from app.dto.matrix_dto import (
     FileListQueryDTO,
@@ -93,6 +98,30 @@ tree_response_model = api.model('TreeResponse', {
     'data': fields.List(fields.Nested(tree_node_model), description='树形结构数据')
 })
 
+# 解析任务模型
+import_verify_model = api.model('ImportVerify', {
+    'hash': fields.String(description='文件hash'),
+    'imported': fields.Boolean(description='是否有导入清单'),
+    'importer_version': fields.String(description='导入时的导入器版本'),
+    'current_version': fields.String(description='当前导入器版本'),
+    'match': fields.Boolean(description='文件、清单、数据库三者行数是否一致'),
+    'tables': fields.Raw(description='各表行数 {表名: {file, manifest, database}}')
+})
+
+parse_job_model = api.model('ParseJob', {
+    'id': fields.String(required=True, description='任务ID'),
+    'file_id': fields.Integer(required=True, description='文件ID'),
+    'mode': fields.String(description='导入模式: skip/replace'),
+    'state': fields.String(required=True, description='任务状态: pending/running/success/failed'),
+    'progress': fields.Raw(description='各表已写入行数'),
+    'total_rows': fields.Integer(description='已写入总行数'),
+    'error': fields.String(description='失败原因'),
+    'create_time': fields.DateTime(description='提交时间'),
+    'start_time': fields.DateTime(description='开始时间'),
+    'finish_time': fields.DateTime(description='结束时间'),
+    'duration': fields.Float(description='耗时(秒)')
+})
+
 @matrix_ns.route('/filelist')
 class FileListResource(Resource):
     """文件列表资源"""
@@ -193,13 +222,189 @@ class M3Resource(Resource):
         
     @matrix_ns.doc('获取M3')
     @matrix_ns.param('ejflid', '二级分类ID', type=str)
+    @matrix_ns.param('after_id', '游标分页：只返回id大于该值的记录，取上一页meta.next_after_id', type=int)
+    @matrix_ns.param('limit', '游标分页：每页数量；传after_id或limit时返回 {data, meta}', type=int)
+    @matrix_ns.param('format', 'ndjson: 以application/x-ndjson流式返回，每行一条记录', type=str)
     @matrix_ns.response(200, '获取成功')
+    @matrix_ns.response(400, '参数错误', error_model)
     def get(self):
-        """获取M3"""
+        """获取M3，不传分页参数时返回全部记录的列表"""
         ejflid = request.args.get('ejflid', None, type=str)
+        stream = request.args.get('format') == 'ndjson' or \
+            request.accept_mimetypes.best == 'application/x-ndjson'
+        try:
+            after_id = self._parse_int_arg('after_id', minimum=0)
+            limit = self._parse_int_arg('limit', minimum=1, maximum=current_app.config.get('M3_PAGE_MAX_LIMIT', 10000))
+        except ValueError as e:
+            return ErrorResponse(
+                code=ErrorCode.VALIDATION_ERROR,
+                message=str(e)
+            ).to_dict(), 400
+        
+        if stream:
+            return self._stream_m3(ejflid, after_id, limit)
+        if after_id is not None or limit is not None:
+            try:
+                return self.matrix_service.get_m3_page(ejflid, after_id, limit or 100).to_dict(), 200
+            except Exception as e:
+                return ErrorResponse(
+                    code=ErrorCode.INTERNAL_ERROR,
+                    message="获取M3失败",
+                    details={"error": str(e)}
+                ).to_dict(), 500
+        
         result = self.matrix_service.get_m3(ejflid)
         return result, 200
     
+    def _parse_int_arg(self, name, minimum=0, maximum=None):
+        value = request.args.get(name)
+        if value is None or value == '':
+            return None
+        if not value.strip().isdigit():
+            raise ValueError(f"{name}必须为整数")
+        value = int(value)
+        if value < minimum:
+            raise ValueError(f"{name}不能小于 {minimum}")
+        if maximum is not None and value > maximum:
+            raise ValueError(f"{name}不能大于 {maximum}")
+        return value
+    
+    def _stream_m3(self, ejflid, after_id, limit):
+        """NDJSON流式响应，记录由服务端游标分批读取后逐行写出"""
+        matrix_service = self.matrix_service
+        
+        def generate():
+            try:
+                for item in matrix_service.iter_m3(ejflid, after_id=after_id, limit=limit):
+                    yield json.dumps(item, ensure_ascii=False, default=str) + '\n'
+            except Exception as e:
+                # 响应头已发出，只能记录错误并结束输出
+                matrix_service.log_error(e, {"method": "stream_m3", "ejflid": ejflid})
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+@matrix_ns.route('/m3/export')
+class M3ExportResource(Resource):
+    """M3列式导出资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.m3_export_service = M3ExportService()
+        
+    @matrix_ns.doc('导出M3')
+    @matrix_ns.param('ejflid', '二级分类ID', type=str, required=True)
+    @matrix_ns.param('format', '导出格式: parquet(默认)/arrow', type=str)
+    @matrix_ns.response(200, '导出文件')
+    @matrix_ns.response(304, '文件未变化')
+    @matrix_ns.response(400, '参数错误', error_model)
+    @matrix_ns.response(404, '二级分类不存在', error_model)
+    @matrix_ns.response(501, '服务端未安装pyarrow', error_model)
+    def get(self):
+        """导出二级分类的M3记录为Parquet或Arrow IPC文件，数据未变化时直接返回缓存文件"""
+        ejflid = request.args.get('ejflid', None, type=str)
+        fmt = request.args.get('format', 'parquet', type=str)
+        if not ejflid or not ejflid.strip():
+            return ErrorResponse(
+                code=ErrorCode.VALIDATION_ERROR,
+                message="二级分类ID不能为空"
+            ).to_dict(), 400
+        if fmt not in EXPORT_FORMATS:
+            return ErrorResponse(
+                code=ErrorCode.VALIDATION_ERROR,
+                message="导出格式必须为parquet或arrow"
+            ).to_dict(), 400
+        
+        ejflid = ejflid.strip()
+        try:
+            result = self.m3_export_service.export_m3(ejflid, fmt)
+        except ExportUnavailableError as e:
+            return ErrorResponse(
+                code=ErrorCode.INTERNAL_ERROR,
+                message=str(e)
+            ).to_dict(), 501
+        except Exception as e:
+            self.m3_export_service.log_error(e, {"method": "export_m3", "ejflid": ejflid})
+            return ErrorResponse(
+                code=ErrorCode.INTERNAL_ERROR,
+                message="导出M3失败",
+                details={"error": str(e)}
+            ).to_dict(), 500
+        if result is None:
+            return ErrorResponse(
+                code=ErrorCode.NOT_FOUND,
+                message=f"二级分类 {ejflid} 不存在"
+            ).to_dict(), 404
+        
+        path, version = result
+        extension, mimetype = EXPORT_FORMATS[fmt]
+        return send_file(path, mimetype=mimetype, as_attachment=True,
+                         download_name=f"m3-{ejflid}{extension}", etag=version, conditional=True)
+    
+@matrix_ns.route('/m3/stats')
+class M3StatsResource(Resource):
+    """M3价格统计资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.m3_stats_service = M3StatsService()
+        
+    @matrix_ns.doc('M3价格统计')
+    @matrix_ns.param('ejflid', '二级分类ID', type=str, required=True)
+    @matrix_ns.param('sxids', '分组属性ID，逗号分隔；不传按该二级分类全部属性分组，传空值不分组', type=str)
+    @matrix_ns.param('percentiles', '百分位数(0-100)，逗号分隔，默认5,25,75,95', type=str)
+    @matrix_ns.response(200, '获取成功')
+    @matrix_ns.response(400, '参数错误', error_model)
+    @matrix_ns.response(404, '二级分类不存在', error_model)
+    @matrix_ns.response(501, '服务端未安装numpy', error_model)
+    def get(self):
+        """统计二级分类单价的数量、最值、均值、中位数、百分位数和异常值，并按属性值组合分组统计"""
+        ejflid = request.args.get('ejflid', None, type=str)
+        if not ejflid or not ejflid.strip():
+            return ErrorResponse(
+                code=ErrorCode.VALIDATION_ERROR,
+                message="二级分类ID不能为空"
+            ).to_dict(), 400
+        ejflid = ejflid.strip()
+        sxids = request.args.get('sxids', None, type=str)
+        group_sx_ids = None if sxids is None else [sx_id.strip() for sx_id in sxids.split(',') if sx_id.strip()]
+        try:
+            percentiles = self._parse_percentiles(request.args.get('percentiles', None, type=str))
+            result = self.m3_stats_service.get_m3_stats(ejflid, group_sx_ids, percentiles)
+        except ValueError as e:
+            return ErrorResponse(
+                code=ErrorCode.VALIDATION_ERROR,
+                message=str(e)
+            ).to_dict(), 400
+        except StatsUnavailableError as e:
+            return ErrorResponse(
+                code=ErrorCode.INTERNAL_ERROR,
+                message=str(e)
+            ).to_dict(), 501
+        except Exception as e:
+            self.m3_stats_service.log_error(e, {"method": "get_m3_stats", "ejflid": ejflid})
+            return ErrorResponse(
+                code=ErrorCode.INTERNAL_ERROR,
+                message="M3价格统计失败",
+                details={"error": str(e)}
+            ).to_dict(), 500
+        if result is None:
+            return ErrorResponse(
+                code=ErrorCode.NOT_FOUND,
+                message=f"二级分类 {ejflid} 不存在"
+            ).to_dict(), 404
+        return result, 200
+    
+    def _parse_percentiles(self, value):
+        if value is None or not value.strip():
+            return DEFAULT_PERCENTILES
+        try:
+            percentiles = [float(item) for item in value.split(',') if item.strip()]
+        except ValueError:
+            raise ValueError("percentiles必须为逗号分隔的数字")
+        if any(not 0 <= p <= 100 for p in percentiles):
+            raise ValueError("percentiles必须在0到100之间")
+        return percentiles
+    
 @matrix_ns.route('/fileparser')
 class FileParserResource(Resource):
     """文件解析资源"""
@@ -207,15 +412,70 @@ class FileParserResource(Resource):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.matrix_service = MatrixService()
+        self.parse_job_service = ParseJobService()
         
     @matrix_ns.doc('解析文件')
     @matrix_ns.param('fileid', '文件ID', type=str)
-    @matrix_ns.response(200, '解析成功')
+    @matrix_ns.param('mode', '导入模式: skip(默认，已导入则跳过)/replace(删除后重新导入)/verify(只比较行数)', type=str)
+    @matrix_ns.response(200, '校验结果', import_verify_model)
+    @matrix_ns.response(202, '解析任务已提交', parse_job_model)
+    @matrix_ns.response(400, '参数错误', error_model)
+    @matrix_ns.response(404, '文件不存在', error_model)
     def get(self):
-        """解析文件"""
+        """提交文件解析任务，立即返回任务ID，通过 /matrix/jobs/<id> 查询进度"""
         fileid = request.args.get('fileid', None, type=str)
-        result = self.matrix_service.parse_file(fileid)
-        return result, 200
+        mode = request.args.get('mode', 'skip', type=str)
+        if not fileid or not fileid.strip().isdigit():
+            return ErrorResponse(
+                code=ErrorCode.VALIDATION_ERROR,
+                message="文件ID必须为数字"
+            ).to_dict(), 400
+        if mode != 'verify' and mode not in IMPORT_MODES:
+            return ErrorResponse(
+                code=ErrorCode.VALIDATION_ERROR,
+                message="导入模式必须为skip、replace或verify"
+            ).to_dict(), 400
+
+        if mode == 'verify':
+            try:
+                return self.matrix_service.verify_file(fileid.strip()), 200
+            except FileNotFoundError as e:
+                return ErrorResponse(
+                    code=ErrorCode.NOT_FOUND,
+                    message=str(e)
+                ).to_dict(), 404
+
+        try:
+            job = self.parse_job_service.submit_parse_job(fileid.strip(), mode)
+        except FileNotFoundError as e:
+            return ErrorResponse(
+                code=ErrorCode.NOT_FOUND,
+                message=str(e)
+            ).to_dict(), 404
+        return job.to_dict(), 202
+
+
+@matrix_ns.route('/jobs/<string:job_id>')
+@matrix_ns.param('job_id', '任务ID')
+class ParseJobResource(Resource):
+    """解析任务资源"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parse_job_service = ParseJobService()
+
+    @matrix_ns.doc('查询解析任务')
+    @matrix_ns.response(200, '获取成功', parse_job_model)
+    @matrix_ns.response(404, '任务不存在', error_model)
+    def get(self, job_id):
+        """查询解析任务状态、进度和耗时"""
+        job = self.parse_job_service.get_parse_job(job_id)
+        if job is None:
+            return ErrorResponse(
+                code=ErrorCode.NOT_FOUND,
+                message=f"任务 {job_id} 不存在"
+            ).to_dict(), 404
+        return job.to_dict(), 200
     
 @matrix_ns.route('/fileanalysis')
 class FileParserResource(Resource):
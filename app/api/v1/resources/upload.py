@@ -7,6 +7,7 @@ from werkzeug.utils import secure_filename
 from flask import request, current_app
 from flask_restx import Resource, fields
 from app.services.upload_service import UploadService
+from app.services.chunked_upload_service import ChunkedUploadService
 from app.dto.upload_dto import (
     FileUploadRequestDTO, FileUploadResponseDTO, FileListResponseDTO,
     ErrorResponse, ErrorCode
@@ -80,6 +81,27 @@ batch_upload_response_model = api.model('BatchUploadResponse', {
     'errors': fields.List(fields.String, description='错误信息列表')
 })
 
+# 分块上传会话请求模型
+upload_session_request_model = api.model('UploadSessionRequest', {
+    'filename': fields.String(required=True, description='原始文件名'),
+    'file_size': fields.Integer(required=True, description='文件大小(字节)'),
+    'chunk_size': fields.Integer(description='分块大小(字节)，默认5MB'),
+    'hash': fields.String(description='文件MD5，完成时校验')
+})
+
+# 分块上传会话响应模型
+upload_session_model = api.model('UploadSession', {
+    'session_id': fields.String(required=True, description='会话ID'),
+    'filename': fields.String(required=True, description='原始文件名'),
+    'file_size': fields.Integer(required=True, description='文件大小(字节)'),
+    'chunk_size': fields.Integer(required=True, description='分块大小(字节)'),
+    'total_chunks': fields.Integer(required=True, description='分块总数'),
+    'received_chunks': fields.Integer(required=True, description='已收到的分块数'),
+    'missing_chunks': fields.List(fields.Integer, description='缺失的分块序号'),
+    'hash': fields.String(description='文件MD5'),
+    'expires_at': fields.DateTime(description='无活动时的过期时间')
+})
+
 @upload_ns.route('/files')
 class FileUploadResource(Resource):
     """文件上传资源"""
@@ -329,5 +351,136 @@ class FileDownloadResource(Resource):
                 'code': 'DOWNLOAD_ERROR',
                 'message': '文件下载失败',
                 'details': str(e)
-            }, 500 
-        
+            }, 500
+
+
+def _session_not_found(session_id):
+    return {
+        'code': ErrorCode.SESSION_NOT_FOUND,
+        'message': '上传会话不存在',
+        'details': f'上传会话 {session_id} 不存在或已过期'
+    }, 404
+
+@upload_ns.route('/sessions')
+class UploadSessionListResource(Resource):
+    """分块上传会话资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chunked_upload_service = ChunkedUploadService()
+    
+    @upload_ns.doc('创建分块上传会话')
+    @upload_ns.expect(upload_session_request_model)
+    @upload_ns.response(201, '创建成功', upload_session_model)
+    @upload_ns.response(400, '请求错误', error_model)
+    def post(self):
+        """创建分块上传会话，之后按序号PUT各分块"""
+        data = request.get_json(silent=True) or {}
+        try:
+            result = self.chunked_upload_service.create_session(
+                filename=data.get('filename', ''),
+                file_size=int(data.get('file_size') or 0),
+                chunk_size=int(data['chunk_size']) if data.get('chunk_size') else None,
+                file_hash=data.get('hash') or None
+            )
+            return result.to_dict(), 201
+        except (ValueError, TypeError) as e:
+            return {
+                'code': ErrorCode.VALIDATION_ERROR,
+                'message': '参数错误',
+                'details': str(e)
+            }, 400
+
+@upload_ns.route('/sessions/<string:session_id>')
+@upload_ns.param('session_id', '会话ID')
+class UploadSessionResource(Resource):
+    """单个分块上传会话资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chunked_upload_service = ChunkedUploadService()
+    
+    @upload_ns.doc('查询分块上传会话')
+    @upload_ns.response(200, '获取成功', upload_session_model)
+    @upload_ns.response(404, '会话不存在', error_model)
+    def get(self, session_id):
+        """查询会话状态，missing_chunks为尚未收到的分块序号"""
+        try:
+            return self.chunked_upload_service.get_session(session_id).to_dict(), 200
+        except FileNotFoundError:
+            return _session_not_found(session_id)
+    
+    @upload_ns.doc('取消分块上传会话')
+    @upload_ns.response(200, '取消成功')
+    @upload_ns.response(404, '会话不存在', error_model)
+    def delete(self, session_id):
+        """取消会话并删除已上传的分块"""
+        try:
+            self.chunked_upload_service.abort_session(session_id)
+            return {'message': '上传会话已取消'}, 200
+        except FileNotFoundError:
+            return _session_not_found(session_id)
+
+@upload_ns.route('/sessions/<string:session_id>/chunks/<int:index>')
+@upload_ns.param('session_id', '会话ID')
+@upload_ns.param('index', '分块序号，从0开始')
+class UploadChunkResource(Resource):
+    """分块资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chunked_upload_service = ChunkedUploadService()
+    
+    @upload_ns.doc('上传分块')
+    @upload_ns.response(200, '上传成功', upload_session_model)
+    @upload_ns.response(400, '分块错误', error_model)
+    @upload_ns.response(404, '会话不存在', error_model)
+    def put(self, session_id, index):
+        """上传一个分块，请求体为分块的原始字节，可按任意顺序上传"""
+        try:
+            result = self.chunked_upload_service.write_chunk(session_id, index, request.stream)
+            return result.to_dict(), 200
+        except FileNotFoundError:
+            return _session_not_found(session_id)
+        except ValueError as e:
+            return {
+                'code': ErrorCode.CHUNK_ERROR,
+                'message': '分块错误',
+                'details': str(e)
+            }, 400
+
+@upload_ns.route('/sessions/<string:session_id>/complete')
+@upload_ns.param('session_id', '会话ID')
+class UploadSessionCompleteResource(Resource):
+    """完成分块上传资源"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chunked_upload_service = ChunkedUploadService()
+    
+    @upload_ns.doc('完成分块上传')
+    @upload_ns.response(201, '上传成功', file_upload_response_model)
+    @upload_ns.response(400, '分块缺失或哈希不一致', error_model)
+    @upload_ns.response(404, '会话不存在', error_model)
+    @upload_ns.response(409, '文件已存在', error_model)
+    def post(self, session_id):
+        """合并所有分块，校验哈希并创建文件记录"""
+        try:
+            result = self.chunked_upload_service.complete_session(session_id)
+            logger.info("Chunked upload completed", session_id=session_id, file_id=result.id,
+                        file_size=result.file_size)
+            return result.to_dict(), 201
+        except FileNotFoundError:
+            return _session_not_found(session_id)
+        except ValueError as e:
+            if "文件已存在" in str(e):
+                return {
+                    'code': ErrorCode.FILE_ALREADY_EXISTS,
+                    'message': '文件已存在',
+                    'details': str(e)
+                }, 409
+            return {
+                'code': ErrorCode.VALIDATION_ERROR,
+                'message': '文件验证失败',
+                'details': str(e)
+            }, 400
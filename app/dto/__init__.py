@@ -40,7 +40,8 @@ from .dict import (
     RcjMCClassifyRequestDTO,
     RcjMCClassifyUpdateRequestDTO,
     RcjMCClassifyResponseDTO,
-    RcjMCClassifyInternalDTO
+    RcjMCClassifyInternalDTO,
+    BulkUpsertResponseDTO
 )
 
 # 导出通用 DTO
@@ -2,7 +2,7 @@
 通用DTO - 用于跨模块共享的数据传输对象
 """
 from dataclasses import dataclass
-from typing import List, Any, Generic, TypeVar
+from typing import List, Any, Generic, Optional, TypeVar
 from datetime import datetime
 
 T = TypeVar('T')
@@ -52,6 +52,29 @@ class PaginatedResponse(Generic[T]):
         return self.to_dict()
 
 
+@dataclass
+class CursorPaginatedResponse(Generic[T]):
+    """游标（keyset）分页响应DTO，下一页以 after_id=next_after_id 请求"""
+    data: List[T]
+    limit: int
+    next_after_id: Optional[int] = None
+    
+    def to_dict(self):
+        """转换为字典，用于JSON序列化"""
+        return {
+            'data': [item.to_dict() if hasattr(item, 'to_dict') else item for item in self.data],
+            'meta': {
+                'limit': self.limit,
+                'next_after_id': self.next_after_id,
+                'has_next': self.next_after_id is not None
+            }
+        }
+    
+    def __json__(self):
+        """Flask-RESTX JSON序列化支持"""
+        return self.to_dict()
+
+
 @dataclass
 class ApiResponse:
     """标准API响应DTO"""
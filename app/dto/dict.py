@@ -740,4 +740,39 @@ class RcjMCClassifyInternalDTO:
     
     def __json__(self):
         """Flask-RESTX JSON序列化支持"""
-        return self.to_dict() 
\ No newline at end of file
+        return self.to_dict()
+
+
+# ==================== 批量导入 DTO ====================
+
+@dataclass
+class BulkUpsertResponseDTO:
+    """
+    批量新增或更新响应DTO
+
+    results 与请求中的记录一一对应: {index, status, id, error}，
+    status 为 created（新增）、updated（按唯一名称更新）或 error（未写入，error 为原因）
+    """
+    total: int = 0
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    results: List[Dict[str, Any]] = None
+    
+    def __post_init__(self):
+        if self.results is None:
+            self.results = []
+    
+    def to_dict(self):
+        """转换为字典，用于JSON序列化"""
+        return {
+            'total': self.total,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'results': self.results
+        }
+    
+    def __json__(self):
+        """Flask-RESTX JSON序列化支持"""
+        return self.to_dict()
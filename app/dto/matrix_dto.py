@@ -169,4 +169,39 @@ class TreeResponseDTO:
     def __json__(self):
         """Flask-RESTX JSON序列化支持"""
         return self.to_dict()
-    
\ No newline at end of file
+    
+
+@dataclass
+class ParseJobResponseDTO:
+    """解析任务响应DTO"""
+    id: str
+    file_id: int
+    mode: str
+    state: str
+    progress: Dict[str, int]
+    total_rows: int
+    error: Optional[str] = None
+    create_time: Optional[datetime] = None
+    start_time: Optional[datetime] = None
+    finish_time: Optional[datetime] = None
+    duration: Optional[float] = None  # 秒，运行中的任务为已运行时长
+
+    def to_dict(self):
+        """转换为字典，用于JSON序列化"""
+        return {
+            'id': self.id,
+            'file_id': self.file_id,
+            'mode': self.mode,
+            'state': self.state,
+            'progress': self.progress,
+            'total_rows': self.total_rows,
+            'error': self.error,
+            'create_time': datetime_to_iso(self.create_time),
+            'start_time': datetime_to_iso(self.start_time),
+            'finish_time': datetime_to_iso(self.finish_time),
+            'duration': self.duration
+        }
+
+    def __json__(self):
+        """Flask-RESTX JSON序列化支持"""
+        return self.to_dict()
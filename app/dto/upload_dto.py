@@ -112,6 +112,38 @@ class BatchUploadResponseDTO:
         return self.to_dict()
 
 
+@dataclass
+class UploadSessionResponseDTO:
+    """分块上传会话响应DTO"""
+    session_id: str
+    filename: str
+    file_size: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: int
+    missing_chunks: List[int]
+    hash: Optional[str] = None
+    expires_at: Optional[datetime] = None
+    
+    def to_dict(self):
+        """转换为字典，用于JSON序列化"""
+        return {
+            'session_id': self.session_id,
+            'filename': self.filename,
+            'file_size': self.file_size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'received_chunks': self.received_chunks,
+            'missing_chunks': self.missing_chunks,
+            'hash': self.hash,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+    
+    def __json__(self):
+        """Flask-RESTX JSON序列化支持"""
+        return self.to_dict()
+
+
 @dataclass
 class ErrorResponse:
     """错误响应DTO"""
@@ -146,4 +178,6 @@ class ErrorCode:
     DOWNLOAD_ERROR = "DOWNLOAD_ERROR"
     LIST_ERROR = "LIST_ERROR"
     VALIDATION_ERROR = "VALIDATION_ERROR"
-    FILE_ALREADY_EXISTS = "FILE_ALREADY_EXISTS"  # 新增：文件已存在错误码 
\ No newline at end of file
+    FILE_ALREADY_EXISTS = "FILE_ALREADY_EXISTS"  # 新增：文件已存在错误码
+    SESSION_NOT_FOUND = "SESSION_NOT_FOUND"
+    CHUNK_ERROR = "CHUNK_ERROR" 
\ No newline at end of file
@@ -11,6 +11,8 @@ from datetime import datetime
 class RcjMCClassifyBig(db.Model):
     __tablename__ = 'RcjMCClassifyBig'
     __table_args__ = (
+        # 按二级分类缓存的导出文件、统计结果用 (记录数, 最大ID, 最近更新时间) 判断是否过期，只扫描该索引即可得到
+        Index('ix_rcjmcclassifybig_ejflid_update_time', 'ejflid', 'update_time'),
         {'comment': '用来存储大模型分析后的完整分类信息，包含属性'}
     )
 
@@ -989,6 +991,20 @@ class RcjMCClassifyBig(db.Model):
     sx_0950: Mapped[Optional[str]] = mapped_column(String(20),comment='龙骨材质及型号')
 
 
+class RcjMCClassifySx(db.Model):
+    __tablename__ = 'RcjMCClassifySx'
+    __table_args__ = (
+        Index('ix_rcjmcclassifysx_sx_value', 'sx_id', 'value'),
+        {'comment': 'RcjMCClassifyBig属性值的稀疏存储，每个非空的sx_XXXX值一行，CLASSIFY_SX_STORAGE=sparse时读取'}
+    )
+
+    # 行数是分类记录数的若干倍，不设create_time/update_time，保持行宽最小
+    classify_id: Mapped[int] = mapped_column(Integer, ForeignKey('RcjMCClassifyBig.id', ondelete='CASCADE'), primary_key=True)
+    # 四位属性ID，与列名sx_XXXX的后缀一致
+    sx_id: Mapped[str] = mapped_column(String(4), primary_key=True)
+    value: Mapped[Optional[str]] = mapped_column(String(20))
+
+
 RcjItem2ClassifyRleationship =Table(
     'RcjItem2ClassifyRleationship',
     db.metadata,
@@ -13,6 +13,9 @@ from .dict import (
     RcjMC2Ejflid,
     RcjMCClassify
 )
+from .parse_job import ParseJob
+from .import_manifest import ImportManifest
+from .file_classify_summary import FileClassifySummary
 
 # 导出所有模型
 __all__ = [
@@ -22,5 +25,8 @@ __all__ = [
     'RcjYjfl',
     'RcjEjfl',
     'RcjMC2Ejflid',
-    'RcjMCClassify'
+    'RcjMCClassify',
+    'ParseJob',
+    'ImportManifest',
+    'FileClassifySummary'
 ]
@@ -149,7 +149,7 @@ class RcjMC2Ejflid(db.Model):
     # 四位数字字符串
     id: Mapped[Integer] = mapped_column(Integer, primary_key=True)
     ejflid: Mapped[Optional[str]] = mapped_column(String(4),index=True)
-    orignal_rcjmc: Mapped[Optional[str]] = mapped_column(String(300),index=True)
+    orignal_rcjmc: Mapped[Optional[str]] = mapped_column(String(300),unique=True,index=True)
     create_time: Mapped[DateTime] = mapped_column(DateTime, default=datetime.now, nullable=False)
     update_time: Mapped[DateTime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
 
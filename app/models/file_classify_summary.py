@@ -0,0 +1,27 @@
+from app import db
+from sqlalchemy import String, Integer, DateTime, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+from typing import Optional
+
+
+class FileClassifySummary(db.Model):
+    __tablename__ = 'file_classify_summary'
+    __table_args__ = (
+        UniqueConstraint('file_id', 'ejflid', name='uq_file_classify_summary_file_ejfl'),
+        {'comment': '每个文件按二级分类汇总的分类数量，由关联表RcjItem2ClassifyRleationship聚合生成'}
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    file_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    yjflid: Mapped[Optional[str]] = mapped_column(String(4))
+    yjflmc: Mapped[Optional[str]] = mapped_column(String(50))
+    ejflid: Mapped[str] = mapped_column(String(4), nullable=False)
+    ejflmc: Mapped[Optional[str]] = mapped_column(String(50))
+    # 该文件的rcjhzmx关联到的、属于该二级分类的RcjMCClassifyBig记录数（按记录ID去重）
+    classify_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    create_time: Mapped[DateTime] = mapped_column(DateTime, default=datetime.now, nullable=False)
+    update_time: Mapped[DateTime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+
+    def __repr__(self):
+        return f"<FileClassifySummary(file_id={self.file_id}, ejflid='{self.ejflid}', count={self.classify_count})>"
@@ -0,0 +1,23 @@
+from app import db
+from sqlalchemy import String, Integer, DateTime, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+from typing import Optional
+
+
+class ImportManifest(db.Model):
+    __tablename__ = 'matrix_import_manifest'
+    __table_args__ = (
+        {'comment': '13jt文件导入清单，按文件hash记录已导入的各表行数，与导入数据在同一事务中写入'}
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    hash: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
+    file_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    importer_version: Mapped[str] = mapped_column(String(20), nullable=False)
+    row_counts: Mapped[Optional[str]] = mapped_column(Text, comment='各表导入行数，JSON格式')
+    create_time: Mapped[DateTime] = mapped_column(DateTime, default=datetime.now, nullable=False)
+    update_time: Mapped[DateTime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+
+    def __repr__(self):
+        return f"<ImportManifest(hash='{self.hash}', file_id={self.file_id}, version='{self.importer_version}')>"
@@ -1,8 +1,9 @@
 from typing import List, Optional
 
-from sqlalchemy import DateTime, ForeignKey, Index, Integer, String, Text
+from sqlalchemy import Date, DateTime, ForeignKey, Index, Integer, Numeric, String, Text
 from sqlalchemy.orm import  Mapped, mapped_column, relationship
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
 from app import db
 from app.models.RcjMCClassifyBig import RcjItem2ClassifyRleationship
 
@@ -249,6 +250,8 @@ class Toubiaoxx(db.Model):
     tbrdb: Mapped[Optional[str]] = mapped_column(String(100))
     bzr: Mapped[Optional[str]] = mapped_column(String(100))
     bztime: Mapped[Optional[str]] = mapped_column(String(100))
+    # bztime的类型化影子列，导入时转换，见 app/services/typed_columns.py
+    bztime_date: Mapped[Optional[date]] = mapped_column(Date, info={'shadow_of': 'bztime'})
     tbzj: Mapped[Optional[str]] = mapped_column(String(100))
     zgj: Mapped[Optional[str]] = mapped_column(String(100))
     aqwmf: Mapped[Optional[str]] = mapped_column(String(100))
@@ -946,7 +949,8 @@ class Rcjhzmx(db.Model):
         Index('ix_rcjhzmx_id', 'id'),
         Index('ix_rcjhzmx_jingjibiao_id', 'jingjibiao_id'),
         Index('ix_rcjhzmx_rcjhz_id', 'rcjhz_id'),
-        Index('ix_rcjhzmx_update_time', 'update_time')
+        Index('ix_rcjhzmx_update_time', 'update_time'),
+        Index('ix_rcjhzmx_file_id_dj_num', 'file_id', 'dj_num')
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -968,6 +972,10 @@ class Rcjhzmx(db.Model):
     zgjbz: Mapped[Optional[str]] = mapped_column(String(100))
     zcbz: Mapped[Optional[str]] = mapped_column(String(100))
     sbbz: Mapped[Optional[str]] = mapped_column(String(100))
+    # dj/sl/hj的类型化影子列，导入时转换，用于在SQL中按单价、数量、合价过滤和聚合，见 app/services/typed_columns.py
+    dj_num: Mapped[Optional[Decimal]] = mapped_column(Numeric(18, 4), info={'shadow_of': 'dj'})
+    sl_num: Mapped[Optional[Decimal]] = mapped_column(Numeric(18, 4), info={'shadow_of': 'sl'})
+    hj_num: Mapped[Optional[Decimal]] = mapped_column(Numeric(18, 4), info={'shadow_of': 'hj'})
     file_id: Mapped[Optional[int]] = mapped_column(ForeignKey('origin_13jt_file.id'))
     jingjibiao_id: Mapped[Optional[int]] = mapped_column(ForeignKey('origin_13jt_jingjibiao.id'))
     dxgcxx_id: Mapped[Optional[int]] = mapped_column(ForeignKey('origin_13jt_dxgcxx.id'))
@@ -0,0 +1,32 @@
+from app import db
+from sqlalchemy import String, Integer, DateTime, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+from typing import Optional
+
+
+class ParseJob(db.Model):
+    __bind_key__ = 'jobs'
+    __tablename__ = 'matrix_parse_job'
+    __table_args__ = (
+        {'comment': '13jt文件解析任务，存放在独立的jobs库中，进程重启后可继续执行'}
+    )
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    file_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    # skip / replace，见MatrixService.import_file
+    mode: Mapped[str] = mapped_column(String(10), default='skip', nullable=False)
+    # pending / running / success / failed
+    state: Mapped[str] = mapped_column(String(10), index=True, default='pending', nullable=False)
+    progress: Mapped[Optional[str]] = mapped_column(Text, comment='各表已写入行数，JSON格式')
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    # 执行任务的进程（主机名:pid）及其最近一次心跳，用于判断running任务的进程是否已退出
+    owner: Mapped[Optional[str]] = mapped_column(String(100))
+    heartbeat_time: Mapped[Optional[DateTime]] = mapped_column(DateTime)
+    start_time: Mapped[Optional[DateTime]] = mapped_column(DateTime)
+    finish_time: Mapped[Optional[DateTime]] = mapped_column(DateTime)
+    create_time: Mapped[DateTime] = mapped_column(DateTime, default=datetime.now, nullable=False, index=True)
+    update_time: Mapped[DateTime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+
+    def __repr__(self):
+        return f"<ParseJob(id={self.id}, file_id={self.file_id}, state='{self.state}')>"
@@ -0,0 +1,119 @@
+"""
+按唯一列批量新增或更新
+
+upsert_rows 把一批行按唯一列写入表中：已存在的行更新指定的列，不存在的行新增。
+SQLite/PostgreSQL 使用 INSERT ... ON CONFLICT DO UPDATE，MySQL 使用 ON DUPLICATE KEY UPDATE，
+每批只执行三条语句（查询已有的键、upsert、查询ID）；其他数据库退回先查询再分别插入、更新。
+upsert语句要求key上有唯一索引，create_all 不会修改已有表的索引，
+升级前建立的数据库缺少唯一索引时同样退回分别插入、更新（见 DATABASE_MIGRATION.md）。
+"""
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import Connection, bindparam, inspect, select
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-seq')
+
+
+def iter_ndjson(lines: Iterable) -> Iterator:
+    """
+    逐行解析NDJSON，跳过空行
+
+    每行生成解析出的对象；无法解析的行生成 ValueError，由调用方作为该行的错误处理，不中断后续行。
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8-sig')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"JSON格式错误: {e}")
+
+
+def _upsert_statement(dialect_name: str, table, key: str, update_columns: Sequence[str]):
+    """方言对应的upsert语句，不支持时返回None"""
+    if dialect_name in ('sqlite', 'postgresql'):
+        if dialect_name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c[key]],
+            set_={column: statement.excluded[column] for column in update_columns},
+        )
+    if dialect_name in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        return statement.on_duplicate_key_update(
+            {column: statement.inserted[column] for column in update_columns}
+        )
+    return None
+
+
+def has_unique_key(executor, table, key: str) -> bool:
+    """
+    数据库中的表是否以 key 单列建有唯一索引或唯一约束
+
+    结果缓存在连接的info中，每个数据库连接只检查一次。
+    """
+    connection = executor if isinstance(executor, Connection) else executor.connection()
+    cache_key = ('unique_key', table.name, key)
+    if cache_key not in connection.info:
+        inspector = inspect(connection)
+        unique_columns = [index['column_names'] for index in inspector.get_indexes(table.name) if index['unique']]
+        unique_columns += [constraint['column_names'] for constraint in inspector.get_unique_constraints(table.name)]
+        unique_columns.append(inspector.get_pk_constraint(table.name)['constrained_columns'])
+        connection.info[cache_key] = [key] in unique_columns
+        if not connection.info[cache_key]:
+            logger.warning("表缺少唯一索引，批量写入退回分别插入、更新，请按DATABASE_MIGRATION.md建立索引",
+                           table=table.name, column=key)
+    return connection.info[cache_key]
+
+
+def upsert_rows(executor, table, key: str, rows: List[Dict], update_columns: Sequence[str]) -> Tuple[Dict, set]:
+    """
+    按唯一列 key 新增或更新一批行，由调用方提交事务
+
+    Args:
+        rows: 每行包含 key 及 update_columns 中的所有列，同一批内 key 不能重复
+        update_columns: 已存在时更新的列，update_time 总是更新
+
+    Returns:
+        ({key值: id}, 写入前已存在的key值集合)
+    """
+    key_column = table.c[key]
+    keys = [row[key] for row in rows]
+    existing = dict(executor.execute(select(key_column, table.c.id).where(key_column.in_(keys))).all())
+
+    now = datetime.now()
+    params = [dict(row, create_time=now, update_time=now) for row in rows]
+    update_columns = [column for column in update_columns if column != key] + ['update_time']
+    statement = _upsert_statement(executor.get_bind().dialect.name, table, key, update_columns)
+    if statement is not None and has_unique_key(executor, table, key):
+        executor.execute(statement, params)
+    else:
+        inserts = [param for param in params if param[key] not in existing]
+        updates = [
+            dict({f'_{column}': param[column] for column in update_columns}, _key=param[key])
+            for param in params if param[key] in existing
+        ]
+        if inserts:
+            executor.execute(table.insert(), inserts)
+        if updates:
+            executor.execute(
+                table.update().where(key_column == bindparam('_key'))
+                .values({column: bindparam(f'_{column}') for column in update_columns}),
+                updates,
+            )
+
+    ids = dict(executor.execute(select(key_column, table.c.id).where(key_column.in_(keys))).all())
+    return ids, set(existing)
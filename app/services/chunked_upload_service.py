@@ -0,0 +1,281 @@
+"""
+分块上传服务层 - 可断点续传的大文件上传
+
+会话和分块都暂存在上传目录下的 .sessions/<会话ID>/ 中:
+- session.json 记录文件名、大小、分块大小、可选的预期哈希
+- <序号>.part 为已收到的分块，先写入临时文件再重命名，半截的分块不会被当作已收到
+客户端可以按任意顺序、并发地PUT分块，中断后查询缺失的分块继续上传，最后完成合并。
+超过CHUNKED_UPLOAD_SESSION_TTL没有活动的会话、上传目录中遗留的合并临时文件在创建新会话时被清理。
+"""
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from flask import current_app
+from werkzeug.utils import secure_filename
+from app.models.models_13jt import File
+from app.services.upload_service import UploadService, UPLOAD_CHUNK_SIZE, create_upload_temp_file
+from app.dto.upload_dto import FileUploadResponseDTO, UploadSessionResponseDTO
+
+SESSION_DIRECTORY = '.sessions'
+_SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ChunkedUploadService(UploadService):
+    """分块上传服务类"""
+
+    def create_session(self, filename: str, file_size: int, chunk_size: Optional[int] = None,
+                       file_hash: Optional[str] = None) -> UploadSessionResponseDTO:
+        """
+        创建分块上传会话
+
+        Args:
+            filename: 原始文件名
+            file_size: 文件总字节数
+            chunk_size: 分块大小，默认CHUNKED_UPLOAD_CHUNK_SIZE
+            file_hash: 可选，客户端计算的MD5，完成时校验
+
+        Returns:
+            UploadSessionResponseDTO: 新建的会话
+        """
+        self.log_service_call("create_session", filename=filename, file_size=file_size)
+
+        if not filename or not self._allowed_file(filename):
+            raise ValueError(f"不支持的文件类型: {filename}")
+        max_size = current_app.config.get('CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024)
+        if file_size <= 0 or file_size > max_size:
+            raise ValueError(f"文件大小必须在 1 到 {max_size} bytes 之间: {file_size}")
+        chunk_size = chunk_size or current_app.config.get('CHUNKED_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+        max_chunk_size = current_app.config.get('MAX_CONTENT_LENGTH') or chunk_size
+        if chunk_size <= 0 or chunk_size > max_chunk_size:
+            raise ValueError(f"分块大小必须在 1 到 {max_chunk_size} bytes 之间: {chunk_size}")
+        if file_hash is not None and not re.fullmatch(r'[0-9a-fA-F]{32}', file_hash):
+            raise ValueError(f"文件哈希必须为32位MD5: {file_hash}")
+
+        self.cleanup_expired_sessions()
+
+        session_id = uuid.uuid4().hex
+        session = {
+            'session_id': session_id,
+            'filename': filename,
+            'file_size': file_size,
+            'chunk_size': chunk_size,
+            'total_chunks': (file_size + chunk_size - 1) // chunk_size,
+            'hash': file_hash.lower() if file_hash else None,
+        }
+        session_dir = self._get_session_directory(session_id)
+        os.makedirs(session_dir)
+        with open(os.path.join(session_dir, 'session.json'), 'w', encoding='utf-8') as f:
+            json.dump(session, f, ensure_ascii=False)
+
+        result = self._create_session_response(session, [])
+        self.log_service_result("create_session", result, session_id=session_id)
+        return result
+
+    def get_session(self, session_id: str) -> UploadSessionResponseDTO:
+        """查询会话状态及缺失的分块"""
+        self.log_service_call("get_session", session_id=session_id)
+        session = self._load_session(session_id)
+        return self._create_session_response(session, self._get_received_chunks(session_id))
+
+    def write_chunk(self, session_id: str, index: int, stream) -> UploadSessionResponseDTO:
+        """
+        写入一个分块
+
+        按块读取请求体并写入临时文件，大小必须与该分块应有的大小一致；
+        重复上传同一分块会覆盖之前的内容。
+
+        Args:
+            session_id: 会话ID
+            index: 分块序号，从0开始
+            stream: 请求体流
+        """
+        self.log_service_call("write_chunk", session_id=session_id, index=index)
+        session = self._load_session(session_id)
+        if index < 0 or index >= session['total_chunks']:
+            raise ValueError(f"分块序号超出范围: {index} (共 {session['total_chunks']} 块)")
+
+        expected_size = min(session['chunk_size'], session['file_size'] - index * session['chunk_size'])
+        session_dir = self._get_session_directory(session_id)
+        fd, temp_path = tempfile.mkstemp(prefix=f'{index}.', suffix='.tmp', dir=session_dir)
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+                    size += len(chunk)
+                    if size > expected_size:
+                        break
+                    out.write(chunk)
+            if size != expected_size:
+                raise ValueError(f"分块 {index} 大小应为 {expected_size} bytes，实际收到 {size} bytes")
+            os.replace(temp_path, self._get_chunk_path(session_id, index))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        # 更新会话目录的修改时间，作为最后活动时间
+        os.utime(session_dir)
+        return self._create_session_response(session, self._get_received_chunks(session_id))
+
+    def complete_session(self, session_id: str) -> FileUploadResponseDTO:
+        """
+        按顺序合并所有分块，校验哈希并按File.hash去重后保存
+
+        合并时一边写入一边计算MD5，合并后的文件以内容寻址的文件名原子地重命名到上传目录。
+        """
+        self.log_service_call("complete_session", session_id=session_id)
+        session = self._load_session(session_id)
+        missing = self._get_missing_chunks(session, self._get_received_chunks(session_id))
+        if missing:
+            raise ValueError(f"还有 {len(missing)} 个分块未上传: {missing[:20]}")
+
+        upload_dir = self._get_upload_directory()
+        fd, temp_path = create_upload_temp_file(upload_dir)
+        hash_md5 = hashlib.md5()
+        file_size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for index in range(session['total_chunks']):
+                    with open(self._get_chunk_path(session_id, index), 'rb') as chunk_file:
+                        for chunk in iter(lambda: chunk_file.read(UPLOAD_CHUNK_SIZE), b""):
+                            hash_md5.update(chunk)
+                            out.write(chunk)
+                            file_size += len(chunk)
+            file_hash = hash_md5.hexdigest()
+
+            if session['hash'] and session['hash'] != file_hash:
+                raise ValueError(f"文件哈希不一致: 预期 {session['hash']}，实际 {file_hash}")
+
+            existing_file = File.query.filter_by(hash=file_hash).first()
+            if existing_file:
+                raise ValueError(f"文件已存在，文件ID: {existing_file.id}, 文件名: {existing_file.filename}")
+
+            file_extension = self._get_file_extension(secure_filename(session['filename']))
+            file_path = os.path.join(upload_dir, f"{file_hash}{file_extension}")
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        try:
+            db_file = File(
+                hash=file_hash,
+                filename=session['filename'],
+                filesize=file_size,
+                filetype=file_extension.lstrip('.')
+            )
+            self.db.session.add(db_file)
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            self.log_error(e, {"method": "complete_session", "session_id": session_id})
+            raise
+
+        shutil.rmtree(self._get_session_directory(session_id), ignore_errors=True)
+        result = self._create_upload_response(db_file, secure_filename(session['filename']))
+        self.log_service_result("complete_session", result, session_id=session_id, file_id=db_file.id)
+        return result
+
+    def abort_session(self, session_id: str) -> None:
+        """取消会话并删除已上传的分块"""
+        self.log_service_call("abort_session", session_id=session_id)
+        self._load_session(session_id)
+        shutil.rmtree(self._get_session_directory(session_id), ignore_errors=True)
+
+    def cleanup_expired_sessions(self, ttl: Optional[int] = None) -> int:
+        """
+        删除超过ttl秒没有活动的会话，以及合并或保存中途进程退出时遗留在上传目录中的 .upload-*.part 临时文件
+
+        Returns:
+            int: 删除的会话数
+        """
+        if ttl is None:
+            ttl = current_app.config.get('CHUNKED_UPLOAD_SESSION_TTL', 24 * 3600)
+        upload_dir = self._get_upload_directory()
+        deadline = time.time() - ttl
+        self._cleanup_stale_temp_files(upload_dir, deadline)
+
+        sessions_root = os.path.join(upload_dir, SESSION_DIRECTORY)
+        if not os.path.isdir(sessions_root):
+            return 0
+
+        removed = 0
+        for name in os.listdir(sessions_root):
+            session_dir = os.path.join(sessions_root, name)
+            try:
+                if os.path.getmtime(session_dir) < deadline:
+                    shutil.rmtree(session_dir, ignore_errors=True)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            self.logger.info("Expired upload sessions removed", count=removed)
+        return removed
+
+    def _cleanup_stale_temp_files(self, upload_dir: str, deadline: float) -> int:
+        """删除修改时间早于deadline的 .upload-*.part 临时文件，正在写入的临时文件修改时间是最新的，不会被删除"""
+        if not os.path.isdir(upload_dir):
+            return 0
+        removed = 0
+        for name in os.listdir(upload_dir):
+            if not (name.startswith('.upload-') and name.endswith('.part')):
+                continue
+            try:
+                path = os.path.join(upload_dir, name)
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            self.logger.info("Stale upload temp files removed", count=removed)
+        return removed
+
+    def _get_session_directory(self, session_id: str) -> str:
+        if not _SESSION_ID_PATTERN.match(session_id):
+            raise FileNotFoundError(f"上传会话 {session_id} 不存在")
+        return os.path.join(self._get_upload_directory(), SESSION_DIRECTORY, session_id)
+
+    def _get_chunk_path(self, session_id: str, index: int) -> str:
+        return os.path.join(self._get_session_directory(session_id), f"{index}.part")
+
+    def _load_session(self, session_id: str) -> Dict[str, Any]:
+        session_file = os.path.join(self._get_session_directory(session_id), 'session.json')
+        try:
+            with open(session_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            self.log_not_found("UploadSession", session_id)
+            raise FileNotFoundError(f"上传会话 {session_id} 不存在")
+
+    def _get_received_chunks(self, session_id: str) -> List[int]:
+        return sorted(
+            int(name[:-len('.part')]) for name in os.listdir(self._get_session_directory(session_id))
+            if name.endswith('.part') and name[:-len('.part')].isdigit()
+        )
+
+    def _get_missing_chunks(self, session: Dict[str, Any], received: List[int]) -> List[int]:
+        return sorted(set(range(session['total_chunks'])) - set(received))
+
+    def _create_session_response(self, session: Dict[str, Any], received: List[int]) -> UploadSessionResponseDTO:
+        session_dir = self._get_session_directory(session['session_id'])
+        ttl = current_app.config.get('CHUNKED_UPLOAD_SESSION_TTL', 24 * 3600)
+        return UploadSessionResponseDTO(
+            session_id=session['session_id'],
+            filename=session['filename'],
+            file_size=session['file_size'],
+            chunk_size=session['chunk_size'],
+            total_chunks=session['total_chunks'],
+            received_chunks=len(received),
+            missing_chunks=self._get_missing_chunks(session, received),
+            hash=session['hash'],
+            expires_at=datetime.fromtimestamp(os.path.getmtime(session_dir)) + timedelta(seconds=ttl)
+        )
@@ -0,0 +1,198 @@
+"""
+RcjMCClassifyBig 宽表的列投影
+
+RcjMCClassifyBig 有950个 sx_0001..sx_0950 属性列，每条记录只填写其二级分类拥有的几个属性。
+整行加载为ORM对象再用getattr读取少数几列，绝大部分时间和内存都花在用不到的列上。
+ClassifyProjection 按二级分类的属性ID只选择需要的列，查询结果为轻量的Row元组。
+
+属性值也可以稀疏存储在 RcjMCClassifySx (classify_id, sx_id, value) 中（CLASSIFY_SX_STORAGE=sparse），
+此时投影不选择sx_列，由 load_sx_values 按分类ID批量读取，返回的字典与宽表读取一致。
+宽表中已有的数据用 backfill_sx_values（python manage.py migrate-classify-sx）复制到稀疏表；
+sparse模式下通过ORM新增、修改sx_列或删除分类记录时，在flush后同一事务中同步稀疏表。
+wide模式下没有读取方，不做同步，因此切换为sparse时应在停止写入后执行迁移。
+绕过ORM直接写宽表的程序需自行调用 sync_sx_values，或重新执行 migrate-classify-sx。
+"""
+from datetime import datetime
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, delete, func, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from app.models.RcjMCClassifyBig import RcjMCClassifyBig, RcjMCClassifySx
+
+# 属性值存储方式: wide - RcjMCClassifyBig的sx_列，sparse - RcjMCClassifySx
+SX_STORAGE_MODES = ('wide', 'sparse')
+
+# get_m3 返回的基础列
+M3_BASE_COLUMNS = (
+    'id', 'original_rcjmc', 'rcjdw', 'rcjdj', 'bjsj', 'cleaned_rcjmc', 'parsed_rcjmc',
+    'ejflid', 'yjflid', 'yjflmc', 'ejflmc', 'sjjhflid', 'sjjhflmc', 'sjjhflzt'
+)
+
+_SX_COLUMNS = [column for column in RcjMCClassifyBig.__table__.c if column.name.startswith('sx_')]
+_SX_KEYS = frozenset(column.key for column in _SX_COLUMNS)
+_PENDING_KEY = 'classify_sx_pending'
+
+
+def sx_column_name(sx_id: str) -> str:
+    """属性ID对应的列名，如 '1' -> 'sx_0001'"""
+    return f'sx_{sx_id:0>4}'
+
+
+class ClassifyProjection:
+    """
+    RcjMCClassifyBig 的基础列 + 指定属性列
+
+    查询的列顺序为: 调用方附加的前置列, 基础列, 属性列；
+    表中不存在对应列的属性不参与查询，读取时值为None。
+    """
+
+    def __init__(self, sx_ids: Iterable[str], base_columns: Sequence[str] = M3_BASE_COLUMNS):
+        table = RcjMCClassifyBig.__table__
+        self.base_column_names = tuple(base_columns)
+        self.base_columns = [table.c[name] for name in self.base_column_names]
+        self.sx_ids = list(sx_ids)
+        self.sx_columns = [(sx_id, table.c.get(sx_column_name(sx_id))) for sx_id in self.sx_ids]
+        self.selected_sx_columns = [column for _, column in self.sx_columns if column is not None]
+
+    @property
+    def columns(self) -> List:
+        return self.base_columns + self.selected_sx_columns
+
+    def select(self, *leading_columns) -> Select:
+        """构建只选择投影列的查询，可在前面附加其他表的列（需自行join）"""
+        return select(*leading_columns, *self.columns)
+
+    def base_values(self, row, offset: int = 0) -> Dict[str, object]:
+        """从查询结果行中取出基础列 {列名: 值}，offset为前置列的个数"""
+        return dict(zip(self.base_column_names, row[offset:offset + len(self.base_columns)]))
+
+    def sx_values(self, row) -> Dict[str, Optional[str]]:
+        """从查询结果行末尾取出属性值 {属性ID: 值}，按属性ID的顺序"""
+        values = iter(row[len(row) - len(self.selected_sx_columns):])
+        return {sx_id: next(values) if column is not None else None for sx_id, column in self.sx_columns}
+
+
+def classify_data_signature(executor, ejflid: str) -> Tuple[int, Optional[int], Optional[datetime]]:
+    """
+    二级分类下分类记录的变化标识 (记录数, 最大ID, 最近更新时间)
+
+    新增、删除或通过ORM修改记录都会改变其中至少一项，用作按二级分类缓存的派生数据（导出文件、统计结果）的版本。
+    """
+    return tuple(executor.execute(
+        select(func.count(), func.max(RcjMCClassifyBig.id), func.max(RcjMCClassifyBig.update_time))
+        .where(RcjMCClassifyBig.ejflid == ejflid)
+    ).one())
+
+
+def load_sx_values(executor, classify_ids: Iterable[int], sx_ids: Iterable[str],
+                   chunk_size: int = 500) -> Dict[int, Dict[str, Optional[str]]]:
+    """
+    从稀疏存储读取属性值
+
+    Returns:
+        Dict[int, Dict[str, Optional[str]]]: {分类ID: {属性ID: 值}}，
+        每个分类都包含全部sx_ids（按给定顺序），没有值的属性为None，与 ClassifyProjection.sx_values 一致
+    """
+    sx_ids = list(sx_ids)
+    classify_ids = list(dict.fromkeys(classify_ids))
+    result = {classify_id: dict.fromkeys(sx_ids) for classify_id in classify_ids}
+    # 稀疏表中的sx_id是列名后缀，映射回调用方使用的属性ID
+    keys = {sx_column_name(sx_id)[len('sx_'):]: sx_id for sx_id in sx_ids}
+    if not keys:
+        return result
+
+    table = RcjMCClassifySx.__table__
+    for start in range(0, len(classify_ids), chunk_size):
+        rows = executor.execute(
+            select(table.c.classify_id, table.c.sx_id, table.c.value).where(
+                table.c.classify_id.in_(classify_ids[start:start + chunk_size]),
+                table.c.sx_id.in_(list(keys))
+            )
+        )
+        for classify_id, sx_id, value in rows:
+            result[classify_id][keys[sx_id]] = value
+    return result
+
+
+def sync_sx_values(executor, classify_ids: Sequence[int]) -> int:
+    """
+    按宽表的当前值重写这些分类在RcjMCClassifySx中的属性值，宽表中已不存在的分类只删除旧值
+
+    在调用方的事务中执行。
+
+    Returns:
+        int: 写入的属性值行数
+    """
+    classify = RcjMCClassifyBig.__table__
+    sx_table = RcjMCClassifySx.__table__
+    rows = executor.execute(select(classify.c.id, *_SX_COLUMNS).where(classify.c.id.in_(classify_ids))).all()
+    values = [
+        {'classify_id': row[0], 'sx_id': column.name[len('sx_'):], 'value': value}
+        for row in rows
+        for column, value in zip(_SX_COLUMNS, row[1:])
+        if value is not None
+    ]
+    executor.execute(delete(sx_table).where(sx_table.c.classify_id.in_(classify_ids)))
+    if values:
+        executor.execute(sx_table.insert(), values)
+    return len(values)
+
+
+def backfill_sx_values(executor, batch_size: int = 1000, progress_callback=None) -> int:
+    """
+    把RcjMCClassifyBig中非空的sx_列复制到RcjMCClassifySx
+
+    按ID分批读取，每批先删除这些分类在稀疏表中的旧值再写入，可以重复执行。
+    由调用方提交事务。
+
+    Returns:
+        int: 写入的属性值行数
+    """
+    classify = RcjMCClassifyBig.__table__
+    last_id = 0
+    written = 0
+    while True:
+        ids = executor.execute(
+            select(classify.c.id)
+            .where(classify.c.id > last_id)
+            .order_by(classify.c.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return written
+
+        written += sync_sx_values(executor, ids)
+        last_id = ids[-1]
+        if progress_callback:
+            progress_callback(last_id, written)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_changed_classifies(session, flush_context, instances):
+    """flush前记录新增、删除或sx_列被修改的分类记录（新记录此时还没有ID，保存对象本身）"""
+    if not has_app_context() or current_app.config.get('CLASSIFY_SX_STORAGE', 'wide') != 'sparse':
+        return
+    changed = [
+        obj for obj in chain(session.new, session.dirty, session.deleted)
+        if isinstance(obj, RcjMCClassifyBig)
+        and (obj in session.new or obj in session.deleted or _SX_KEYS - inspect(obj).unmodified)
+    ]
+    if changed:
+        session.info.setdefault(_PENDING_KEY, []).extend(changed)
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_changed_classifies(session, flush_context):
+    """flush后在同一事务中同步稀疏表"""
+    changed = session.info.pop(_PENDING_KEY, None)
+    if not changed:
+        return
+    # 新记录此时已写入但还没有identity，直接读取已加载的ID，不触发加载
+    classify_ids = sorted({inspect(obj).dict.get('id') for obj in changed} - {None})
+    connection = session.connection()
+    for start in range(0, len(classify_ids), 500):
+        sync_sx_values(connection, classify_ids[start:start + 500])
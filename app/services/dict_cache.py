@@ -0,0 +1,221 @@
+"""
+字典表进程内缓存
+
+单位类别、单位、二级分类属性、一级分类、二级分类这几张字典表很小、很少修改，但几乎每个请求都要读取
+（如M3查询每次都要取二级分类的属性ID）。DictCache 把它们一次读入一个不可变的快照 DictSnapshot：
+按ID、按名称的索引，以及二级分类到属性、单位的列表，读取方直接在内存中查找。
+
+快照以 dict_version 中相关字典的版本号判断是否过期：DictService 修改字典后递增版本号，下次读取时重新构建；
+版本号保存在Redis中时多个进程互相可见。直接修改数据库（不经过DictService）不会递增版本号，
+因此快照最长保留 DICT_CACHE_TTL 秒，0表示不缓存。
+"""
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.models.dict import (
+    DwType, Dw, RcjEjflSx, RcjYjfl, RcjEjfl, ejfl_dw_association, ejfl_sx_association
+)
+from app.services import dict_version
+
+# 快照依赖的字典，任一版本号变化都会重新构建
+SNAPSHOT_DICTS = (dict_version.UNIT, dict_version.EJFL_SX, dict_version.CLASSIFICATION)
+
+
+@dataclass(frozen=True)
+class DwTypeEntry:
+    id: str
+    typeName: Optional[str]
+
+
+@dataclass(frozen=True)
+class DwEntry:
+    id: str
+    type_id: Optional[str]
+    dw: Optional[str]
+
+
+@dataclass(frozen=True)
+class RcjEjflSxEntry:
+    id: str
+    sx: Optional[str]
+
+
+@dataclass(frozen=True)
+class RcjYjflEntry:
+    id: str
+    yjflmc: Optional[str]
+    yjflms: Optional[str]
+
+
+@dataclass(frozen=True)
+class RcjEjflEntry:
+    """二级分类，sxids/dwids 按ID排序，与 RcjEjfl.sxids/dwids 用法相同"""
+    id: str
+    yjfl_id: Optional[str]
+    ejflmc: Optional[str]
+    ejflms: Optional[str]
+    sxids: Tuple[str, ...]
+    dwids: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class DictSnapshot:
+    """某一版本的字典数据，所有映射均为只读"""
+    version: Tuple[int, ...]
+    loaded_at: float
+    dw_types: Mapping[str, DwTypeEntry]
+    dws: Mapping[str, DwEntry]
+    sxs: Mapping[str, RcjEjflSxEntry]
+    yjfls: Mapping[str, RcjYjflEntry]
+    ejfls: Mapping[str, RcjEjflEntry]
+    dw_types_by_name: Mapping[str, DwTypeEntry]
+    dws_by_name: Mapping[str, DwEntry]
+    sxs_by_name: Mapping[str, RcjEjflSxEntry]
+    yjfls_by_name: Mapping[str, RcjYjflEntry]
+    # 二级分类名称不唯一，同名的按ID排序
+    ejfls_by_name: Mapping[str, Tuple[RcjEjflEntry, ...]]
+    ejfl_sxs: Mapping[str, Tuple[RcjEjflSxEntry, ...]]
+    ejfl_dws: Mapping[str, Tuple[DwEntry, ...]]
+
+    def sizes(self) -> Dict[str, int]:
+        return {
+            'dw_types': len(self.dw_types),
+            'dws': len(self.dws),
+            'sxs': len(self.sxs),
+            'yjfls': len(self.yjfls),
+            'ejfls': len(self.ejfls),
+        }
+
+
+def _by_id(entries) -> Mapping:
+    return MappingProxyType({entry.id: entry for entry in entries})
+
+
+def _by_name(entries, attribute: str) -> Mapping:
+    return MappingProxyType({
+        getattr(entry, attribute): entry for entry in entries if getattr(entry, attribute) is not None
+    })
+
+
+def _links(executor, table, column) -> Dict[str, Tuple[str, ...]]:
+    links = {}
+    for ejfl_id, target_id in executor.execute(
+        select(table.c.ejfl_id, column).where(column.isnot(None)).order_by(table.c.ejfl_id, column)
+    ):
+        if not links.get(ejfl_id) or links[ejfl_id][-1] != target_id:
+            links.setdefault(ejfl_id, []).append(target_id)
+    return {ejfl_id: tuple(ids) for ejfl_id, ids in links.items()}
+
+
+def build_snapshot(executor, version: Tuple[int, ...] = ()) -> DictSnapshot:
+    """用7条查询读取全部字典表，构建快照"""
+    dw_types = [DwTypeEntry(*row) for row in executor.execute(
+        select(DwType.id, DwType.typeName).order_by(DwType.id))]
+    dws = [DwEntry(*row) for row in executor.execute(
+        select(Dw.id, Dw.type_id, Dw.dw).order_by(Dw.id))]
+    sxs = [RcjEjflSxEntry(*row) for row in executor.execute(
+        select(RcjEjflSx.id, RcjEjflSx.sx).order_by(RcjEjflSx.id))]
+    yjfls = [RcjYjflEntry(*row) for row in executor.execute(
+        select(RcjYjfl.id, RcjYjfl.yjflmc, RcjYjfl.yjflms).order_by(RcjYjfl.id))]
+    sx_links = _links(executor, ejfl_sx_association, ejfl_sx_association.c.sxid)
+    dw_links = _links(executor, ejfl_dw_association, ejfl_dw_association.c.dwid)
+    ejfls = [
+        RcjEjflEntry(*row, sxids=sx_links.get(row[0], ()), dwids=dw_links.get(row[0], ()))
+        for row in executor.execute(
+            select(RcjEjfl.id, RcjEjfl.yjfl_id, RcjEjfl.ejflmc, RcjEjfl.ejflms).order_by(RcjEjfl.id))
+    ]
+
+    sxs_by_id = _by_id(sxs)
+    dws_by_id = _by_id(dws)
+    ejfls_by_name = {}
+    for ejfl in ejfls:
+        if ejfl.ejflmc is not None:
+            ejfls_by_name.setdefault(ejfl.ejflmc, []).append(ejfl)
+    return DictSnapshot(
+        version=version,
+        loaded_at=time.time(),
+        dw_types=_by_id(dw_types),
+        dws=dws_by_id,
+        sxs=sxs_by_id,
+        yjfls=_by_id(yjfls),
+        ejfls=_by_id(ejfls),
+        dw_types_by_name=_by_name(dw_types, 'typeName'),
+        dws_by_name=_by_name(dws, 'dw'),
+        sxs_by_name=_by_name(sxs, 'sx'),
+        yjfls_by_name=_by_name(yjfls, 'yjflmc'),
+        ejfls_by_name=MappingProxyType({name: tuple(items) for name, items in ejfls_by_name.items()}),
+        ejfl_sxs=MappingProxyType({
+            ejfl.id: tuple(sxs_by_id[sx_id] for sx_id in ejfl.sxids if sx_id in sxs_by_id) for ejfl in ejfls
+        }),
+        ejfl_dws=MappingProxyType({
+            ejfl.id: tuple(dws_by_id[dw_id] for dw_id in ejfl.dwids if dw_id in dws_by_id) for ejfl in ejfls
+        }),
+    )
+
+
+class DictCache:
+    """一个应用实例的字典快照及命中统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[DictSnapshot] = None
+        self._expires_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def get_snapshot(self) -> DictSnapshot:
+        """返回当前版本的快照，版本号变化或超过DICT_CACHE_TTL时重新构建"""
+        version = dict_version.get_dict_versions(SNAPSHOT_DICTS)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version and time.monotonic() < self._expires_at:
+            with self._lock:
+                self.hits += 1
+            return snapshot
+
+        # 同时过期的请求只有一个去重新构建，其余等待后直接使用新快照
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == version and time.monotonic() < self._expires_at:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            snapshot = build_snapshot(db.session, version)
+            ttl = current_app.config.get('DICT_CACHE_TTL', 60)
+            if ttl > 0:
+                self._snapshot = snapshot
+                self._expires_at = time.monotonic() + ttl
+            return snapshot
+
+    def invalidate(self):
+        """丢弃当前快照，下次读取时重新构建"""
+        with self._lock:
+            self._snapshot = None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None,
+            'version': list(snapshot.version) if snapshot else None,
+            'loaded_at': snapshot.loaded_at if snapshot else None,
+            'sizes': snapshot.sizes() if snapshot else None,
+        }
+
+
+def get_dict_cache() -> DictCache:
+    """当前应用实例的字典缓存"""
+    return current_app.extensions.setdefault('dict_cache', DictCache())
+
+
+def get_dict_snapshot() -> DictSnapshot:
+    """当前版本的字典快照"""
+    return get_dict_cache().get_snapshot()
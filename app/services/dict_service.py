@@ -2,8 +2,11 @@
 字典管理服务层
 负责业务逻辑处理和数据模型与DTO之间的转换
 """
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Iterable, Tuple
 from datetime import datetime
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, selectinload
 from app import db
 from app.models.dict import (
     DwType, Dw, RcjEjflSx, RcjYjfl, RcjEjfl, 
@@ -23,11 +26,28 @@ from app.dto.dict import (
     # 人材机名称映射 DTO
     RcjMC2EjflidRequestDTO, RcjMC2EjflidUpdateRequestDTO, RcjMC2EjflidResponseDTO, RcjMC2EjflidInternalDTO,
     # 人材机名称分类 DTO
-    RcjMCClassifyRequestDTO, RcjMCClassifyUpdateRequestDTO, RcjMCClassifyResponseDTO, RcjMCClassifyInternalDTO
+    RcjMCClassifyRequestDTO, RcjMCClassifyUpdateRequestDTO, RcjMCClassifyResponseDTO, RcjMCClassifyInternalDTO,
+    # 批量导入 DTO
+    BulkUpsertResponseDTO
 )
 from app.dto.common import PaginatedResponse, PaginationMeta
 from app.utils.response_builder import ResponseBuilder
 from app.services.base_service import BaseService
+from app.services import dict_version
+from app.services.dict_cache import get_dict_cache, get_dict_snapshot
+from app.services.bulk_upsert import upsert_rows
+from app.services.name_index import lookup_names
+from app.services.name_search import get_name_search_index
+
+# 各查询接口需要的关联加载方式：多对一用joinedload随主查询一起取回，
+# 多对多用selectinload按本页主键一次取回，每页的SQL语句数与记录数无关。
+# 详情用filter_by().first()而不是get()：get()命中会话中已过期的对象时只刷新本行，不应用加载选项
+DW_LOAD_OPTIONS = (joinedload(Dw.type),)
+RCJ_EJFL_LOAD_OPTIONS = (
+    joinedload(RcjEjfl.yjfl),
+    selectinload(RcjEjfl._sxs),
+    selectinload(RcjEjfl._dws),
+)
 
 
 class DictService(BaseService):
@@ -111,6 +131,7 @@ class DictService(BaseService):
             
             db.session.add(dw_type)
             db.session.commit()
+            dict_version.bump_dict_version(dict_version.UNIT)
             
             # 记录数据库操作
             self.log_database_operation("CREATE", "DwType", dto.id)
@@ -150,6 +171,7 @@ class DictService(BaseService):
                 dw_type.typeName = dto.typeName
             
             db.session.commit()
+            dict_version.bump_dict_version(dict_version.UNIT)
             
             # 记录数据库操作
             self.log_database_operation("UPDATE", "DwType", type_id)
@@ -181,6 +203,7 @@ class DictService(BaseService):
             
             db.session.delete(dw_type)
             db.session.commit()
+            dict_version.bump_dict_version(dict_version.UNIT)
             
             # 记录数据库操作
             self.log_database_operation("DELETE", "DwType", type_id)
@@ -199,7 +222,7 @@ class DictService(BaseService):
         self.log_service_call("get_dws", page=page, per_page=per_page, type_id=type_id)
         
         try:
-            query = Dw.query
+            query = Dw.query.options(*DW_LOAD_OPTIONS)
             
             if type_id:
                 query = query.filter_by(type_id=type_id)
@@ -244,7 +267,7 @@ class DictService(BaseService):
         self.log_service_call("get_dw_by_id", dw_id=dw_id)
         
         try:
-            dw = Dw.query.get(dw_id)
+            dw = Dw.query.options(*DW_LOAD_OPTIONS).filter_by(id=dw_id).first()
             if not dw:
                 return None
             
@@ -296,6 +319,7 @@ class DictService(BaseService):
             
             db.session.add(dw)
             db.session.commit()
+            dict_version.bump_dict_version(dict_version.UNIT)
             
             # 返回响应DTO
             return DwResponseDTO(
@@ -333,6 +357,7 @@ class DictService(BaseService):
                 dw.dw = dto.dw
             
             db.session.commit()
+            dict_version.bump_dict_version(dict_version.UNIT)
             
             # 返回响应DTO
             return DwResponseDTO(
@@ -357,6 +382,7 @@ class DictService(BaseService):
             
             db.session.delete(dw)
             db.session.commit()
+            dict_version.bump_dict_version(dict_version.UNIT)
             return True
         except Exception as e:
             self.log_error(e, {"method": "delete_dw", "dw_id": dw_id})
@@ -430,6 +456,7 @@ class DictService(BaseService):
         
         db.session.add(sx)
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.EJFL_SX)
         
         # 返回响应DTO
         return RcjEjflSxResponseDTO(
@@ -454,6 +481,7 @@ class DictService(BaseService):
             sx.sx = dto.sx
         
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.EJFL_SX)
         
         # 返回响应DTO
         return RcjEjflSxResponseDTO(
@@ -471,6 +499,7 @@ class DictService(BaseService):
         
         db.session.delete(sx)
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.EJFL_SX)
         return True
     
     # ==================== 人材机一级分类服务 ====================
@@ -529,6 +558,7 @@ class DictService(BaseService):
         
         db.session.add(yjfl)
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.CLASSIFICATION)
         
         # 返回响应DTO
         return RcjYjflResponseDTO(
@@ -557,6 +587,7 @@ class DictService(BaseService):
             yjfl.yjflms = dto.yjflms
         
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.CLASSIFICATION)
         
         # 返回响应DTO
         return RcjYjflResponseDTO(
@@ -575,13 +606,14 @@ class DictService(BaseService):
         
         db.session.delete(yjfl)
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.CLASSIFICATION)
         return True
     
     # ==================== 人材机二级分类服务 ====================
     
     def get_rcj_ejfls(self, page: int = 1, per_page: int = 10, yjfl_id: Optional[str] = None) -> PaginatedResponse[RcjEjflResponseDTO]:
         """获取人材机二级分类列表"""
-        query = RcjEjfl.query
+        query = RcjEjfl.query.options(*RCJ_EJFL_LOAD_OPTIONS)
         
         if yjfl_id:
             query = query.filter_by(yjfl_id=yjfl_id)
@@ -625,7 +657,7 @@ class DictService(BaseService):
     
     def get_rcj_ejfl_by_id(self, ejfl_id: str) -> Optional[RcjEjflResponseDTO]:
         """根据ID获取人材机二级分类"""
-        ejfl = RcjEjfl.query.get(ejfl_id)
+        ejfl = RcjEjfl.query.options(*RCJ_EJFL_LOAD_OPTIONS).filter_by(id=ejfl_id).first()
         if not ejfl:
             return None
         
@@ -689,6 +721,7 @@ class DictService(BaseService):
         
         db.session.add(ejfl)
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.CLASSIFICATION)
         
         # 将 _AssociationList 转换为普通列表
         sxs_list = list(ejfl.sxs) if ejfl.sxs else []
@@ -739,6 +772,7 @@ class DictService(BaseService):
             ejfl._dws = dws
         
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.CLASSIFICATION)
         
         # 将 _AssociationList 转换为普通列表
         sxs_list = list(ejfl.sxs) if ejfl.sxs else []
@@ -764,6 +798,7 @@ class DictService(BaseService):
         
         db.session.delete(ejfl)
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.CLASSIFICATION)
         return True
     
     # ==================== 人材机名称映射服务 ====================
@@ -826,6 +861,7 @@ class DictService(BaseService):
         
         db.session.add(mapping)
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.NAME_MAPPING)
         
         # 返回响应DTO
         return RcjMC2EjflidResponseDTO(
@@ -857,6 +893,7 @@ class DictService(BaseService):
             mapping.orignal_rcjmc = dto.orignal_rcjmc
         
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.NAME_MAPPING)
         
         # 返回响应DTO
         return RcjMC2EjflidResponseDTO(
@@ -875,6 +912,7 @@ class DictService(BaseService):
         
         db.session.delete(mapping)
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.NAME_MAPPING)
         return True
     
     # ==================== 人材机名称分类服务 ====================
@@ -953,6 +991,7 @@ class DictService(BaseService):
         
         db.session.add(classify)
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.NAME_MAPPING)
         
         # 返回响应DTO
         return RcjMCClassifyResponseDTO(
@@ -999,6 +1038,7 @@ class DictService(BaseService):
             classify.ejflmc = dto.ejflmc
         
         db.session.commit()
+        dict_version.bump_dict_version(dict_version.NAME_MAPPING)
         
         # 返回响应DTO
         return RcjMCClassifyResponseDTO(
@@ -1020,4 +1060,166 @@ class DictService(BaseService):
         
         db.session.delete(classify)
         db.session.commit()
-        return True 
\ No newline at end of file
+        dict_version.bump_dict_version(dict_version.NAME_MAPPING)
+        return True
+    
+    # ==================== 名称查找 ====================
+    
+    def lookup_rcj_mc_ejflids(self, names: List[Optional[str]]) -> List[Dict[str, Any]]:
+        """
+        按人材机名称批量查找二级分类
+        
+        在进程内的名称索引中先按原样、再按归一后的名称查找，见 name_index；
+        结果与names一一对应，找不到的名称 ejflid 为None。
+        """
+        self.log_service_call("lookup_rcj_mc_ejflids", count=len(names))
+        results = lookup_names(names, get_dict_snapshot().ejfls)
+        self.log_service_result("lookup_rcj_mc_ejflids", results, count=len(results),
+                                matched=sum(1 for item in results if item['ejflid']))
+        return results
+    
+    def search_rcj_mc_names(self, query: str, k: int = 10) -> List[Dict[str, Any]]:
+        """
+        按字符二元组模糊搜索名称映射和名称分类中的名称，返回得分最高的k个候选
+        
+        Returns:
+            [{name, source, id, ejflid, ejflmc, score}]，按得分从高到低排列
+        """
+        self.log_service_call("search_rcj_mc_names", query=query, k=k)
+        results = get_name_search_index().search(
+            query, k, current_app.config.get('DICT_SEARCH_MAX_CANDIDATES', 5000)
+        )
+        ejfls = get_dict_snapshot().ejfls
+        for item in results:
+            ejfl = ejfls.get(item['ejflid']) if item['ejflid'] else None
+            item['ejflmc'] = ejfl.ejflmc if ejfl is not None else None
+        self.log_service_result("search_rcj_mc_names", results, count=len(results))
+        return results
+    
+    # ==================== 批量导入 ====================
+    
+    def bulk_upsert_rcj_mc2ejflids(self, rows: Iterable[Any]) -> BulkUpsertResponseDTO:
+        """
+        批量新增或更新人材机名称映射，orignal_rcjmc 已存在时更新其二级分类
+        
+        Args:
+            rows: 每项为 RcjMC2EjflidRequestDTO 字段组成的字典，可以是边读取边生成的迭代器
+        """
+        ejfls = get_dict_snapshot().ejfls
+        
+        def validate(values):
+            if values['ejflid'] not in ejfls:
+                return "指定的二级分类ID不存在"
+            return None
+        
+        return self._bulk_upsert(RcjMC2Ejflid, RcjMC2EjflidRequestDTO, 'orignal_rcjmc', validate, rows)
+    
+    def bulk_upsert_rcj_mc_classifies(self, rows: Iterable[Any]) -> BulkUpsertResponseDTO:
+        """
+        批量新增或更新人材机名称分类，cleaned_rcj_original_mc 已存在时整行更新（未提供的字段置空）
+        
+        Args:
+            rows: 每项为 RcjMCClassifyRequestDTO 字段组成的字典，可以是边读取边生成的迭代器
+        """
+        snapshot = get_dict_snapshot()
+        
+        def validate(values):
+            if values['yjflid'] and values['yjflid'] not in snapshot.yjfls:
+                return "指定的一级分类ID不存在"
+            if values['ejflid'] and values['ejflid'] not in snapshot.ejfls:
+                return "指定的二级分类ID不存在"
+            return None
+        
+        return self._bulk_upsert(RcjMCClassify, RcjMCClassifyRequestDTO, 'cleaned_rcj_original_mc', validate, rows)
+    
+    def _bulk_upsert(self, model, dto_class, key: str, validate: Callable[[Dict[str, Any]], Optional[str]],
+                     rows: Iterable[Any]) -> BulkUpsertResponseDTO:
+        """
+        逐条校验后按DICT_BULK_CHUNK_SIZE分批upsert，每批提交一次
+        
+        外键在内存中的字典快照里检查，不逐条查询；同一请求中唯一名称重复的记录以第一条为准，其余报错。
+        某一批写入失败时回滚该批并把其中的记录标记为错误，继续处理后续记录。
+        """
+        self.log_service_call("bulk_upsert", table=model.__tablename__)
+        table = model.__table__
+        chunk_size = current_app.config.get('DICT_BULK_CHUNK_SIZE', 1000)
+        result = BulkUpsertResponseDTO()
+        seen = {}
+        chunk = []
+        for index, row in enumerate(rows):
+            item = {'index': index, 'status': 'error', 'id': None, 'error': None}
+            result.results.append(item)
+            values, error = self._bulk_row_values(table, dto_class, row)
+            if error is None and not values[key]:
+                error = f"{key} 不能为空"
+            if error is None:
+                error = validate(values)
+            if error is None and values[key] in seen:
+                error = f"{key} 与第 {seen[values[key]]} 条重复"
+            if error is not None:
+                item['error'] = error
+                continue
+            seen[values[key]] = index
+            chunk.append((item, values))
+            if len(chunk) >= chunk_size:
+                self._write_bulk_chunk(table, key, chunk)
+                chunk = []
+        if chunk:
+            self._write_bulk_chunk(table, key, chunk)
+        
+        for item in result.results:
+            if item['status'] == 'created':
+                result.created += 1
+            elif item['status'] == 'updated':
+                result.updated += 1
+            else:
+                result.failed += 1
+        result.total = len(result.results)
+        self.log_service_result("bulk_upsert", result, table=model.__tablename__, total=result.total,
+                                created=result.created, updated=result.updated, failed=result.failed)
+        return result
+    
+    @staticmethod
+    def _bulk_row_values(table, dto_class, row) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """按请求DTO校验一条记录，返回 (列值字典, 错误信息)"""
+        if isinstance(row, Exception):
+            return None, str(row)
+        if not isinstance(row, dict):
+            return None, "每条记录必须是JSON对象"
+        try:
+            values = dto_class(**row).to_dict()
+        except TypeError as e:
+            return None, f"字段错误: {e}"
+        for name, value in values.items():
+            if value is None:
+                continue
+            if not isinstance(value, str):
+                return None, f"{name} 必须是字符串"
+            length = table.c[name].type.length
+            if length and len(value) > length:
+                return None, f"{name} 超过最大长度 {length}"
+        return values, None
+    
+    def _write_bulk_chunk(self, table, key: str, chunk: List[Tuple[Dict[str, Any], Dict[str, Any]]]):
+        """写入一批已校验的记录，并填写每条记录的结果"""
+        rows = [values for _, values in chunk]
+        try:
+            ids, existing = upsert_rows(db.session, table, key, rows, update_columns=list(rows[0]))
+            db.session.commit()
+            dict_version.bump_dict_version(dict_version.NAME_MAPPING)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            self.log_error(e, {"method": "_write_bulk_chunk", "table": table.name, "rows": len(rows)})
+            for item, _ in chunk:
+                item['error'] = f"写入失败: {type(e).__name__}"
+            return
+        self.log_database_operation("UPSERT", table.name, rows=len(rows), updated=len(existing))
+        for item, values in chunk:
+            item['id'] = ids.get(values[key])
+            item['status'] = 'updated' if values[key] in existing else 'created'
+    
+    # ==================== 字典缓存 ====================
+    
+    def get_dict_cache_stats(self) -> Dict[str, Any]:
+        """字典快照缓存的命中统计及当前快照的版本、各表行数"""
+        return get_dict_cache().stats()
@@ -0,0 +1,96 @@
+"""
+字典数据版本号
+
+由字典数据构建的进程内缓存以版本号判断是否过期：DictService 修改字典后递增对应的版本号，
+读取方发现缓存时的版本号与当前不一致即重新构建。
+版本号默认保存在 app.extensions 中，每个应用实例（即每个进程）各自一份，其他进程的修改不可见；
+配置 DICT_VERSION_REDIS_URL 后保存在Redis的一个hash中，多个gunicorn worker共用同一组版本号。
+Redis不可用时退回本进程的版本号，并在 DICT_VERSION_REDIS_COOLDOWN 秒内不再访问Redis，
+避免每次读取都等待连接超时；冷却期间其他进程的修改要等缓存按TTL过期后才可见。
+"""
+import threading
+import time
+from typing import Iterable, Tuple
+
+from flask import current_app, has_app_context
+
+from app.utils.logger import get_logger
+
+# 人材机一级、二级分类（dict_rcjyjfl / dict_rcjejfl 及二级分类与属性、单位的关联）
+CLASSIFICATION = 'classification'
+# 单位类别、单位（dict_dw_type / dict_dw）
+UNIT = 'unit'
+# 人材机二级分类属性（dict_rcjejflsx）
+EJFL_SX = 'ejfl_sx'
+# 人材机名称映射、名称分类（dict_rcjmc2ejflid / dict_rcjmc_classify）
+NAME_MAPPING = 'name_mapping'
+
+# Redis中保存版本号的hash
+REDIS_KEY = 'ksf-restful:dict_versions'
+
+_lock = threading.Lock()
+logger = get_logger(__name__)
+
+
+def _versions():
+    return current_app.extensions.setdefault('dict_versions', {})
+
+
+def _redis():
+    """配置了DICT_VERSION_REDIS_URL且不在失败后的冷却期内时返回Redis客户端，每个应用实例创建一次"""
+    url = current_app.config.get('DICT_VERSION_REDIS_URL')
+    if not url:
+        return None
+    if time.monotonic() < current_app.extensions.get('dict_version_redis_retry_at', 0.0):
+        return None
+    if 'dict_version_redis' not in current_app.extensions:
+        try:
+            import redis
+            client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        except ImportError:
+            logger.warning("DICT_VERSION_REDIS_URL已配置但未安装redis（pip install ksf-restful[redis]），字典版本号只在本进程内有效")
+            client = None
+        current_app.extensions['dict_version_redis'] = client
+    return current_app.extensions['dict_version_redis']
+
+
+def _redis_failed(message: str, **kwargs):
+    """记录Redis访问失败，冷却期内改用本进程的版本号"""
+    cooldown = current_app.config.get('DICT_VERSION_REDIS_COOLDOWN', 30)
+    current_app.extensions['dict_version_redis_retry_at'] = time.monotonic() + cooldown
+    logger.warning(message, cooldown=cooldown, **kwargs)
+
+
+def get_dict_versions(names: Iterable[str]) -> Tuple[int, ...]:
+    """按给定顺序获取多个字典当前的版本号，使用Redis时一次HMGET读取；从未修改过的字典为0"""
+    names = list(names)
+    client = _redis()
+    if client is not None:
+        try:
+            return tuple(int(value) if value is not None else 0 for value in client.hmget(REDIS_KEY, names))
+        except Exception as e:
+            _redis_failed("读取Redis字典版本号失败", names=names, error=str(e))
+    versions = _versions()
+    return tuple(versions.get(name, 0) for name in names)
+
+
+def get_dict_version(name: str) -> int:
+    """获取字典当前的版本号，从未修改过时为0"""
+    return get_dict_versions([name])[0]
+
+
+def bump_dict_version(name: str) -> int:
+    """字典修改后递增版本号，返回新的版本号；没有应用上下文时没有需要失效的缓存，返回0"""
+    if not has_app_context():
+        return 0
+    with _lock:
+        versions = _versions()
+        versions[name] = versions.get(name, 0) + 1
+        version = versions[name]
+    client = _redis()
+    if client is not None:
+        try:
+            return int(client.hincrby(REDIS_KEY, name, 1))
+        except Exception as e:
+            _redis_failed("递增Redis字典版本号失败", name=name, error=str(e))
+    return version
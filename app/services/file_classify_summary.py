@@ -0,0 +1,170 @@
+"""
+文件分类汇总 - file_classify_summary 物化表的刷新与读取
+
+/matrix/tree?fileid= 需要的一级、二级分类数量来自
+origin_13jt_rcjhzmx -> RcjItem2ClassifyRleationship -> RcjMCClassifyBig 的聚合，
+每次请求都扫描明细表代价较高，因此按文件预先汇总到 file_classify_summary（每个二级分类一行）。
+
+刷新时机:
+- import_13jt_file / 并行导入在写入文件数据的同一事务中刷新
+- 通过ORM修改关联（Rcjhzmx.classify_info / RcjMCClassifyBig.rcjhzmxs）或分类名称时，
+  在flush后自动刷新受影响的文件
+- 绕过ORM直接写关联表的程序需自行调用 refresh_file_classify_summary，
+  或执行 python manage.py refresh-classify-summary
+"""
+from datetime import datetime
+from itertools import chain
+from typing import Iterable, List, Optional
+
+from sqlalchemy import event, select, delete, func, distinct, inspect
+from sqlalchemy.orm import Session
+
+from app.models.models_13jt import File, Rcjhzmx
+from app.models.RcjMCClassifyBig import RcjMCClassifyBig, RcjItem2ClassifyRleationship
+from app.models.file_classify_summary import FileClassifySummary
+
+# 影响汇总结果的分类字段
+_CLASSIFY_FIELDS = ('yjflid', 'yjflmc', 'ejflid', 'ejflmc')
+_PENDING_KEY = 'file_classify_summary_pending'
+
+
+def query_file_classify_counts(executor, fileid) -> List[tuple]:
+    """
+    从明细表聚合文件引用的分类：按二级分类分组，每个分类记录只计一次
+
+    Returns:
+        List[tuple]: [(yjflid, yjflmc, ejflid, ejflmc, count), ...]
+    """
+    classify = RcjMCClassifyBig.__table__
+    link = RcjItem2ClassifyRleationship
+    rcjhzmx = Rcjhzmx.__table__
+    return executor.execute(
+        select(
+            func.min(classify.c.yjflid),
+            func.min(classify.c.yjflmc),
+            classify.c.ejflid,
+            func.min(classify.c.ejflmc),
+            func.count(distinct(classify.c.id))
+        )
+        .join(link, link.c.rcjmcclassifybig_id == classify.c.id)
+        .join(rcjhzmx, rcjhzmx.c.id == link.c.rcjhzmx_id)
+        .where(
+            rcjhzmx.c.file_id == fileid,
+            classify.c.ejflid.isnot(None),
+            classify.c.ejflid != '',
+            classify.c.ejflmc.isnot(None),
+            classify.c.ejflmc != ''
+        )
+        .group_by(classify.c.ejflid)
+    ).all()
+
+
+def refresh_file_classify_summary(executor, fileid) -> int:
+    """
+    重新计算一个文件的分类汇总，在调用方的事务中执行
+
+    Args:
+        executor: Session 或 Connection
+        fileid: 文件ID
+
+    Returns:
+        int: 写入的汇总行数
+    """
+    fileid = int(fileid)
+    summary = FileClassifySummary.__table__
+    now = datetime.now()
+    rows = [
+        {
+            'file_id': fileid,
+            'yjflid': yjflid,
+            'yjflmc': yjflmc,
+            'ejflid': ejflid,
+            'ejflmc': ejflmc,
+            'classify_count': count,
+            'create_time': now,
+            'update_time': now,
+        }
+        for yjflid, yjflmc, ejflid, ejflmc, count in query_file_classify_counts(executor, fileid)
+    ]
+    executor.execute(delete(summary).where(summary.c.file_id == fileid))
+    if rows:
+        executor.execute(summary.insert(), rows)
+    return len(rows)
+
+
+def refresh_all_file_classify_summaries(executor, fileids: Optional[Iterable[int]] = None) -> int:
+    """
+    刷新多个文件的分类汇总，fileids为空时刷新所有文件
+
+    Returns:
+        int: 刷新的文件数
+    """
+    if fileids is None:
+        fileids = executor.execute(select(File.__table__.c.id).order_by(File.__table__.c.id)).scalars().all()
+    refreshed = 0
+    for fileid in fileids:
+        refresh_file_classify_summary(executor, fileid)
+        refreshed += 1
+    return refreshed
+
+
+def get_file_classify_summary(executor, fileid) -> List[tuple]:
+    """
+    读取文件的分类汇总
+
+    Returns:
+        List[tuple]: [(yjflid, yjflmc, ejflid, ejflmc, count), ...]，与 query_file_classify_counts 一致
+    """
+    summary = FileClassifySummary.__table__
+    return executor.execute(
+        select(summary.c.yjflid, summary.c.yjflmc, summary.c.ejflid, summary.c.ejflmc, summary.c.classify_count)
+        .where(summary.c.file_id == int(fileid))
+        .order_by(summary.c.ejflid)
+    ).all()
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_changed_files(session, flush_context, instances):
+    """flush前记录关联或分类字段发生变化的文件ID（此时关联表中仍是修改前的数据）"""
+    file_ids = set()
+    classify_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Rcjhzmx):
+            state = inspect(obj)
+            if obj in session.deleted or state.attrs.classify_info.history.has_changes():
+                file_ids.add(obj.file_id)
+        elif isinstance(obj, RcjMCClassifyBig):
+            state = inspect(obj)
+            history = state.attrs.rcjhzmxs.history if 'rcjhzmxs' in state.attrs else None
+            if history is not None and history.has_changes():
+                file_ids.update(r.file_id for r in chain(history.added, history.deleted))
+            if obj.id is not None and (
+                obj in session.deleted
+                or any(state.attrs[field].history.has_changes() for field in _CLASSIFY_FIELDS)
+            ):
+                classify_ids.add(obj.id)
+
+    if classify_ids:
+        link = RcjItem2ClassifyRleationship
+        rcjhzmx = Rcjhzmx.__table__
+        with session.no_autoflush:
+            file_ids.update(session.connection().execute(
+                select(rcjhzmx.c.file_id).distinct()
+                .join(link, link.c.rcjhzmx_id == rcjhzmx.c.id)
+                .where(link.c.rcjmcclassifybig_id.in_(classify_ids))
+            ).scalars())
+
+    file_ids.discard(None)
+    if file_ids:
+        session.info.setdefault(_PENDING_KEY, set()).update(file_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_changed_files(session, flush_context):
+    """flush后在同一事务中刷新受影响文件的汇总"""
+    file_ids = session.info.pop(_PENDING_KEY, None)
+    if not file_ids:
+        return
+    connection = session.connection()
+    for fileid in sorted(file_ids):
+        refresh_file_classify_summary(connection, fileid)
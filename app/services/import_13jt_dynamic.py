@@ -11,16 +11,27 @@ import sys
 import glob
 import xml.etree.ElementTree as ET
 from datetime import datetime
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, select, delete, update, false, func
+from sqlalchemy.engine import Connection
 from sqlalchemy.orm import sessionmaker
 from typing import Dict, Any, Optional
 import argparse
 import hashlib
+import io
+import json
+from dataclasses import dataclass, field
 
 # 项目根目录已经在pyproject.toml中配置
 
 # from app.models.models_13jt import Base
 import app.models.models_13jt as models_13jt
+from app.models.import_manifest import ImportManifest
+from app.services.file_classify_summary import refresh_file_classify_summary
+from app.services.typed_columns import apply_shadow_values, get_shadow_columns
+
+# 导入结果与该版本号一起记录在导入清单中，导入逻辑改变行数或内容时需要递增
+IMPORTER_VERSION = '3'
+IMPORT_MODES = ('skip', 'replace')
 
 # 动态导入所有模型类
 def get_all_models():
@@ -34,6 +45,81 @@ def get_all_models():
                 models[attr.__tablename__] = attr
     return models
 
+@dataclass
+class ImportTableSpec:
+    """单个13jt标签的预编译导入信息"""
+    tag: str
+    model: Any
+    table: Any
+    columns: frozenset          # 可由XML属性填充的列
+    parent_fk_columns: frozenset  # 形如 xxx_id 的父级外键列
+    # XML属性名(原始大小写) -> 列名，首次遇到时填充；不在白名单中的属性映射为None
+    attr_columns: Dict[str, Optional[str]] = field(default_factory=dict)
+    # 源列名 -> (类型化影子列名, 转换函数)，见 typed_columns
+    shadow_columns: Dict[str, tuple] = field(default_factory=dict)
+
+    def build_row(self, attrib):
+        """按白名单把XML属性转换为行数据，只包含XML中出现的列"""
+        row = {}
+        attr_columns = self.attr_columns
+        for key, value in attrib.items():
+            column = attr_columns.get(key, False)
+            if column is False:
+                column = key.lower()
+                column = column if column in self.columns else None
+                attr_columns[key] = column
+            if column is not None:
+                row[column] = value
+        if self.shadow_columns:
+            apply_shadow_values(row, self.shadow_columns)
+        return row
+
+def compile_import_schema(models):
+    """
+    根据模型类编译 标签 -> ImportTableSpec 的分发表
+
+    之后每个XML元素只需一次字典查找和若干次赋值，
+    不再需要线性扫描models、逐属性hasattr或推断外键字段。
+    """
+    schema = {}
+    for table_name, model in models.items():
+        if not table_name.startswith("origin_13jt_"):
+            continue
+        tag = table_name[len("origin_13jt_"):]
+        table = model.__table__
+        fk_columns = frozenset(
+            c.name for c in table.columns if c.foreign_keys and c.name.endswith('_id')
+        )
+        shadow_columns = get_shadow_columns(table)
+        shadow_names = {shadow for shadow, _ in shadow_columns.values()}
+        columns = frozenset(
+            c.name for c in table.columns
+            if c.name not in ('id', 'create_time', 'update_time') and c.name not in fk_columns
+            and c.name not in shadow_names
+        )
+        schema[tag] = ImportTableSpec(
+            tag=tag,
+            model=model,
+            table=table,
+            columns=columns,
+            parent_fk_columns=fk_columns,
+            shadow_columns=shadow_columns,
+        )
+    return schema
+
+_import_schema_cache = {}
+
+def get_import_schema(models=None):
+    """获取预编译的导入模式，同一组模型在进程内只编译一次"""
+    if models is None:
+        models = get_all_models()
+    key = tuple(sorted(models))
+    schema = _import_schema_cache.get(key)
+    if schema is None:
+        schema = compile_import_schema(models)
+        _import_schema_cache[key] = schema
+    return schema
+
 def get_13jt_files(directory):
     """获取13jt目录下的所有文件，扩展名包含大小写，不包含子目录"""
     pattern1 = os.path.join(directory, "*.13jt")
@@ -75,6 +161,12 @@ def create_model_instance(model_class, data):
         if hasattr(instance, key) and value is not None:
             setattr(instance, key, str(value))
     
+    # 数值、日期字段同时写入类型化影子列
+    for source, (shadow, convert) in get_shadow_columns(model_class.__table__).items():
+        value = data.get(source)
+        if value is not None:
+            setattr(instance, shadow, convert(str(value)))
+    
     return instance
 
 def find_foreign_key_field(child_model, parent_table_name):
@@ -140,8 +232,433 @@ def process_xml_element(element, models, session, parent_chain=None):
         print(f"处理xml元素时出错: {e}")
         raise
 
-def import_13jt_file(file_path, models, session, fileid):
-    """导入单个13jt文件"""
+def iter_xml_events(file_path):
+    """
+    iterparse封装，产出(start/end, element)事件
+
+    end事件被消费后立即清理该元素并从父元素中移除，
+    因此任意时刻内存中只保留当前元素的祖先链。
+    """
+    parents = []
+    for event, element in ET.iterparse(file_path, events=('start', 'end')):
+        if event == 'start':
+            yield event, element
+            parents.append(element)
+        else:
+            parents.pop()
+            yield event, element
+            element.clear()
+            if parents:
+                parents[-1].remove(element)
+
+def process_xml_stream(file_path, models, session, parent_chain, flush_every=1000):
+    """
+    基于iterparse的流式处理，结果与process_xml_element一致
+
+    父节点在第一个有模型的子孙节点出现时才flush获取ID，
+    未flush的叶子节点累计到flush_every个时批量flush，避免session中积压。
+    """
+    schema = get_import_schema(models)
+    # 栈中每一帧: (instance, tag_name)，instance为None表示该标签没有对应模型
+    stack = []
+    pending = 0
+
+    for event, element in iter_xml_events(file_path):
+        if event == 'start':
+            tag_name = element.tag.lower()
+            spec = schema.get(tag_name)
+            model_class = spec.model if spec is not None else None
+            instance = None
+
+            if model_class:
+                # start事件时属性已完整，文本内容在end事件时再补充
+                instance = create_model_instance(model_class, xml_to_dict(element))
+
+                # 设置多层级外键关系：file_id + 所有有模型的祖先节点
+                for parent_id, parent_field in parent_chain:
+                    if hasattr(instance, parent_field):
+                        setattr(instance, parent_field, parent_id)
+                for ancestor, ancestor_tag in stack:
+                    if ancestor is None:
+                        continue
+                    if ancestor.id is None:
+                        session.flush()  # 祖先节点尚未获取ID
+                        pending = 0
+                    parent_field = f"{ancestor_tag}_id"
+                    if hasattr(instance, parent_field):
+                        setattr(instance, parent_field, ancestor.id)
+
+                session.add(instance)
+                pending += 1
+                if pending >= flush_every:
+                    session.flush()
+                    pending = 0
+
+            stack.append((instance, tag_name))
+        else:
+            instance, _ = stack.pop()
+            if instance is not None and element.text and element.text.strip():
+                if hasattr(instance, 'text'):
+                    instance.text = element.text.strip()
+
+class IdAllocator:
+    """
+    客户端主键分配器，session可以是Session或Connection，一个分配器只在一个事务内使用
+
+    PostgreSQL按块从表的序列中预留ID，多个导入可以同时写入同一张表；
+    其他数据库以MAX(id)为起点在本事务内递增，读取MAX(id)时锁住该表的ID分配直到事务结束，
+    同时写入同一张表的其他导入在锁上等待，不会分配到重复的ID：
+    - SQLite: 先执行一条不修改任何行的UPDATE取得数据库写锁
+    - MySQL: 以 SELECT id ... ORDER BY id DESC LIMIT 1 FOR UPDATE 读取最大ID，锁住主键索引的末尾
+    """
+
+    def __init__(self, session, block_size=1000):
+        self.session = session
+        self.block_size = block_size
+        bind = session if isinstance(session, Connection) else session.get_bind()
+        self.dialect = bind.dialect.name.lower()
+        self._reserved = {}  # {table_name: [next_id, ...]} 或 {table_name: next_id}
+
+    def next_id(self, table):
+        if self.dialect == 'postgresql':
+            ids = self._reserved.get(table.name)
+            if not ids:
+                ids = self._reserve_sequence_block(table)
+                self._reserved[table.name] = ids
+            return ids.pop()
+
+        next_id = self._reserved.get(table.name)
+        if next_id is None:
+            next_id = self._lock_max_id(table) + 1
+        self._reserved[table.name] = next_id + 1
+        return next_id
+
+    def _lock_max_id(self, table):
+        """读取表的最大ID，并锁住该表的ID分配直到当前事务结束"""
+        if self.dialect == 'mysql':
+            max_id = self.session.execute(
+                select(table.c.id).order_by(table.c.id.desc()).limit(1).with_for_update()
+            ).scalar()
+            return max_id or 0
+        if self.dialect == 'sqlite':
+            self.session.execute(update(table).where(false()).values(id=table.c.id))
+        return self.session.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+
+    def _reserve_sequence_block(self, table):
+        """从序列中一次取出block_size个ID，倒序存放以便pop"""
+        rows = self.session.execute(
+            text("SELECT nextval(pg_get_serial_sequence(:table_name, 'id')) "
+                 "FROM generate_series(1, :n)"),
+            {"table_name": table.name, "n": self.block_size}
+        ).scalars().all()
+        return sorted(rows, reverse=True)
+
+INSERT_BACKENDS = ('auto', 'copy', 'executemany')
+
+def resolve_insert_backend(dialect_name, backend='auto'):
+    """
+    确定批量写入方式
+
+    auto: PostgreSQL使用COPY，其他数据库（SQLite、MySQL）使用executemany
+    """
+    if backend not in INSERT_BACKENDS:
+        raise ValueError(f"未知的写入方式: {backend}")
+    if backend == 'auto':
+        return 'copy' if dialect_name == 'postgresql' else 'executemany'
+    if backend == 'copy' and dialect_name != 'postgresql':
+        raise ValueError(f"COPY写入只支持PostgreSQL，当前数据库: {dialect_name}")
+    return backend
+
+def insert_rows(executor, table, rows, now, backend='executemany'):
+    """
+    写入一批行，executor可以是Session或Connection
+
+    executemany要求每行的键一致，按列集合分组写入（同一标签的行通常只有一组）；
+    copy把整批行以CSV流式写入 COPY ... FROM STDIN，缺失的列写NULL。
+    """
+    for row in rows:
+        row['create_time'] = now
+        row['update_time'] = now
+    if backend == 'copy':
+        copy_rows(executor, table, rows)
+        return
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    for group in groups.values():
+        executor.execute(table.insert(), group)
+
+def _csv_field(value):
+    """CSV格式中未加引号的空字段为NULL，其余值一律加引号，保证空字符串不会变成NULL"""
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+def copy_rows(executor, table, rows):
+    """通过 COPY table (列...) FROM STDIN (FORMAT csv) 写入一批行，支持psycopg2和psycopg 3驱动"""
+    present = set()
+    for row in rows:
+        present.update(row)
+    columns = [c.name for c in table.columns if c.name in present]
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join([_csv_field(row.get(name)) for name in columns]))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    connection = executor if isinstance(executor, Connection) else executor.connection()
+    preparer = connection.dialect.identifier_preparer
+    sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+        preparer.format_table(table), ', '.join(preparer.quote(name) for name in columns)
+    )
+    dbapi_connection = connection.connection.dbapi_connection
+    cursor = dbapi_connection.cursor()
+    try:
+        if connection.dialect.driver == 'psycopg2':
+            cursor.copy_expert(sql, buffer)
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+class BulkRowWriter:
+    """
+    按表缓冲行数据，攒够batch_size行后按外键顺序批量写入
+
+    每次写入都会清空所有表的缓冲区，并按metadata.sorted_tables的顺序执行，
+    保证父表行总是先于引用它的子表行落库。
+    """
+
+    def __init__(self, session, batch_size=5000, id_block_size=1000, progress_callback=None, backend='auto'):
+        self.session = session
+        self.batch_size = batch_size
+        self.backend = resolve_insert_backend(session.get_bind().dialect.name.lower(), backend)
+        self.progress_callback = progress_callback  # 每次写入后以 {表名: 累计行数} 回调
+        self.id_allocator = IdAllocator(session, block_size=id_block_size)
+        self.buffers = {}  # {table: [row, ...]}
+        self.counts = {}   # {table_name: 已写入行数}
+        self._buffered = 0
+        self._table_order = None
+
+    def add(self, table, row):
+        """缓冲一行数据并返回分配的ID"""
+        row['id'] = self.id_allocator.next_id(table)
+        self.buffers.setdefault(table, []).append(row)
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self.flush()
+        return row['id']
+
+    def flush(self):
+        """按外键顺序写入所有缓冲行"""
+        if not self._buffered:
+            return
+        if self._table_order is None:
+            metadata = next(iter(self.buffers)).metadata
+            self._table_order = {t.name: i for i, t in enumerate(metadata.sorted_tables)}
+
+        now = datetime.now()
+        for table in sorted(self.buffers, key=lambda t: self._table_order.get(t.name, 0)):
+            rows = self.buffers[table]
+            if not rows:
+                continue
+            insert_rows(self.session, table, rows, now, self.backend)
+            self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+            self.buffers[table] = []
+        self._buffered = 0
+        if self.progress_callback:
+            self.progress_callback(dict(self.counts))
+
+def process_xml_bulk(file_path, models, session, parent_chain, batch_size=5000, progress_callback=None,
+                     backend='auto'):
+    """
+    批量导入：客户端分配主键，按表缓冲后批量insert
+
+    父节点在start事件时就分配好ID，子节点无需等待flush即可填写外键，
+    整个文件只需要 行数/batch_size 次批量写入。返回每张表写入的行数。
+    """
+    schema = get_import_schema(models)
+    writer = BulkRowWriter(session, batch_size=batch_size, progress_callback=progress_callback, backend=backend)
+    # 当前有模型的祖先节点外键: [(外键列名, 祖先ID), ...]，以file_id等外部父级开头
+    chain = [(parent_field, parent_id) for parent_id, parent_field in parent_chain]
+    # 栈中每一帧标记该元素是否向chain压入了一项
+    stack = []
+
+    for event, element in iter_xml_events(file_path):
+        if event == 'start':
+            tag_name = element.tag.lower()
+            spec = schema.get(tag_name)
+
+            if spec is not None:
+                row = spec.build_row(element.attrib)
+
+                # 设置多层级外键关系
+                fk_columns = spec.parent_fk_columns
+                for parent_field, parent_id in chain:
+                    if parent_field in fk_columns:
+                        row[parent_field] = parent_id
+
+                row_id = writer.add(spec.table, row)
+                chain.append((f"{tag_name}_id", row_id))
+                stack.append(True)
+            else:
+                stack.append(False)
+        else:
+            if stack.pop():
+                chain.pop()
+
+    writer.flush()
+    return writer.counts
+
+def calculate_file_hash(file_path, chunk_size=1024 * 1024):
+    """分块计算文件MD5，避免一次性读入整个文件"""
+    file_hash = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+def count_13jt_elements(file_path, models):
+    """流式统计文件中每张表对应的元素数，不写数据库"""
+    schema = get_import_schema(models)
+    counts = {}
+    for event, element in iter_xml_events(file_path):
+        if event == 'start':
+            spec = schema.get(element.tag.lower())
+            if spec is not None:
+                counts[spec.table.name] = counts.get(spec.table.name, 0) + 1
+    return counts
+
+def count_file_rows(session, models, fileid):
+    """统计数据库中某个文件在各表的行数，只返回非零的表"""
+    counts = {}
+    for table_name, model in models.items():
+        table = model.__table__
+        if 'file_id' not in table.c:
+            continue
+        count = session.execute(
+            select(func.count()).select_from(table).where(table.c.file_id == fileid)
+        ).scalar()
+        if count:
+            counts[table_name] = count
+    return counts
+
+def delete_file_rows(session, models, fileid):
+    """
+    按表批量删除某个文件导入的所有行（不包括origin_13jt_file本身）
+
+    先删除引用这些行的非13jt表（如人材机分类关联表），再按外键逆序删除各13jt表。
+    返回各表删除的行数。
+    """
+    tables = {model.__table__ for model in models.values() if 'file_id' in model.__table__.c}
+    metadata = next(iter(tables)).metadata
+    deleted = {}
+    for table in reversed(metadata.sorted_tables):
+        if table in tables:
+            conditions = [table.c.file_id == fileid]
+        else:
+            # 非13jt表：删除引用该文件13jt行的记录
+            conditions = [
+                fk.parent.in_(select(fk.column.table.c.id).where(fk.column.table.c.file_id == fileid))
+                for fk in table.foreign_keys if fk.column.table in tables
+            ]
+        for condition in conditions:
+            rowcount = session.execute(delete(table).where(condition)).rowcount
+            if rowcount:
+                deleted[table.name] = deleted.get(table.name, 0) + rowcount
+    return deleted
+
+def get_import_manifest(session, file_hash):
+    return session.execute(
+        select(ImportManifest).where(ImportManifest.hash == file_hash)
+    ).scalar_one_or_none()
+
+def record_import_manifest(session, file_hash, fileid, counts):
+    """写入或更新导入清单，与导入数据在同一事务中提交"""
+    manifest = get_import_manifest(session, file_hash)
+    if manifest is None:
+        manifest = ImportManifest(hash=file_hash)
+        session.add(manifest)
+    manifest.file_id = fileid
+    manifest.importer_version = IMPORTER_VERSION
+    manifest.row_counts = json.dumps(counts, sort_keys=True)
+    manifest.update_time = datetime.now()
+    return manifest
+
+def record_legacy_import_manifest(session, models, file_hash, fileid):
+    """
+    没有导入清单但数据库中已有该文件的行（导入清单出现之前导入的文件）时，按现有行数补写清单
+
+    这些行可能已被人材机分类关联引用，不能删除后重新导入。
+    返回现有行数，没有行时返回空字典且不写清单。
+    """
+    counts = count_file_rows(session, models, fileid)
+    if counts:
+        record_import_manifest(session, file_hash, fileid, counts)
+    return counts
+
+def verify_13jt_import(file_path, models, session, fileid):
+    """
+    比较文件中的元素数、导入清单记录的行数与数据库中的实际行数，不写数据库
+
+    Returns:
+        dict: hash, imported, importer_version, current_version, match,
+              tables {表名: {'file': n, 'manifest': n, 'database': n}}
+    """
+    file_hash = calculate_file_hash(file_path)
+    manifest = get_import_manifest(session, file_hash)
+    manifest_counts = json.loads(manifest.row_counts) if manifest and manifest.row_counts else {}
+    file_counts = count_13jt_elements(file_path, models)
+    database_counts = count_file_rows(session, models, fileid)
+
+    tables = {}
+    match = manifest is not None
+    for table_name in sorted(set(file_counts) | set(manifest_counts) | set(database_counts)):
+        item = {
+            'file': file_counts.get(table_name, 0),
+            'manifest': manifest_counts.get(table_name, 0),
+            'database': database_counts.get(table_name, 0),
+        }
+        match = match and item['file'] == item['manifest'] == item['database']
+        tables[table_name] = item
+
+    return {
+        'hash': file_hash,
+        'imported': manifest is not None,
+        'importer_version': manifest.importer_version if manifest else None,
+        'current_version': IMPORTER_VERSION,
+        'match': match,
+        'tables': tables,
+    }
+
+def import_13jt_file(file_path, models, session, fileid, engine='bulk', progress_callback=None, backend='auto',
+                     mode=None):
+    """
+    导入单个13jt文件
+
+    Args:
+        engine: 导入引擎
+            bulk   - 流式解析 + 客户端分配主键 + 批量insert（默认）
+            stream - 流式解析 + ORM逐行add
+            tree   - ET.parse整树解析 + ORM逐行add
+        progress_callback: 仅bulk引擎支持，每次批量写入后以 {表名: 累计行数} 回调
+        backend: 仅bulk引擎支持，批量写入方式
+            auto        - PostgreSQL使用COPY，其他数据库使用executemany（默认）
+            copy        - COPY ... FROM STDIN，仅PostgreSQL
+            executemany - 按表批量insert
+        mode: 重复导入的处理方式，按文件hash查找导入清单
+            None    - 不检查，直接追加导入（不写导入清单）
+            skip    - 清单中已有该文件时跳过，返回清单中的行数；没有清单但数据库中已有该文件的行时，
+                      按现有行数补写清单后跳过，不删除已有数据及其分类关联
+            replace - 先按表批量删除该文件已导入的行及引用它们的分类关联，再重新导入
+            两种模式都会在同一事务中写入导入清单
+
+    Returns:
+        bulk引擎返回 {表名: 写入行数}，其他引擎返回None
+    """
     try:
         print(f"-"*100)
         print(f"正在处理文件: {os.path.basename(file_path)}")
@@ -161,9 +678,7 @@ def import_13jt_file(file_path, models, session, fileid):
                 filetype=os.path.basename(file_path).split('.')[-1].lower()
             )
             # 计算文件hash
-            with open(file_path, 'rb') as f:
-                file_hash = hashlib.md5(f.read()).hexdigest()
-                file_instance.hash = file_hash
+            file_instance.hash = calculate_file_hash(file_path)
         else:
             raise Exception("未找到文件模型")
 
@@ -172,16 +687,55 @@ def import_13jt_file(file_path, models, session, fileid):
 
         current_parent_chain = [(file_instance.id, 'file_id')]
 
-        # 解析XML
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        
-        # 处理根元素
-        process_xml_element(root, models, session, current_parent_chain)
+        if mode is not None:
+            if mode not in IMPORT_MODES:
+                raise ValueError(f"未知的导入模式: {mode}")
+            if mode == 'skip':
+                manifest = get_import_manifest(session, file_instance.hash)
+                if manifest is not None and manifest.file_id == fileid:
+                    print(f"- 文件已导入（导入器版本 {manifest.importer_version}），跳过")
+                    return json.loads(manifest.row_counts) if manifest.row_counts else {}
+                counts = record_legacy_import_manifest(session, models, file_instance.hash, fileid)
+                if counts:
+                    session.commit()
+                    print(f"- 文件已导入（没有导入清单），按现有行数补写清单后跳过")
+                    return counts
+            else:
+                delete_file_rows(session, models, fileid)
+
+        counts = None
+        if engine == 'bulk':
+            # 流式解析 + 批量写入
+            counts = process_xml_bulk(
+                file_path, models, session, current_parent_chain,
+                progress_callback=progress_callback, backend=backend
+            )
+        elif engine == 'stream':
+            # 流式解析，内存占用与文件大小无关
+            process_xml_stream(file_path, models, session, current_parent_chain)
+        elif engine == 'tree':
+            # 解析XML
+            tree = ET.parse(file_path)
+            root = tree.getroot()
+
+            # 处理根元素
+            process_xml_element(root, models, session, current_parent_chain)
+        else:
+            raise ValueError(f"未知的导入引擎: {engine}")
         
+        # 重新汇总该文件的分类数量（replace模式下旧的分类关联已随明细行一起删除）
+        session.flush()
+        refresh_file_classify_summary(session, fileid)
+
+        if mode is not None:
+            if counts is None:
+                counts = count_file_rows(session, models, fileid)
+            record_import_manifest(session, file_instance.hash, fileid, counts)
+
         # 文件处理完成，提交事务
         session.commit()
         print(f"✓ 成功导入: {os.path.basename(file_path)}")
+        return counts
         
     except Exception as e:
         session.rollback()
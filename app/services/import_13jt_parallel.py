@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程并行导入13jt文件
+
+解析与写入分离:
+- 子进程（ProcessPoolExecutor）流式解析XML，按文件内的局部ID生成行数据批次，不访问数据库
+- 主进程中的写入线程各持有一个数据库连接，为批次分配全局主键、改写外键后批量insert
+- 每个文件在一个事务中写入，失败的文件回滚后继续处理下一个文件
+- 是否跳过按导入清单判断，与单文件导入的skip/replace模式一致；已上传但未解析的文件导入到已有的File行下
+- skip模式下主进程先按文件哈希查询导入清单，已导入的文件不交给子进程解析；
+  写入事务中再检查一次，防止与其他导入同时进行时重复写入
+"""
+
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import select
+
+from app.models.import_manifest import ImportManifest
+from app.services.file_classify_summary import refresh_file_classify_summary
+from app.services.import_13jt_dynamic import (
+    IMPORT_MODES, IMPORTER_VERSION, IdAllocator, calculate_file_hash, count_file_rows, delete_file_rows,
+    get_13jt_files, get_all_models, get_import_schema, insert_rows, iter_xml_events, resolve_insert_backend
+)
+
+
+@dataclass
+class FileImportResult:
+    """单个文件的导入结果"""
+    path: str
+    file_id: Optional[int] = None
+    rows: int = 0
+    parse_seconds: float = 0.0
+    write_seconds: float = 0.0
+    skipped: bool = False
+    importer_version: Optional[str] = None  # 跳过时导入清单记录的导入器版本
+    error: Optional[str] = None
+
+    @property
+    def rows_per_second(self) -> float:
+        seconds = self.parse_seconds + self.write_seconds
+        return self.rows / seconds if seconds else 0.0
+
+
+@dataclass
+class ParallelImportSummary:
+    """整批导入的汇总结果"""
+    results: List[FileImportResult]
+    elapsed_seconds: float
+
+    @property
+    def succeeded(self) -> List[FileImportResult]:
+        return [r for r in self.results if r.error is None and not r.skipped]
+
+    @property
+    def failed(self) -> List[FileImportResult]:
+        return [r for r in self.results if r.error is not None]
+
+    @property
+    def skipped(self) -> List[FileImportResult]:
+        return [r for r in self.results if r.skipped]
+
+    @property
+    def total_rows(self) -> int:
+        return sum(r.rows for r in self.succeeded)
+
+    @property
+    def files_per_second(self) -> float:
+        return len(self.succeeded) / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.total_rows / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+def collect_13jt_paths(paths) -> List[str]:
+    """展开命令行参数中的目录（不含子目录），按文件大小降序排列以减少尾部等待"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(get_13jt_files(path))
+        else:
+            files.append(path)
+    return sorted(set(files), key=lambda p: os.path.getsize(p) if os.path.exists(p) else 0, reverse=True)
+
+
+def parse_13jt_rows(file_path, batch_size=5000):
+    """
+    子进程入口：解析单个13jt文件为行数据批次
+
+    行的id和父级外键都是文件内的局部ID（每张表从1开始连续编号），
+    file_id由写入端填写。批次内父表行总是先于引用它的子表行出现。
+
+    Returns:
+        dict: path, hash, filesize, batches([{表名: [行, ...]}, ...]), parse_seconds
+    """
+    start = time.perf_counter()
+    schema = get_import_schema()
+    local_ids = {}   # {表名: 已分配的最大局部ID}
+    batches = []
+    batch = {}
+    buffered = 0
+    chain = []       # [(外键列名, 祖先局部ID), ...]
+    stack = []
+
+    for event, element in iter_xml_events(file_path):
+        if event == 'start':
+            tag_name = element.tag.lower()
+            spec = schema.get(tag_name)
+            if spec is not None:
+                row = spec.build_row(element.attrib)
+                fk_columns = spec.parent_fk_columns
+                for parent_field, parent_id in chain:
+                    if parent_field in fk_columns:
+                        row[parent_field] = parent_id
+
+                table_name = spec.table.name
+                row_id = local_ids.get(table_name, 0) + 1
+                local_ids[table_name] = row_id
+                row['id'] = row_id
+                batch.setdefault(table_name, []).append(row)
+                buffered += 1
+                if buffered >= batch_size:
+                    batches.append(batch)
+                    batch = {}
+                    buffered = 0
+
+                chain.append((f"{tag_name}_id", row_id))
+                stack.append(True)
+            else:
+                stack.append(False)
+        else:
+            if stack.pop():
+                chain.pop()
+
+    if batch:
+        batches.append(batch)
+
+    return {
+        'path': file_path,
+        'hash': calculate_file_hash(file_path),
+        'filesize': os.path.getsize(file_path),
+        'batches': batches,
+        'parse_seconds': time.perf_counter() - start,
+    }
+
+
+class ParallelFileWriter:
+    """
+    写入线程使用的文件写入器：局部ID -> 全局ID，改写外键，每个文件一个事务
+
+    主键分配器随事务创建：PostgreSQL从序列预留ID，多个写入线程可以同时写入；
+    其他数据库按表加锁分配ID直到事务提交，多个写入线程只会依次写入，见 IdAllocator。
+    """
+
+    def __init__(self, engine, id_block_size=1000, backend='auto', mode='skip'):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"未知的导入模式: {mode}")
+        self.engine = engine
+        self.mode = mode
+        self.backend = resolve_insert_backend(engine.dialect.name.lower(), backend)
+        self.id_block_size = id_block_size
+        self.models = get_all_models()
+        self.schema = get_import_schema()
+        self.tables = {spec.table.name: spec.table for spec in self.schema.values()}
+        self.file_table = self.tables['origin_13jt_file']
+
+        # {表名: {外键列名: 被引用的表名}}，与解析端一致按 <标签>_id 命名约定对应，file_id单独处理
+        self.fk_targets = {}
+        for spec in self.schema.values():
+            self.fk_targets[spec.table.name] = {
+                column_name: 'origin_13jt_' + column_name[:-len('_id')]
+                for column_name in spec.parent_fk_columns
+                if column_name != 'file_id' and column_name[:-len('_id')] in self.schema
+            }
+
+        metadata = self.file_table.metadata
+        self.table_order = {t.name: i for i, t in enumerate(metadata.sorted_tables)}
+
+    def write(self, parsed) -> FileImportResult:
+        result = FileImportResult(path=parsed['path'], parse_seconds=parsed['parse_seconds'])
+        start = time.perf_counter()
+        try:
+            with self.engine.begin() as conn:
+                id_allocator = IdAllocator(conn, block_size=self.id_block_size)
+                manifest_table = ImportManifest.__table__
+                file_table = self.file_table
+                manifest = conn.execute(
+                    select(manifest_table.c.file_id, manifest_table.c.importer_version)
+                    .where(manifest_table.c.hash == parsed['hash'])
+                ).first()
+                if manifest is not None and self.mode == 'skip':
+                    result.file_id = manifest.file_id
+                    result.importer_version = manifest.importer_version
+                    result.skipped = True
+                    return result
+
+                # 已上传（或导入清单出现之前已导入）的文件已有File行，导入到该文件下
+                file_id = manifest.file_id if manifest is not None else conn.execute(
+                    select(file_table.c.id).where(file_table.c.hash == parsed['hash'])
+                    .order_by(file_table.c.id).limit(1)
+                ).scalar()
+                if file_id is not None and self.mode == 'skip':
+                    # 没有导入清单但已有行：补写清单后跳过，不删除已有数据及其分类关联
+                    counts = count_file_rows(conn, self.models, file_id)
+                    if counts:
+                        self._write_manifest(conn, id_allocator, parsed['hash'], file_id, counts)
+                        result.file_id = file_id
+                        result.skipped = True
+                        return result
+                elif file_id is not None:
+                    delete_file_rows(conn, self.models, file_id)
+
+                if file_id is None:
+                    file_id = id_allocator.next_id(file_table)
+                    insert_rows(conn, file_table, [{
+                        'id': file_id,
+                        'hash': parsed['hash'],
+                        'filename': os.path.basename(parsed['path']),
+                        'filesize': parsed['filesize'],
+                        'filetype': os.path.basename(parsed['path']).split('.')[-1].lower(),
+                    }], datetime.now(), self.backend)
+                result.file_id = file_id
+
+                id_maps = {}  # {表名: [全局ID, ...]}，下标为局部ID-1
+                for batch in parsed['batches']:
+                    result.rows += self._write_batch(conn, id_allocator, batch, file_id, id_maps)
+
+                # 与单文件导入一致，在同一事务中刷新分类汇总、写入导入清单
+                refresh_file_classify_summary(conn, file_id)
+                self._write_manifest(conn, id_allocator, parsed['hash'], file_id,
+                                     {name: len(ids) for name, ids in id_maps.items()})
+        except Exception as e:
+            result.error = str(e)
+            result.rows = 0
+        finally:
+            result.write_seconds = time.perf_counter() - start
+        return result
+
+    def _write_manifest(self, conn, id_allocator, file_hash, file_id, counts):
+        manifest_table = ImportManifest.__table__
+        conn.execute(manifest_table.delete().where(manifest_table.c.hash == file_hash))
+        insert_rows(conn, manifest_table, [{
+            'id': id_allocator.next_id(manifest_table),
+            'hash': file_hash,
+            'file_id': file_id,
+            'importer_version': IMPORTER_VERSION,
+            'row_counts': json.dumps(counts, sort_keys=True),
+        }], datetime.now())
+
+    def _write_batch(self, conn, id_allocator, batch, file_id, id_maps):
+        now = datetime.now()
+        written = 0
+        for table_name in sorted(batch, key=lambda name: self.table_order.get(name, 0)):
+            rows = batch[table_name]
+            table = self.tables[table_name]
+            ids = [id_allocator.next_id(table) for _ in rows]
+            id_map = id_maps.setdefault(table_name, [])
+            id_map.extend(ids)
+
+            fk_targets = self.fk_targets[table_name]
+            has_file_id = 'file_id' in table.c
+            for row, row_id in zip(rows, ids):
+                row['id'] = row_id
+                if has_file_id:
+                    row['file_id'] = file_id
+                for column_name, target in fk_targets.items():
+                    local_id = row.get(column_name)
+                    if local_id is not None:
+                        row[column_name] = id_maps[target][local_id - 1]
+
+            insert_rows(conn, table, rows, now, self.backend)
+            written += len(rows)
+        return written
+
+
+def find_imported_files(paths, engine, chunk_size=500):
+    """
+    按文件哈希查询导入清单，找出已导入的文件
+
+    Returns:
+        (未导入的路径列表, 已导入文件的跳过结果列表)；无法读取的文件留给解析阶段报告错误
+    """
+    hashes = {}
+    for path in paths:
+        try:
+            hashes[path] = calculate_file_hash(path)
+        except OSError:
+            hashes[path] = None
+
+    manifest_table = ImportManifest.__table__
+    manifests = {}
+    known = sorted({file_hash for file_hash in hashes.values() if file_hash})
+    with engine.connect() as conn:
+        for start in range(0, len(known), chunk_size):
+            manifests.update(
+                (row.hash, row) for row in conn.execute(
+                    select(manifest_table.c.hash, manifest_table.c.file_id, manifest_table.c.importer_version)
+                    .where(manifest_table.c.hash.in_(known[start:start + chunk_size]))
+                )
+            )
+
+    remaining, skipped = [], []
+    for path in paths:
+        manifest = manifests.get(hashes[path])
+        if manifest is None:
+            remaining.append(path)
+        else:
+            skipped.append(FileImportResult(path=path, file_id=manifest.file_id,
+                                            importer_version=manifest.importer_version, skipped=True))
+    return remaining, skipped
+
+
+def import_13jt_parallel(paths, engine, workers=None, writers=1, batch_size=5000, backend='auto', mode='skip',
+                         on_result: Optional[Callable[[FileImportResult], None]] = None) -> ParallelImportSummary:
+    """
+    并行导入多个13jt文件
+
+    Args:
+        paths: 文件路径列表
+        engine: 写入使用的SQLAlchemy引擎
+        workers: 解析进程数，默认CPU核数
+        writers: 写入线程（连接）数，只对PostgreSQL有效；其他数据库按表加锁分配主键，固定为1
+        batch_size: 每个行数据批次的行数
+        backend: 批量写入方式，见 resolve_insert_backend
+        mode: 已导入文件的处理方式，与单文件导入相同
+            skip    - 导入清单中已有该文件时跳过；没有清单但已有行的旧数据补写清单后跳过
+            replace - 删除该文件已导入的行及其分类关联后重新导入
+        on_result: 每个文件完成时的回调
+
+    Returns:
+        ParallelImportSummary: 各文件结果及总耗时
+    """
+    workers = workers or os.cpu_count() or 1
+    if engine.dialect.name.lower() != 'postgresql':
+        writers = 1
+    writer = ParallelFileWriter(engine, backend=backend, mode=mode)
+    results = []
+    seen_hashes = set()
+    # 已解析但未写入的文件会占用内存，限制在途文件数
+    max_in_flight = workers + writers * 2
+    start = time.perf_counter()
+
+    def finish(result):
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    with ProcessPoolExecutor(max_workers=workers) as parse_pool, \
+            ThreadPoolExecutor(max_workers=writers, thread_name_prefix='import-13jt-writer') as write_pool:
+        pending_paths = list(paths)
+        if mode == 'skip':
+            pending_paths, skipped = find_imported_files(pending_paths, engine)
+            for result in skipped:
+                finish(result)
+        parsing = {}   # {future: path}
+        writing = set()
+
+        while pending_paths or parsing or writing:
+            while pending_paths and len(parsing) + len(writing) < max_in_flight:
+                path = pending_paths.pop(0)
+                parsing[parse_pool.submit(parse_13jt_rows, path, batch_size)] = path
+
+            done, _ = wait(list(parsing) + list(writing), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in writing:
+                    writing.discard(future)
+                    finish(future.result())
+                    continue
+
+                path = parsing.pop(future)
+                try:
+                    parsed = future.result()
+                except Exception as e:
+                    finish(FileImportResult(path=path, error=f"解析失败: {e}"))
+                    continue
+
+                if parsed['hash'] in seen_hashes:
+                    finish(FileImportResult(path=path, parse_seconds=parsed['parse_seconds'], skipped=True))
+                    continue
+                seen_hashes.add(parsed['hash'])
+                writing.add(write_pool.submit(writer.write, parsed))
+
+    return ParallelImportSummary(results=results, elapsed_seconds=time.perf_counter() - start)
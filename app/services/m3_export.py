@@ -0,0 +1,212 @@
+"""
+M3列式导出服务 - 把二级分类下的RcjMCClassifyBig记录导出为Arrow IPC或Parquet文件
+
+- 列与 /matrix/m3 的字段一致：基础列 + 该二级分类拥有的属性列（列名为属性ID），
+  bjsj为date32类型，不再格式化为字符串
+- 记录由服务端游标按批读取，每批直接转换为一个RecordBatch写出，内存占用与记录数无关
+- 导出文件缓存在 M3_EXPORT_CACHE_DIR 中，文件名包含二级分类ID和数据版本，
+  分类记录或属性定义变化后版本随之变化，旧版本文件在生成新文件后删除
+
+依赖pyarrow（pip install ksf-restful[analytics]），未安装时导出抛出 ExportUnavailableError。
+"""
+import os
+import glob
+import hashlib
+import tempfile
+from typing import List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.models.RcjMCClassifyBig import RcjMCClassifyBig
+from app.services.base_service import BaseService
+from app.services.dict_cache import get_dict_snapshot
+from app.services.classify_projection import ClassifyProjection, classify_data_signature, load_sx_values
+
+# 导出格式: (扩展名, MIME类型)
+EXPORT_FORMATS = {
+    'arrow': ('.arrow', 'application/vnd.apache.arrow.file'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+# 导出文件的列或类型改变时递增，使已缓存的文件失效
+EXPORT_VERSION = '1'
+
+# 基础列: (输出列名, RcjMCClassifyBig列名, pyarrow类型名)，输出列名与 /matrix/m3 的字段一致
+_BASE_FIELDS = (
+    ('id', 'id', 'int64'),
+    ('original_rcjmc', 'original_rcjmc', 'string'),
+    ('dw', 'rcjdw', 'string'),
+    ('dj', 'rcjdj', 'float64'),
+    ('bjsj', 'bjsj', 'date32'),
+    ('cleaned_rcjmc', 'cleaned_rcjmc', 'string'),
+    ('parsed_rcjmc', 'parsed_rcjmc', 'string'),
+    ('ejflid', 'ejflid', 'string'),
+    ('yjflid', 'yjflid', 'string'),
+    ('yjflmc', 'yjflmc', 'string'),
+    ('ejflmc', 'ejflmc', 'string'),
+    ('sjjhflid', 'sjjhflid', 'string'),
+    ('sjjhflmc', 'sjjhflmc', 'string'),
+    ('sjjhflzt', 'sjjhflzt', 'string'),
+)
+
+
+class ExportUnavailableError(RuntimeError):
+    """导出依赖未安装"""
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ExportUnavailableError("M3导出需要安装pyarrow: pip install ksf-restful[analytics]") from e
+    return pyarrow
+
+
+class M3ExportService(BaseService):
+    """M3列式导出服务类"""
+
+    def export_m3(self, ejflid: str, fmt: str = 'parquet') -> Optional[Tuple[str, str]]:
+        """
+        导出一个二级分类，已有相同数据版本的缓存文件时直接返回
+
+        Args:
+            ejflid: 二级分类ID
+            fmt: arrow 或 parquet
+
+        Returns:
+            (文件路径, 数据版本)，二级分类不存在时返回None
+        """
+        self.log_service_call("export_m3", ejflid=ejflid, fmt=fmt)
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {fmt}")
+        pa = _import_pyarrow()
+
+        ejfl = get_dict_snapshot().ejfls.get(ejflid)
+        if not ejfl:
+            self.log_not_found("RcjEjfl", ejflid)
+            return None
+
+        sx_ids = list(ejfl.sxids)
+        version = self.get_data_version(ejflid, sx_ids)
+        path = self._get_cache_path(ejflid, version, fmt)
+        if os.path.exists(path):
+            self.logger.info("M3 export cache hit", ejflid=ejflid, version=version, fmt=fmt)
+            return path, version
+
+        cache_dir = os.path.dirname(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.m3-', suffix='.part', dir=cache_dir)
+        os.close(fd)
+        try:
+            rows = self._write_file(pa, ejflid, sx_ids, fmt, temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self._remove_stale_files(ejflid, fmt, keep=path)
+        self.log_service_result("export_m3", path, ejflid=ejflid, version=version, rows=rows)
+        return path, version
+
+    def export_all(self, fmt: str = 'parquet') -> List[Tuple[str, str, str]]:
+        """
+        导出所有有分类记录的二级分类，每个二级分类一个文件
+
+        Returns:
+            [(二级分类ID, 文件路径, 数据版本), ...]
+        """
+        ejflids = db.session.execute(
+            select(RcjMCClassifyBig.ejflid)
+            .where(RcjMCClassifyBig.ejflid.isnot(None), RcjMCClassifyBig.ejflid != '')
+            .distinct()
+            .order_by(RcjMCClassifyBig.ejflid)
+        ).scalars().all()
+        exported = []
+        for ejflid in ejflids:
+            result = self.export_m3(ejflid, fmt)
+            if result:
+                exported.append((ejflid, *result))
+        return exported
+
+    def get_data_version(self, ejflid: str, sx_ids: List[str]) -> str:
+        """
+        二级分类当前的数据版本
+
+        由记录数、最大ID、最近更新时间、属性ID列表、属性值存储方式和导出格式版本计算，
+        任一变化都会生成新的导出文件。
+        """
+        count, max_id, max_update_time = classify_data_signature(db.session, ejflid)
+        key = '|'.join([
+            EXPORT_VERSION, ejflid, str(count), str(max_id), str(max_update_time),
+            ','.join(sx_ids), current_app.config.get('CLASSIFY_SX_STORAGE', 'wide')
+        ])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+    def _write_file(self, pa, ejflid: str, sx_ids: List[str], fmt: str, path: str) -> int:
+        """按批从服务端游标读取并写入RecordBatch，返回写入的行数"""
+        sparse = current_app.config.get('CLASSIFY_SX_STORAGE', 'wide') == 'sparse'
+        projection = ClassifyProjection(
+            [] if sparse else sx_ids, base_columns=[column for _, column, _ in _BASE_FIELDS]
+        )
+        schema = pa.schema(
+            [pa.field(name, getattr(pa, type_name)()) for name, _, type_name in _BASE_FIELDS] +
+            [pa.field(str(sx_id), pa.string()) for sx_id in sx_ids]
+        )
+        batch_size = current_app.config.get('M3_STREAM_BATCH_SIZE', 1000)
+        result = db.session.execute(
+            projection.select()
+            .where(RcjMCClassifyBig.ejflid == ejflid)
+            .order_by(RcjMCClassifyBig.id)
+            .execution_options(yield_per=batch_size)
+        )
+
+        if fmt == 'parquet':
+            writer = pa.parquet.ParquetWriter(path, schema)
+        else:
+            writer = pa.ipc.new_file(path, schema)
+        rows_written = 0
+        try:
+            for rows in result.partitions():
+                base_count = len(_BASE_FIELDS)
+                columns = [list(values) for values in zip(*(row[:base_count] for row in rows))]
+                if sparse:
+                    sx_values = load_sx_values(db.session, columns[0], sx_ids)
+                    columns.extend([sx_values[classify_id][sx_id] for classify_id in columns[0]] for sx_id in sx_ids)
+                else:
+                    sx_rows = [projection.sx_values(row) for row in rows]
+                    columns.extend([values[sx_id] for values in sx_rows] for sx_id in sx_ids)
+                writer.write_batch(pa.RecordBatch.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema
+                ))
+                rows_written += len(rows)
+            if rows_written == 0:
+                # 没有记录时也写出只有表结构的文件
+                writer.write_batch(pa.RecordBatch.from_pylist([], schema=schema))
+        finally:
+            writer.close()
+        return rows_written
+
+    def _get_cache_directory(self) -> str:
+        cache_dir = current_app.config.get('M3_EXPORT_CACHE_DIR', 'cache/m3_export')
+        if not os.path.isabs(cache_dir):
+            cache_dir = os.path.join(current_app.root_path, '..', cache_dir)
+        return cache_dir
+
+    def _get_cache_path(self, ejflid: str, version: str, fmt: str) -> str:
+        extension = EXPORT_FORMATS[fmt][0]
+        return os.path.join(self._get_cache_directory(), f"m3-{ejflid}-{version}{extension}")
+
+    def _remove_stale_files(self, ejflid: str, fmt: str, keep: str):
+        """删除同一二级分类、同一格式的旧版本文件"""
+        extension = EXPORT_FORMATS[fmt][0]
+        for path in glob.glob(os.path.join(self._get_cache_directory(), f"m3-{glob.escape(ejflid)}-*{extension}")):
+            if os.path.abspath(path) != os.path.abspath(keep):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
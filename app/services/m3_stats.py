@@ -0,0 +1,240 @@
+"""
+M3价格统计服务 - 按二级分类及属性值组合统计RcjMCClassifyBig.rcjdj
+
+- 只读取 id、rcjdj、bjsj 和分组用的属性列，装入NumPy数组后向量化计算
+- 分组统计：按(分组编号, 单价)排序后每组是连续的一段，用 reduceat 求和/计数/最值，
+  分位数在组内有序段上按下标线性插值（与 numpy.percentile 默认方法一致）
+- 异常值按四分位距判定：低于 Q1 - 1.5*IQR 或高于 Q3 + 1.5*IQR
+- 统计结果按二级分类缓存在进程内，分类记录或属性定义变化后重新计算
+
+依赖numpy（pip install ksf-restful[analytics]），未安装时抛出 StatsUnavailableError。
+"""
+import threading
+from datetime import date
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from flask import current_app
+
+from app import db
+from app.models.RcjMCClassifyBig import RcjMCClassifyBig
+from app.services.base_service import BaseService
+from app.services.dict_cache import get_dict_snapshot
+from app.services.classify_projection import ClassifyProjection, classify_data_signature, load_sx_values
+
+DEFAULT_PERCENTILES = (5, 25, 75, 95)
+# 四分位距倍数，超出 [Q1 - k*IQR, Q3 + k*IQR] 的单价视为异常值
+OUTLIER_IQR_FACTOR = 1.5
+# 每组最多返回的异常值记录ID个数，outlier_count 为实际个数
+MAX_OUTLIER_IDS = 100
+
+_cache_lock = threading.Lock()
+
+
+class StatsUnavailableError(RuntimeError):
+    """统计依赖未安装"""
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise StatsUnavailableError("M3统计需要安装numpy: pip install ksf-restful[analytics]") from e
+    return numpy
+
+
+def encode_groups(key_columns: Sequence[Sequence[Optional[str]]], row_count: int):
+    """
+    把多列分组值编码为连续的组编号，编号顺序与分组值的排序一致（None排在最后）
+
+    Returns:
+        numpy.ndarray: 每行的组编号(int64)，相同的值组合编号相同；没有分组列时全部为0
+    """
+    np = _import_numpy()
+    if not key_columns:
+        return np.zeros(row_count, dtype=np.int64)
+    # 分组值组合的种类远少于行数，用字典编号比对字符串数组排序快得多
+    index = {}
+    inverse = np.fromiter((index.setdefault(key, len(index)) for key in zip(*key_columns)),
+                          dtype=np.int64, count=row_count)
+    ranks = np.empty(len(index), dtype=np.int64)
+    ordered = sorted(index, key=lambda key: tuple((value is None, value or '') for value in key))
+    ranks[[index[key] for key in ordered]] = np.arange(len(ordered))
+    return ranks[inverse]
+
+
+def compute_group_stats(prices, codes, dates=None, ids=None,
+                        percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> List[Dict[str, Any]]:
+    """
+    分组价格统计
+
+    Args:
+        prices: 单价数组，不能含空值
+        codes: 每行的组编号，见 encode_groups
+        dates: 每行的报价时间（date或None），可选
+        ids: 每行的记录ID，提供时返回异常值记录ID
+        percentiles: 需要计算的百分位数(0-100)
+
+    Returns:
+        按组编号排序的统计结果列表，每项的 row 为该组任意一行在输入中的下标，用于取回分组值
+    """
+    np = _import_numpy()
+    prices = np.asarray(prices, dtype=np.float64)
+    codes = np.asarray(codes, dtype=np.int64)
+    row_count = len(prices)
+    if row_count == 0:
+        return []
+
+    order = np.lexsort((prices, codes))
+    prices = prices[order]
+    codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    counts = np.diff(np.r_[starts, row_count])
+    group_of_row = np.repeat(np.arange(len(starts)), counts)
+
+    def quantile(q):
+        position = starts + q * (counts - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        return prices[lower] + (prices[upper] - prices[lower]) * (position - lower)
+
+    means = np.add.reduceat(prices, starts) / counts
+    medians = quantile(0.5)
+    percentile_values = {p: quantile(p / 100.0) for p in percentiles}
+    q1, q3 = quantile(0.25), quantile(0.75)
+    lower_fence = q1 - OUTLIER_IQR_FACTOR * (q3 - q1)
+    upper_fence = q3 + OUTLIER_IQR_FACTOR * (q3 - q1)
+    outliers = (prices < lower_fence[group_of_row]) | (prices > upper_fence[group_of_row])
+    outlier_counts = np.add.reduceat(outliers.astype(np.int64), starts)
+
+    outlier_ids = None
+    if ids is not None:
+        outlier_rows = np.flatnonzero(outliers)
+        sorted_ids = np.asarray(ids)[order][outlier_rows]
+        outlier_ids = np.split(sorted_ids, np.searchsorted(group_of_row[outlier_rows], np.arange(1, len(starts))))
+
+    date_min = date_max = None
+    if dates is not None:
+        days = np.fromiter((value.toordinal() if value else 0 for value in dates), dtype=np.int64, count=row_count)[order]
+        missing = days == 0
+        info = np.iinfo(np.int64)
+        date_min = np.minimum.reduceat(np.where(missing, info.max, days), starts)
+        date_max = np.maximum.reduceat(np.where(missing, info.min, days), starts)
+
+    def to_date(value, missing_value):
+        return None if value == missing_value else date.fromordinal(int(value)).isoformat()
+
+    groups = []
+    for index, start in enumerate(starts.tolist()):
+        group = {
+            'row': int(order[start]),
+            'count': int(counts[index]),
+            'min': float(prices[start]),
+            'max': float(prices[start + counts[index] - 1]),
+            'mean': float(means[index]),
+            'median': float(medians[index]),
+            'percentiles': {str(p): float(values[index]) for p, values in percentile_values.items()},
+            'outlier_low': float(lower_fence[index]),
+            'outlier_high': float(upper_fence[index]),
+            'outlier_count': int(outlier_counts[index]),
+        }
+        if outlier_ids is not None:
+            group['outlier_ids'] = outlier_ids[index][:MAX_OUTLIER_IDS].tolist()
+        if date_min is not None:
+            group['bjsj_min'] = to_date(date_min[index], info.max)
+            group['bjsj_max'] = to_date(date_max[index], info.min)
+        groups.append(group)
+    return groups
+
+
+class M3StatsService(BaseService):
+    """M3价格统计服务类"""
+
+    def get_m3_stats(self, ejflid: str, group_sx_ids: Optional[List[str]] = None,
+                     percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> Optional[Dict[str, Any]]:
+        """
+        统计二级分类的单价，以及按属性值组合分组的单价
+
+        Args:
+            ejflid: 二级分类ID
+            group_sx_ids: 分组使用的属性ID，None表示该二级分类的全部属性，空列表表示不分组
+            percentiles: 需要计算的百分位数(0-100)
+
+        Returns:
+            {ejflid, group_by, summary, groups}，二级分类不存在时返回None
+        """
+        self.log_service_call("get_m3_stats", ejflid=ejflid, group_sx_ids=group_sx_ids)
+        np = _import_numpy()
+
+        ejfl = get_dict_snapshot().ejfls.get(ejflid)
+        if not ejfl:
+            self.log_not_found("RcjEjfl", ejflid)
+            return None
+
+        sx_ids = list(ejfl.sxids)
+        if group_sx_ids is None:
+            group_sx_ids = sx_ids
+        unknown = [sx_id for sx_id in group_sx_ids if sx_id not in sx_ids]
+        if unknown:
+            raise ValueError(f"二级分类 {ejflid} 没有属性: {', '.join(unknown)}")
+        percentiles = tuple(sorted({int(p) if float(p).is_integer() else float(p) for p in percentiles}))
+
+        storage = current_app.config.get('CLASSIFY_SX_STORAGE', 'wide')
+        version = (classify_data_signature(db.session, ejflid), tuple(sx_ids), storage)
+        cache_key = (ejflid, tuple(group_sx_ids), percentiles)
+        cache = current_app.extensions.setdefault('m3_stats_cache', OrderedDict())
+        with _cache_lock:
+            cached = cache.get(cache_key)
+            if cached and cached[0] == version:
+                cache.move_to_end(cache_key)
+                return cached[1]
+
+        ids, prices, dates, key_columns = self._load_columns(ejflid, group_sx_ids, storage == 'sparse')
+        summary = compute_group_stats(prices, np.zeros(len(prices), dtype=np.int64), dates, ids, percentiles)
+        groups = []
+        if group_sx_ids:
+            groups = compute_group_stats(prices, encode_groups(key_columns, len(prices)), dates, ids, percentiles)
+        for group in summary:
+            group.pop('row')
+        for group in groups:
+            row = group.pop('row')
+            group['key'] = {sx_id: values[row] for sx_id, values in zip(group_sx_ids, key_columns)}
+        result = {
+            'ejflid': ejflid,
+            'group_by': list(group_sx_ids),
+            'summary': summary[0] if summary else None,
+            'groups': groups,
+        }
+
+        with _cache_lock:
+            cache[cache_key] = (version, result)
+            cache.move_to_end(cache_key)
+            while len(cache) > current_app.config.get('M3_STATS_CACHE_SIZE', 256):
+                cache.popitem(last=False)
+        self.log_service_result("get_m3_stats", result['groups'], ejflid=ejflid, rows=len(prices))
+        return result
+
+    def _load_columns(self, ejflid: str, group_sx_ids: List[str], sparse: bool):
+        """按批读取有单价的记录的 id、rcjdj、bjsj 及分组属性值，返回按列组织的列表"""
+        projection = ClassifyProjection([] if sparse else group_sx_ids, base_columns=('id', 'rcjdj', 'bjsj'))
+        result = db.session.execute(
+            projection.select()
+            .where(RcjMCClassifyBig.ejflid == ejflid, RcjMCClassifyBig.rcjdj.isnot(None))
+            .order_by(RcjMCClassifyBig.id)
+            .execution_options(yield_per=current_app.config.get('M3_STREAM_BATCH_SIZE', 1000))
+        )
+        ids, prices, dates = [], [], []
+        key_columns = [[] for _ in group_sx_ids]
+        for rows in result.partitions():
+            batch_ids = [row[0] for row in rows]
+            ids.extend(batch_ids)
+            prices.extend(row[1] for row in rows)
+            dates.extend(row[2] for row in rows)
+            if sparse:
+                sx_values = load_sx_values(db.session, batch_ids, group_sx_ids)
+                values = [sx_values[classify_id] for classify_id in batch_ids]
+            else:
+                values = [projection.sx_values(row) for row in rows]
+            for sx_id, column in zip(group_sx_ids, key_columns):
+                column.extend(item[sx_id] for item in values)
+        return ids, prices, dates, key_columns
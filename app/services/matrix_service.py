@@ -1,12 +1,12 @@
 """
 矩阵服务层 - 处理矩阵相关的业务逻辑
 """
-from typing import Optional, Dict, Any, List
-from app.models.models_13jt import File, Rcjhzmx
-from app.models.RcjMCClassifyBig import RcjMCClassifyBig
+from typing import Optional, Dict, Any, Iterator, List
+from app.models.models_13jt import File, Rcjhzmx, Toubiaoxx
+from app.models.RcjMCClassifyBig import RcjMCClassifyBig, RcjItem2ClassifyRleationship
 from app.models.dict import RcjYjfl, RcjEjfl
 from app.services.base_service import BaseService
-from app.dto.common import PaginatedResponse, PaginationMeta
+from app.dto.common import PaginatedResponse, PaginationMeta, CursorPaginatedResponse
 import json
 from app.dto.matrix_dto import (
     FileListQueryDTO,
@@ -15,7 +15,15 @@ from app.dto.matrix_dto import (
 )
 from app.utils.response_builder import ResponseBuilder
 import app.services.import_13jt_dynamic as import_13jt_dynamic
+from app.services.file_classify_summary import (
+    get_file_classify_summary, query_file_classify_counts, refresh_file_classify_summary
+)
+from app.services import dict_version
+from app.services.dict_cache import get_dict_snapshot
+from app.services.classify_projection import ClassifyProjection, load_sx_values
+import os
 import glob
+import time
 from datetime import datetime
 from app import db
 from flask import current_app
@@ -105,44 +113,38 @@ class MatrixService(BaseService):
                 self.log_not_found("File", fileid)
                 return []
             
-            # 2. 查询该文件关联的所有rcjhzmx
-            rcjhzmx_list = Rcjhzmx.query.filter_by(file_id=fileid).all()
-            if not rcjhzmx_list:
-                self.logger.info("No rcjhzmx found for file", fileid=fileid)
-                return []
-            
-            # 3. 收集所有classify_info并去重
-            classify_info_set = set()  # 用于去重的集合
+            # 2. 读取该文件按二级分类预先汇总的分类数量（见 file_classify_summary）
+            classify_counts = get_file_classify_summary(db.session, fileid)
+            if not classify_counts:
+                if not db.session.query(Rcjhzmx.query.filter_by(file_id=fileid).exists()).scalar():
+                    self.logger.info("No rcjhzmx found for file", fileid=fileid)
+                    return []
+                # 汇总表上线前导入的文件没有汇总行：回退到明细聚合，并补写汇总
+                classify_counts = sorted(query_file_classify_counts(db.session, fileid), key=lambda row: row[2])
+                if classify_counts:
+                    refresh_file_classify_summary(db.session, fileid)
+                    db.session.commit()
+                    self.log_database_operation("refresh", "file_classify_summary", fileid)
+            
+            # 3. 汇总一级、二级分类计数
             ejfl_count = {}  # 二级分类计数: {ejflid: count}
             yjfl_count = {}  # 一级分类计数: {yjflid: count}
             ejfl_info = {}   # 二级分类信息: {ejflid: {ejflmc, yjflid, yjflmc}}
             yjfl_info = {}   # 一级分类信息: {yjflid: {yjflmc}}
             
-            for rcjhzmx in rcjhzmx_list:
-                # 通过classify_info关系获取RcjMCClassifyBig
-                for classify_big in rcjhzmx.classify_info:
-                    if classify_big.ejflid and classify_big.ejflmc:
-                        # 使用classify_info.id进行去重
-                        if classify_big.id not in classify_info_set:
-                            classify_info_set.add(classify_big.id)
-                            
-                            # 统计二级分类
-                            if classify_big.ejflid not in ejfl_count:
-                                ejfl_count[classify_big.ejflid] = 0
-                                ejfl_info[classify_big.ejflid] = {
-                                    'ejflmc': classify_big.ejflmc,
-                                    'yjflid': classify_big.yjflid,
-                                    'yjflmc': classify_big.yjflmc
-                                }
-                            ejfl_count[classify_big.ejflid] += 1
-                            
-                            # 统计一级分类
-                            if classify_big.yjflid not in yjfl_count:
-                                yjfl_count[classify_big.yjflid] = 0
-                                yjfl_info[classify_big.yjflid] = {
-                                    'yjflmc': classify_big.yjflmc
-                                }
-                            yjfl_count[classify_big.yjflid] += 1
+            for yjflid, yjflmc, ejflid, ejflmc, count in classify_counts:
+                ejfl_count[ejflid] = count
+                ejfl_info[ejflid] = {
+                    'ejflmc': ejflmc,
+                    'yjflid': yjflid,
+                    'yjflmc': yjflmc
+                }
+                if yjflid not in yjfl_count:
+                    yjfl_count[yjflid] = 0
+                    yjfl_info[yjflid] = {
+                        'yjflmc': yjflmc
+                    }
+                yjfl_count[yjflid] += count
             
             # 4. 按一级分类分组构建树形结构
             yjfl_groups = {}
@@ -197,13 +199,9 @@ class MatrixService(BaseService):
             # 计算总数量（所有classify_info的总数）
             total_count = sum(yjfl_count.values())
             
-            # 获取文件名
-            file_obj = File.query.get(fileid)
-            filename = file_obj.filename if file_obj else f"文件{fileid}"
-            
-            # 创建根节点
+            # 创建根节点（文件信息已在第1步查询）
             root_node = TreeResponseDTO(
-                title=f"{filename} ({total_count})",
+                title=f"{file.filename} ({total_count})",
                 key=f"file-{fileid}",
                 children=tree_data,
                 count=total_count
@@ -219,243 +217,371 @@ class MatrixService(BaseService):
         """
         构建完整的分类树形结构 - 基于RcjYjfl和RcjEjfl
         
+        分类树只随DictService对一级、二级分类的增删改而变化，构建结果按字典版本号缓存在进程内；
+        其他进程的修改不会递增本进程的版本号，因此缓存最长保留CLASSIFICATION_TREE_CACHE_TTL秒。
+        
         Returns:
             List[TreeResponseDTO]: 分类树形结构
         """
         try:
-            # 查询所有一级分类，按ID排序
-            yjfls = RcjYjfl.query.order_by(RcjYjfl.id).all()
-            
-            tree_data = []
-            for yjfl in yjfls:
-                # 查询该一级分类下的所有二级分类，按ID排序
-                ejfls = RcjEjfl.query.filter_by(yjfl_id=yjfl.id).order_by(RcjEjfl.id).all()
-                
-                # 构建二级分类节点
-                ejfl_children = []
-                for ejfl in ejfls:
-                    # 统计该二级分类的数量（即该二级分类本身的数量）
-                    ejfl_count = 1  # 每个二级分类本身算1个
-                    
-                    ejfl_children.append(
-                        TreeResponseDTO(
-                            title=f"{ejfl.ejflmc or f'二级分类{ejfl.id}'} ({ejfl_count})",
-                            key=f"ejfl-{ejfl.id}",
-                            children=[],  # 可以在这里添加更深层的分类
-                            count=ejfl_count
-                        )
-                    )
-                
-                # 统计该一级分类下的总数量（即该一级分类下有多少个二级分类）
-                yjfl_total_count = len(ejfl_children)
-                
-                # 构建一级分类节点
-                yjfl_node = TreeResponseDTO(
-                    title=f"{yjfl.yjflmc or f'一级分类{yjfl.id}'} ({yjfl_total_count})",
-                    key=f"yjfl-{yjfl.id}",
-                    children=ejfl_children,
-                    count=yjfl_total_count
-                )
-                
-                tree_data.append(yjfl_node)
-            
-            # 计算总数量（所有一级分类的数量之和）
-            total_count = sum(node.count for node in tree_data)
-            
-            # 创建根节点
-            root_node = TreeResponseDTO(
-                title=f"完整分类树 ({total_count})",
-                key="root-complete",
-                children=tree_data,
-                count=total_count
-            )
-            
-            return [root_node]
+            cache = current_app.extensions.setdefault('classification_tree_cache', {})
+            version = dict_version.get_dict_version(dict_version.CLASSIFICATION)
+            ttl = current_app.config.get('CLASSIFICATION_TREE_CACHE_TTL', 60)
+            cached = cache.get('tree')
+            if cached and cached[0] == version and time.monotonic() - cached[1] < ttl:
+                return cached[2]
+            
+            tree_data = self._query_classification_tree()
+            if ttl > 0:
+                cache['tree'] = (version, time.monotonic(), tree_data)
+            return tree_data
             
         except Exception as e:
             self.log_error(e, {"method": "_build_classification_tree"})
             # 返回空列表而不是抛出异常，确保API不会崩溃
             return []
+    
+    def _query_classification_tree(self) -> List[TreeResponseDTO]:
+        """用一次外连接查询按ID顺序取出所有一级分类及其二级分类，构建分类树"""
+        rows = db.session.query(
+            RcjYjfl.id, RcjYjfl.yjflmc, RcjEjfl.id, RcjEjfl.ejflmc
+        ).outerjoin(
+            RcjEjfl, RcjEjfl.yjfl_id == RcjYjfl.id
+        ).order_by(
+            RcjYjfl.id, RcjEjfl.id
+        ).all()
+        
+        # 按一级分类分组，行已按一级、二级分类ID排序
+        yjfl_groups = {}  # {yjfl_id: (yjflmc, [(ejfl_id, ejflmc), ...])}
+        for yjfl_id, yjflmc, ejfl_id, ejflmc in rows:
+            ejfls = yjfl_groups.setdefault(yjfl_id, (yjflmc, []))[1]
+            if ejfl_id is not None:
+                ejfls.append((ejfl_id, ejflmc))
+        
+        tree_data = []
+        for yjfl_id, (yjflmc, ejfls) in yjfl_groups.items():
+            # 构建二级分类节点，每个二级分类本身算1个
+            ejfl_children = [
+                TreeResponseDTO(
+                    title=f"{ejflmc or f'二级分类{ejfl_id}'} (1)",
+                    key=f"ejfl-{ejfl_id}",
+                    children=[],  # 可以在这里添加更深层的分类
+                    count=1
+                )
+                for ejfl_id, ejflmc in ejfls
+            ]
+            
+            # 统计该一级分类下的总数量（即该一级分类下有多少个二级分类）
+            yjfl_total_count = len(ejfl_children)
+            
+            # 构建一级分类节点
+            tree_data.append(
+                TreeResponseDTO(
+                    title=f"{yjflmc or f'一级分类{yjfl_id}'} ({yjfl_total_count})",
+                    key=f"yjfl-{yjfl_id}",
+                    children=ejfl_children,
+                    count=yjfl_total_count
+                )
+            )
+        
+        # 计算总数量（所有一级分类的数量之和）
+        total_count = sum(node.count for node in tree_data)
+        
+        # 创建根节点
+        root_node = TreeResponseDTO(
+            title=f"完整分类树 ({total_count})",
+            key="root-complete",
+            children=tree_data,
+            count=total_count
+        )
+        
+        return [root_node]
         
     def get_rcj_mc_classifies_by_fileid(self, fileid: str, ejflid: str) -> List[any]:
         """
         根据文件ID、二级分类ID和一级分类ID获取人材机名称分类列表
+        
+        只查询返回需要的列：rcjhzmx经关联表连接RcjMCClassifyBig，在SQL中按二级分类过滤，
+        RcjMCClassifyBig只取该二级分类属性对应的sx_列；编制时间按经济标一次查出。
+        同一个分类被多条rcjhzmx引用时只返回第一条（按rcjhzmx.id）。
         """
         try:
-            rcjhzmx_list = Rcjhzmx.query.filter_by(file_id=fileid).all()
-            sxs = RcjEjfl.query.filter_by(id=ejflid).first()._sxs
-
-            if not rcjhzmx_list:
-                self.logger.info("No rcjhzmx found for file", fileid=fileid)
+            ejfl = get_dict_snapshot().ejfls.get(ejflid)
+            if not ejfl:
+                self.log_not_found("RcjEjfl", ejflid)
+                return []
+            sparse = self._sx_storage() == 'sparse'
+            projection = ClassifyProjection(
+                [] if sparse else ejfl.sxids, base_columns=('id', 'cleaned_rcjmc', 'parsed_rcjmc')
+            )
+            
+            link = RcjItem2ClassifyRleationship
+            rows = db.session.execute(
+                projection.select(
+                    Rcjhzmx.id,
+                    Rcjhzmx.mc,
+                    Rcjhzmx.dw,
+                    Rcjhzmx.dj,
+                    Rcjhzmx.jingjibiao_id
+                ).join(
+                    link, link.c.rcjhzmx_id == Rcjhzmx.id
+                ).join(
+                    RcjMCClassifyBig, RcjMCClassifyBig.id == link.c.rcjmcclassifybig_id
+                ).where(
+                    Rcjhzmx.file_id == fileid,
+                    RcjMCClassifyBig.ejflid == ejflid
+                ).order_by(
+                    Rcjhzmx.id, RcjMCClassifyBig.id
+                )
+            ).all()
+            
+            if not rows:
+                self.logger.info("No rcjmcclassify found for file", fileid=fileid, ejflid=ejflid)
                 return []
-            # 对所有classify_big去重后统计
+            
+            # 每个经济标的编制时间取其第一条投标信息
+            bztimes = {}
+            for jingjibiao_id, bztime in db.session.query(
+                Toubiaoxx.jingjibiao_id, Toubiaoxx.bztime
+            ).filter(
+                Toubiaoxx.file_id == fileid
+            ).order_by(Toubiaoxx.id):
+                bztimes.setdefault(jingjibiao_id, bztime)
+            
+            # 对所有classify_big去重
             unique_classify_big_set = set()
             resp_list = []
-            for rcjhzmx in rcjhzmx_list:
-                classify_big_list = rcjhzmx.classify_info
-                for classify_big in classify_big_list:
-                    if classify_big.ejflid == ejflid:
-                        if classify_big.id not in unique_classify_big_set:
-                            unique_classify_big_set.add(classify_big.id)
+            classify_big_ids = []
+            for row in rows:
+                rcjhzmx_id, mc, dw, dj, jingjibiao_id, classify_big_id, cleaned_rcjmc, parsed_rcjmc = row[:8]
+                if classify_big_id in unique_classify_big_set:
+                    continue
+                unique_classify_big_set.add(classify_big_id)
                 
-                            resp_item = {}
-
-                            resp_item['id'] = rcjhzmx.id
-                            resp_item['original_rcjmc'] = rcjhzmx.mc
-                            resp_item['dw'] = rcjhzmx.dw
-                            resp_item['dj'] = rcjhzmx.dj
-                            resp_item['bjsj'] = rcjhzmx.jingjibiao.toubiaoxx[0].bztime
-                            resp_item['cleaned_rcjmc'] = classify_big.cleaned_rcjmc
-                            resp_item['parsed_rcjmc'] = classify_big.parsed_rcjmc
-                            
-                            for sx in sxs:
-                                # 动态获取属性值，例如sx_0001、sx_0002等
-                                sx_attr = f'sx_{sx.id:0>4}'
-                                resp_item[sx.id] = getattr(classify_big, sx_attr, None)
-                            resp_list.append(resp_item)
-
+                resp_item = {
+                    'id': rcjhzmx_id,
+                    'original_rcjmc': mc,
+                    'dw': dw,
+                    'dj': dj,
+                    'bjsj': bztimes.get(jingjibiao_id),
+                    'cleaned_rcjmc': cleaned_rcjmc,
+                    'parsed_rcjmc': parsed_rcjmc,
+                }
+                resp_item.update(projection.sx_values(row))
+                resp_list.append(resp_item)
+                classify_big_ids.append(classify_big_id)
+            
+            if sparse:
+                sx_values = load_sx_values(db.session, classify_big_ids, ejfl.sxids)
+                for resp_item, classify_big_id in zip(resp_list, classify_big_ids):
+                    resp_item.update(sx_values[classify_big_id])
+            
             return resp_list
         except Exception as e:
             self.log_error(e, {"method": "get_rcj_mc_classifies_by_fileid", "fileid": fileid, "ejflid": ejflid})
             return []
-        
+    
     def get_m3(self, ejflid: str) -> List[any]:
         """
         获取M3
+        
+        只查询基础列和该二级分类属性对应的sx_列，不加载整行ORM对象
         """
         try:
-            m3_list = RcjMCClassifyBig.query.filter_by(ejflid=ejflid).all()
-            sxs = RcjEjfl.query.filter_by(id=ejflid).first()._sxs
-
-            if not m3_list:
-                self.logger.info("No m3 found for ejflid", ejflid=ejflid)
+            ejfl = get_dict_snapshot().ejfls.get(ejflid)
+            if not ejfl:
+                self.log_not_found("RcjEjfl", ejflid)
                 return []
+            resp_list = [item for batch in self._iter_m3_batches(ejfl) for item in batch]
             
-            resp_list = []
-            for m3 in m3_list:
-                resp_item = {}
-                resp_item['id'] = m3.id
-                resp_item['original_rcjmc'] = m3.original_rcjmc
-                resp_item['dw'] = m3.rcjdw
-                resp_item['dj'] = m3.rcjdj
-                resp_item['bjsj'] = m3.bjsj.strftime('%Y-%m-%d') if m3.bjsj else None
-                resp_item['cleaned_rcjmc'] = m3.cleaned_rcjmc
-                resp_item['parsed_rcjmc'] = m3.parsed_rcjmc
-                resp_item['ejflid'] = m3.ejflid
-                resp_item['yjflid'] = m3.yjflid
-                resp_item['yjflmc'] = m3.yjflmc
-                resp_item['ejflmc'] = m3.ejflmc
-                resp_item['sjjhflid'] = m3.sjjhflid
-                resp_item['sjjhflmc'] = m3.sjjhflmc
-                resp_item['sjjhflzt'] = m3.sjjhflzt
-                for sx in sxs:
-                    sx_attr = f'sx_{sx.id:0>4}'
-                    resp_item[sx.id] = getattr(m3, sx_attr, None)
-                resp_list.append(resp_item)
-            
+            if not resp_list:
+                self.logger.info("No m3 found for ejflid", ejflid=ejflid)
+                return []
             return resp_list
         except Exception as e:
             self.log_error(e, {"method": "get_m3", "ejflid": ejflid})
             return []
+    
+    def get_m3_page(self, ejflid: str, after_id: Optional[int] = None,
+                    limit: int = 100) -> CursorPaginatedResponse[Dict[str, Any]]:
+        """
+        按id游标分页获取M3
+        
+        Args:
+            ejflid: 二级分类ID
+            after_id: 只返回id大于该值的记录，第一页不传
+            limit: 每页数量
+            
+        Returns:
+            CursorPaginatedResponse: 当前页及下一页的after_id（没有下一页时为None）
+        """
+        self.log_service_call("get_m3_page", ejflid=ejflid, after_id=after_id, limit=limit)
+        try:
+            ejfl = get_dict_snapshot().ejfls.get(ejflid)
+            if not ejfl:
+                self.log_not_found("RcjEjfl", ejflid)
+                return CursorPaginatedResponse(data=[], limit=limit)
+            
+            # 多取一条判断是否还有下一页
+            items = [item for batch in self._iter_m3_batches(ejfl, after_id, limit + 1) for item in batch]
+            next_after_id = None
+            if len(items) > limit:
+                items = items[:limit]
+                next_after_id = items[-1]['id']
+            
+            result = CursorPaginatedResponse(data=items, limit=limit, next_after_id=next_after_id)
+            self.log_service_result("get_m3_page", result, count=len(items))
+            return result
+        except Exception as e:
+            self.log_error(e, {"method": "get_m3_page", "ejflid": ejflid, "after_id": after_id})
+            raise
+    
+    def iter_m3(self, ejflid: str, after_id: Optional[int] = None, limit: Optional[int] = None,
+                batch_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        逐条生成M3记录，用于流式响应
+        
+        查询使用服务端游标按batch_size分批读取，内存占用与记录总数无关。
+        """
+        self.log_service_call("iter_m3", ejflid=ejflid, after_id=after_id, limit=limit)
+        ejfl = get_dict_snapshot().ejfls.get(ejflid)
+        if not ejfl:
+            self.log_not_found("RcjEjfl", ejflid)
+            return
+        batch_size = batch_size or current_app.config.get('M3_STREAM_BATCH_SIZE', 1000)
+        for batch in self._iter_m3_batches(ejfl, after_id, limit, batch_size):
+            yield from batch
+    
+    def _iter_m3_batches(self, ejfl, after_id: Optional[int] = None, limit: Optional[int] = None,
+                         batch_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        按id顺序查询二级分类下的M3记录，逐批生成响应字典列表
+        
+        batch_size为None时一次取出所有结果，否则以yield_per使用服务端游标分批读取；
+        稀疏存储的属性值按批一次查询。
+        """
+        sparse = self._sx_storage() == 'sparse'
+        projection = ClassifyProjection([] if sparse else ejfl.sxids)
+        stmt = projection.select().where(RcjMCClassifyBig.ejflid == ejfl.id)
+        if after_id is not None:
+            stmt = stmt.where(RcjMCClassifyBig.id > after_id)
+        stmt = stmt.order_by(RcjMCClassifyBig.id)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        
+        result = db.session.execute(
+            stmt.execution_options(yield_per=batch_size) if batch_size else stmt
+        )
+        for rows in (result.partitions() if batch_size else [result.all()]):
+            batch = [self._m3_item(projection, row) for row in rows]
+            if sparse and batch:
+                sx_values = load_sx_values(db.session, [item['id'] for item in batch], ejfl.sxids)
+                for resp_item in batch:
+                    resp_item.update(sx_values[resp_item['id']])
+            yield batch
+    
+    def _sx_storage(self) -> str:
+        """属性值存储方式，见 classify_projection.SX_STORAGE_MODES"""
+        return current_app.config.get('CLASSIFY_SX_STORAGE', 'wide')
+    
+    def _m3_item(self, projection: ClassifyProjection, row) -> Dict[str, Any]:
+        """M3投影查询的一行转换为响应字典"""
+        m3 = projection.base_values(row)
+        resp_item = {
+            'id': m3['id'],
+            'original_rcjmc': m3['original_rcjmc'],
+            'dw': m3['rcjdw'],
+            'dj': m3['rcjdj'],
+            'bjsj': m3['bjsj'].strftime('%Y-%m-%d') if m3['bjsj'] else None,
+            'cleaned_rcjmc': m3['cleaned_rcjmc'],
+            'parsed_rcjmc': m3['parsed_rcjmc'],
+            'ejflid': m3['ejflid'],
+            'yjflid': m3['yjflid'],
+            'yjflmc': m3['yjflmc'],
+            'ejflmc': m3['ejflmc'],
+            'sjjhflid': m3['sjjhflid'],
+            'sjjhflmc': m3['sjjhflmc'],
+            'sjjhflzt': m3['sjjhflzt'],
+        }
+        resp_item.update(projection.sx_values(row))
+        return resp_item
         
     def parse_file(self, fileid: str) -> bool:
         """
         解析文件
         """
         try:
+            self.import_file(fileid)
+            return True
+        except Exception as e:
+            self.log_error(e, {"method": "parse_file", "fileid": fileid})
+            print(f"处理文件 {fileid} 时出错: {e}\r\n")
+            return False
 
-            # DATABASE_URL = "sqlite:///db.sqlite"
+    def import_file(self, fileid: str, engine: str = 'bulk', progress_callback=None,
+                    mode: str = 'skip') -> Dict[str, int]:
+        """
+        将已上传的13jt文件导入到origin_13jt_*表，出错时抛出异常
 
-            # # 创建数据库引擎
-            # if "mysql" in DATABASE_URL.lower():
-            #     engine = import_13jt_dynamic.create_engine(
-            #     DATABASE_URL, 
-            #     echo=False,
-            #     pool_pre_ping=True,
-            #     pool_recycle=3600,
-            #     connect_args={
-            #             "connect_timeout": 30,
-            #             "read_timeout": 30,
-            #             "write_timeout": 30
-            #         }
-            #     )
-            # else:
-            #     engine = import_13jt_dynamic.create_engine(
-            #         DATABASE_URL, 
-            #         echo=False,
-            #         pool_pre_ping=True,
-            #         pool_recycle=3600,
-            #         connect_args={
-            #             "timeout": 30,
-            #             "check_same_thread": False
-            #         }
-            #     )
-            
-            # 创建所有表
-            # db.model.metadata.create_all(engine)
-            
-            # 获取所有模型类
-            models = import_13jt_dynamic.get_all_models()
-            print(f"找到 {len(models)} 个模型类")
-            
-            # 创建会话
+        Args:
+            fileid: 文件ID
+            engine: 导入引擎，见import_13jt_dynamic.import_13jt_file
+            progress_callback: 每次批量写入后以 {表名: 累计行数} 回调
+            mode: skip - 已导入过则跳过；replace - 删除该文件已导入的行后重新导入
 
-            session = db.session
-            
-            # 是否清空所有表
-            # if args.reset:
-            #     print("[警告] 正在清空所有表数据...")
-            #     clear_all_tables(session, Base)
-            #     print("所有表数据已清空。")
-            
-            # 获取13jt文件列表
-            directory = upload_dir = current_app.config.get('UPLOAD_FOLDER', 'uploads')+'/'
-            filename = File.query.get(fileid).hash+'.13jt'
+        Returns:
+            Dict[str, int]: 各表写入的行数（跳过时为导入清单中记录的行数）
+        """
+        self.log_service_call("import_file", fileid=fileid, engine=engine, mode=mode)
 
-            import os
-            file = os.path.join(directory, filename)
-            
-            if not file:
-                print(f"在 {directory} 目录下没有找到{filename}文件")
-                return
-            
-            print(f"找到 {file} ")
+        file_path = self._get_13jt_path(fileid)
+        models = import_13jt_dynamic.get_all_models()
+        session = db.session
 
-            files = [file]
-            
-            # 导入所有文件
-            success_count = 0
-            total_start_time = datetime.now()
-            
-            for i, file_path in enumerate(files, 1):
-                try:
-                    file_start_time = datetime.now()
-                    import_13jt_dynamic.import_13jt_file(file_path, models, session, fileid)
-                    file_end_time = datetime.now()
-                    file_duration = (file_end_time - file_start_time).total_seconds()
-                    print(f"文件 {i}/{len(files)} 处理完成，耗时: {file_duration:.2f}秒")
-                    success_count += 1
-                except Exception as e:
-                    print(f"处理文件 {file_path} 时出错: {e}\r\n")
-                    raise
-            
-            total_end_time = datetime.now()
-            total_duration = (total_end_time - total_start_time).total_seconds()
-            
-            print(f"\n导入完成: {success_count}/{len(files)} 个文件成功导入")
-            print(f"总耗时: {total_duration:.2f}秒")
-            print(f"平均每个文件: {total_duration/len(files):.2f}秒")
-            print(f"-"*100)
-            
-            # 关闭会话
-            session.close()
+        start_time = datetime.now()
+        counts = import_13jt_dynamic.import_13jt_file(
+            file_path, models, session, int(fileid), engine=engine, progress_callback=progress_callback, mode=mode
+        )
+        duration = (datetime.now() - start_time).total_seconds()
+
+        # 关闭会话
+        session.close()
+
+        self.logger.info("13jt file imported", fileid=fileid, engine=engine, mode=mode, duration=round(duration, 2))
+        self.log_service_result("import_file", counts, fileid=fileid)
+        return counts or {}
+
+    def verify_file(self, fileid: str) -> Dict[str, Any]:
+        """
+        比较文件内容、导入清单与数据库中该文件各表的行数，不写数据库
+
+        Returns:
+            Dict[str, Any]: 见import_13jt_dynamic.verify_13jt_import
+        """
+        self.log_service_call("verify_file", fileid=fileid)
+
+        file_path = self._get_13jt_path(fileid)
+        models = import_13jt_dynamic.get_all_models()
+        result = import_13jt_dynamic.verify_13jt_import(file_path, models, db.session, int(fileid))
+
+        self.log_service_result("verify_file", result, fileid=fileid)
+        return result
+
+    def _get_13jt_path(self, fileid: str) -> str:
+        """获取已上传13jt文件在磁盘上的路径，文件记录或文件不存在时抛出FileNotFoundError"""
+        file_obj = File.query.get(fileid)
+        if not file_obj:
+            raise FileNotFoundError(f"文件ID {fileid} 不存在")
+
+        # 上传文件以 hash + 扩展名 存放在上传目录（与UploadService的目录解析方式一致）
+        directory = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+        if not os.path.isabs(directory):
+            directory = os.path.join(current_app.root_path, '..', directory)
+        file_path = os.path.join(directory, file_obj.hash + '.13jt')
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"在 {directory} 目录下没有找到{file_obj.hash}.13jt文件")
+        return file_path
 
-            return True
-        except Exception as e:
-            self.log_error(e, {"method": "parse_file", "fileid": fileid})
-            print(f"处理文件 {fileid} 时出错: {e}\r\n")
-            return False
-        
     def analysis_file(self, fileid: str) -> bool:
         """
         分析文件
@@ -0,0 +1,181 @@
+"""
+人材机名称 → 二级分类的进程内查找索引
+
+导入文件后按 Rcjhzmx.mc 确定二级分类，逐个名称查询 dict_rcjmc2ejflid 太慢。NameIndex 把
+dict_rcjmc2ejflid（原始名称）和 dict_rcjmc_classify（清洗后名称）一次读入两个哈希表：
+
+- exact: 原样的名称 → 二级分类
+- normalized: normalize_name 之后的名称 → 二级分类，原样查不到时再查
+
+同一名称两张表都有时以名称映射表为准。索引按 dict_version.NAME_MAPPING 的版本号判断是否过期，
+DictService 修改两张表后下次查找时重新构建。DICT_CACHE_TTL 只决定多久核对一次两张表的行数和最大update_time，
+用来发现其他进程（未配置Redis版本号时）的修改，没有变化时继续使用原索引，不重新构建。
+重新构建期间其他线程继续使用旧索引，只有第一次构建时需要等待。
+"""
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from app import db
+from app.models.dict import RcjMC2Ejflid, RcjMCClassify
+from app.services import dict_version
+from app.utils.tool import clean_string
+
+# 查找结果的来源
+SOURCE_MAPPING = 'mc2ejflid'
+SOURCE_CLASSIFY = 'classify'
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(name: str) -> str:
+    """名称的归一形式：按 clean_string 清洗（全角转半角、统一标点和大小写等）后去掉所有空白"""
+    return clean_string(name).replace(' ', '')
+
+
+@dataclass(frozen=True)
+class NameIndex:
+    """某一版本的名称索引，值为 (二级分类ID, 来源)"""
+    version: int
+    loaded_at: float
+    exact: Mapping[str, Tuple[str, str]]
+    normalized: Mapping[str, Tuple[str, str]]
+    # 构建前两张表的 (行数, 最大update_time)，见 name_index_signature
+    signature: Tuple = ()
+
+    def lookup(self, name: Optional[str]) -> Tuple[Optional[Tuple[str, str]], Optional[str]]:
+        """
+        查找一个名称
+
+        Returns:
+            ((二级分类ID, 来源), 匹配方式 exact/normalized)，找不到时为 (None, None)
+        """
+        if not name:
+            return None, None
+        found = self.exact.get(name)
+        if found is not None:
+            return found, 'exact'
+        found = self.normalized.get(normalize_name(name))
+        if found is not None:
+            return found, 'normalized'
+        return None, None
+
+
+def _iter_names(executor, name_column, ejflid_column, batch_size: int) -> Iterable[Tuple[str, str]]:
+    result = executor.execute(
+        select(name_column, ejflid_column)
+        .where(name_column.isnot(None), ejflid_column.isnot(None), ejflid_column != '')
+        .execution_options(yield_per=batch_size)
+    )
+    for rows in result.partitions():
+        yield from rows
+
+
+def name_index_signature(executor) -> Tuple:
+    """名称分类表和名称映射表的 (行数, 最大update_time)，新增、删除或通过ORM修改记录都会改变其中至少一项"""
+    return tuple(
+        tuple(executor.execute(select(func.count(), func.max(model.update_time))).one())
+        for model in (RcjMCClassify, RcjMC2Ejflid)
+    )
+
+
+def build_name_index(executor, version: int = 0, batch_size: int = 10000) -> NameIndex:
+    """读取名称映射表和名称分类表构建索引"""
+    # 在读取之前取标识，构建期间的修改会在下次核对时发现
+    signature = name_index_signature(executor)
+    exact = {}
+    normalized = {}
+    # 先写名称分类，再用名称映射覆盖，同名时以名称映射为准
+    sources = (
+        (SOURCE_CLASSIFY, RcjMCClassify.cleaned_rcj_original_mc, RcjMCClassify.ejflid),
+        (SOURCE_MAPPING, RcjMC2Ejflid.orignal_rcjmc, RcjMC2Ejflid.ejflid),
+    )
+    for source, name_column, ejflid_column in sources:
+        values = {}
+        for name, ejflid in _iter_names(executor, name_column, ejflid_column, batch_size):
+            # 同一二级分类的结果共用一个元组
+            value = values.get(ejflid)
+            if value is None:
+                value = values[ejflid] = (ejflid, source)
+            exact[name] = value
+            normalized[normalize_name(name)] = value
+    return NameIndex(
+        version=version,
+        loaded_at=time.time(),
+        exact=MappingProxyType(exact),
+        normalized=MappingProxyType(normalized),
+        signature=signature,
+    )
+
+
+class NameIndexCache:
+    """一个应用实例的名称索引"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: Optional[NameIndex] = None
+        self._expires_at = 0.0
+
+    def get_index(self) -> NameIndex:
+        """返回当前版本的索引，版本号变化或超过DICT_CACHE_TTL且两张表有变化时重新构建"""
+        version = dict_version.get_dict_version(dict_version.NAME_MAPPING)
+        index = self._index
+        if index is not None and index.version == version and time.monotonic() < self._expires_at:
+            return index
+
+        # 已有索引时只由一个线程核对、重新构建，其余线程不等待，继续使用旧索引
+        if not self._lock.acquire(blocking=index is None):
+            return index
+        try:
+            ttl = current_app.config.get('DICT_CACHE_TTL', 60)
+            index = self._index
+            if index is not None and index.version == version:
+                if time.monotonic() < self._expires_at:
+                    return index
+                if name_index_signature(db.session) == index.signature:
+                    self._expires_at = time.monotonic() + ttl
+                    return index
+            index = build_name_index(db.session, version)
+            if ttl > 0:
+                self._index = index
+                self._expires_at = time.monotonic() + ttl
+            return index
+        finally:
+            self._lock.release()
+
+
+def get_name_index() -> NameIndex:
+    """当前应用实例的名称索引"""
+    return current_app.extensions.setdefault('name_index', NameIndexCache()).get_index()
+
+
+def lookup_names(names: Iterable[Optional[str]], ejfl_names: Mapping[str, Any] = None) -> List[Dict[str, Any]]:
+    """
+    批量查找名称对应的二级分类
+
+    Args:
+        names: 待查找的名称
+        ejfl_names: 二级分类ID → 带 ejflmc 属性的对象（如字典快照的 ejfls），提供时结果中带二级分类名称
+
+    Returns:
+        与names一一对应的 {name, ejflid, ejflmc, match, source}，找不到时 ejflid/match/source 为None
+    """
+    index = get_name_index()
+    results = []
+    for name in names:
+        found, match = index.lookup(name)
+        ejflid, source = found if found is not None else (None, None)
+        ejfl = ejfl_names.get(ejflid) if ejfl_names is not None and ejflid else None
+        results.append({
+            'name': name,
+            'ejflid': ejflid,
+            'ejflmc': ejfl.ejflmc if ejfl is not None else None,
+            'match': match,
+            'source': source,
+        })
+    return results
@@ -0,0 +1,225 @@
+"""
+人材机名称模糊搜索
+
+在 dict_rcjmc_classify.cleaned_rcj_original_mc 和 dict_rcjmc2ejflid.orignal_rcjmc 上建立字符二元组（bigram）倒排索引，
+按与查询共有的二元组数计算 Dice 系数 2|Q∩D| / (|Q| + |D|) 返回得分最高的k个名称，
+用于没有原样匹配的名称的候选推荐，代替全表扫描的 LIKE '%…%'。
+
+- 名称先按 normalize_name 归一，再切分为相邻两个字符组成的二元组，单个字符的名称使用该字符本身；
+  中文没有分词也能按字匹配
+- 候选按二元组的倒排表从短到长累计，超过 DICT_SEARCH_MAX_CANDIDATES 后更常见的二元组只给已有候选计数，
+  不再引入新候选；候选的得分是准确的，但只含常见二元组的查询可能漏掉得分更高的名称
+- 索引第一次搜索时全量构建，此后在 dict_version.NAME_MAPPING 的版本号变化或超过 DICT_CACHE_TTL 时增量更新：
+  按 update_time 读取新增、修改的行，行数与索引不一致时再按ID找出已删除的行
+- 提交晚于 REFRESH_OVERLAP 的事务写入的行不会被增量更新读到：增量更新后表的行数或最大ID仍与索引不一致时，
+  或距上次全量读取超过 DICT_SEARCH_RESYNC_SECONDS 时，重新全量读取该来源
+"""
+import heapq
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+from typing import Any, Dict, List, Optional, Set
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from app import db
+from app.models.dict import RcjMC2Ejflid, RcjMCClassify
+from app.services import dict_version
+from app.services.name_index import SOURCE_CLASSIFY, SOURCE_MAPPING, normalize_name
+
+# 增量更新时从上次读到的最大update_time往前多读的时长，容纳各进程时钟的偏差和提交较晚的事务
+REFRESH_OVERLAP = timedelta(seconds=2)
+
+# (来源, 表, 名称列)
+SEARCH_SOURCES = (
+    (SOURCE_CLASSIFY, RcjMCClassify.__table__, 'cleaned_rcj_original_mc'),
+    (SOURCE_MAPPING, RcjMC2Ejflid.__table__, 'orignal_rcjmc'),
+)
+
+
+def bigrams(name: str) -> Set[str]:
+    """归一后名称的字符二元组集合"""
+    text = normalize_name(name)
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class NameSearchIndex:
+    """
+    名称的二元组倒排索引
+
+    每个名称记录对应一个内部文档编号，倒排表为 二元组 → 文档编号集合；删除的文档编号不再复用。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._doc_ids: Dict[tuple, int] = {}   # (来源, 记录ID) → 文档编号
+        self._names: List[Optional[str]] = []
+        self._grams: List[Optional[frozenset]] = []
+        self._metas: List[Optional[tuple]] = []  # (来源, 记录ID, 二级分类ID)
+        self._postings: Dict[str, Set[int]] = {}
+        self._watermarks: Dict[str, Any] = {}
+        self._counts: Counter = Counter()
+        self._max_ids: Dict[str, int] = {}       # 来源 → 索引过的最大记录ID
+        self._resync_at: Dict[str, float] = {}   # 来源 → 下次全量读取的时间
+        self.version: Optional[int] = None
+        self._expires_at = 0.0
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def _put(self, source: str, record_id: int, name: Optional[str], ejflid: Optional[str]):
+        key = (source, record_id)
+        doc = self._doc_ids.get(key)
+        if doc is not None and self._names[doc] == name:
+            self._metas[doc] = (source, record_id, ejflid)
+            return
+        if doc is not None:
+            self._remove(key)
+        if not name:
+            return
+        # 归一后为空的名称没有二元组，不会被搜到，但仍计入索引行数以便发现删除
+        grams = frozenset(bigrams(name))
+        doc = len(self._names)
+        self._doc_ids[key] = doc
+        self._names.append(name)
+        self._grams.append(grams)
+        self._metas.append((source, record_id, ejflid))
+        self._counts[source] += 1
+        self._max_ids[source] = max(self._max_ids.get(source, record_id), record_id)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(doc)
+
+    def _remove(self, key: tuple):
+        doc = self._doc_ids.pop(key)
+        for gram in self._grams[doc]:
+            posting = self._postings[gram]
+            posting.discard(doc)
+            if not posting:
+                del self._postings[gram]
+        self._names[doc] = self._grams[doc] = self._metas[doc] = None
+        self._counts[key[0]] -= 1
+
+    def _read(self, executor, source: str, table, name_column: str, batch_size: int, full: bool) -> int:
+        """读取一个来源的行，full为True时读取全部行并移除表中已不存在的记录，返回读取的行数"""
+        watermark = None if full else self._watermarks.get(source)
+        statement = select(table.c.id, table.c[name_column], table.c.ejflid, table.c.update_time)
+        if watermark is not None:
+            # 重复读到的行内容不变时只更新二级分类，不影响结果
+            statement = statement.where(table.c.update_time >= watermark - REFRESH_OVERLAP)
+        seen = set()
+        result = executor.execute(statement.execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            for record_id, name, ejflid, update_time in rows:
+                self._put(source, record_id, name, ejflid)
+                seen.add(record_id)
+                if watermark is None or (update_time is not None and update_time > watermark):
+                    watermark = update_time
+        if full:
+            for key in [key for key in self._doc_ids if key[0] == source and key[1] not in seen]:
+                self._remove(key)
+        self._watermarks[source] = watermark
+        return len(seen)
+
+    def refresh(self, executor, version: Optional[int] = None, ttl: int = 0, batch_size: int = 10000,
+                resync_interval: int = 600) -> int:
+        """
+        读取上次更新之后新增、修改、删除的行，更新索引
+
+        Returns:
+            int: 读取的新增或修改的行数
+        """
+        with self._lock:
+            changed = 0
+            for source, table, name_column in SEARCH_SOURCES:
+                full = source not in self._watermarks or time.monotonic() >= self._resync_at.get(source, 0)
+                changed += self._read(executor, source, table, name_column, batch_size, full)
+
+                if not full:
+                    # 名称不为空的行都在索引中，索引比表多出的就是已删除的行
+                    indexed, max_id = executor.execute(
+                        select(func.count(), func.max(table.c.id)).select_from(table)
+                        .where(table.c[name_column].isnot(None), table.c[name_column] != '')
+                    ).one()
+                    if self._counts[source] > indexed:
+                        existing = set(executor.execute(select(table.c.id)).scalars())
+                        for key in [key for key in self._doc_ids if key[0] == source and key[1] not in existing]:
+                            self._remove(key)
+                    # 仍不一致说明有行的update_time早于本次读取的范围（事务提交较晚），重新全量读取
+                    if self._counts[source] != indexed or (max_id or 0) > self._max_ids.get(source, 0):
+                        full = True
+                        changed += self._read(executor, source, table, name_column, batch_size, full)
+                if full:
+                    self._resync_at[source] = time.monotonic() + resync_interval
+            self.version = version
+            self._expires_at = time.monotonic() + ttl
+            return changed
+
+    def is_current(self, version: int) -> bool:
+        return self.version == version and time.monotonic() < self._expires_at
+
+    def search(self, query: str, k: int = 10, max_candidates: int = 5000) -> List[Dict[str, Any]]:
+        """
+        返回与query最相似的k个名称 {name, source, id, ejflid, score}，按得分从高到低排列
+
+        得分相同时较短的名称在前。
+        """
+        grams = bigrams(query)
+        if not grams or k <= 0:
+            return []
+        with self._lock:
+            # 从最少见的二元组开始累计，放不下下一个倒排表后只给已有候选计数
+            postings = sorted((self._postings[gram] for gram in grams if gram in self._postings), key=len)
+            counts = Counter()
+            for posting in postings:
+                if not counts:
+                    counts.update(islice(posting, max_candidates))
+                elif len(counts) + len(posting) <= max_candidates:
+                    counts.update(posting)
+                else:
+                    counts.update(posting.intersection(counts))
+
+            # 共有c个二元组的名称至少有c个二元组，得分不超过 2c / (|Q| + c)；按c从大到小计算，
+            # 上界低于当前第k名的得分后不必再算
+            query_size = len(grams)
+            doc_grams, names = self._grams, self._names
+            best = []
+            floor = 0.0
+            for doc, shared in counts.most_common():
+                if 2 * shared < floor * (query_size + shared):
+                    break
+                size = len(doc_grams[doc])
+                if 2 * shared < floor * (query_size + size):
+                    continue
+                item = (2 * shared / (query_size + size), -len(names[doc]), -doc)
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+                if len(best) == k:
+                    floor = best[0][0]
+            results = []
+            for score, _, doc in sorted(best, reverse=True):
+                source, record_id, ejflid = self._metas[-doc]
+                results.append({
+                    'name': names[-doc],
+                    'source': source,
+                    'id': record_id,
+                    'ejflid': ejflid,
+                    'score': round(score, 4),
+                })
+            return results
+
+
+def get_name_search_index() -> NameSearchIndex:
+    """当前应用实例的搜索索引，版本号变化或超过DICT_CACHE_TTL时先增量更新"""
+    index = current_app.extensions.setdefault('name_search_index', NameSearchIndex())
+    version = dict_version.get_dict_version(dict_version.NAME_MAPPING)
+    if not index.is_current(version):
+        index.refresh(db.session, version, current_app.config.get('DICT_CACHE_TTL', 60),
+                      resync_interval=current_app.config.get('DICT_SEARCH_RESYNC_SECONDS', 600))
+    return index
@@ -0,0 +1,359 @@
+"""
+解析任务服务层 - 在后台线程池中执行13jt文件解析
+
+任务记录存放在独立的jobs库（SQLite）中:
+- 提交任务只插入一条pending记录并唤醒本进程的线程池，请求立即返回任务ID
+- 工作线程通过一条原子UPDATE认领任务，运行中的任务总数不超过PARSE_JOB_MAX_WORKERS，
+  多个gunicorn进程共享同一个jobs库时该上限同样生效
+- 认领任务时记录执行进程（主机名:pid），进程内的心跳线程定期更新其运行中任务的心跳时间；
+  导入卡在一条耗时很长的语句上时心跳照常更新，任务不会被当作中断
+- 只有执行进程已退出的running任务才被重置为pending：同一主机上检查pid是否存在，
+  其他主机上的进程超过PARSE_JOB_STALE_SECONDS没有心跳视为已退出
+- 应用启动时（PARSE_JOB_ASYNC、PARSE_JOB_AUTOSTART开启）即创建线程池和心跳线程，回收中断的任务，
+  遗留的pending任务被重新认领，不必等到下一次提交；此后心跳线程定期回收其他进程中断的任务
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from flask import current_app
+from sqlalchemy import inspect, select, text, update, func
+from app import db
+from app.models.parse_job import ParseJob
+from app.services.base_service import BaseService
+from app.dto.matrix_dto import ParseJobResponseDTO
+
+_executor = None
+_executor_lock = threading.Lock()
+# 本进程正在执行的任务ID
+_running_jobs = set()
+_running_lock = threading.Lock()
+
+
+class ParseJobService(BaseService):
+    """解析任务服务类"""
+
+    def submit_parse_job(self, fileid: str, mode: str = 'skip') -> ParseJobResponseDTO:
+        """
+        提交解析任务
+
+        Args:
+            fileid: 文件ID
+            mode: 重复导入的处理方式，skip或replace
+
+        Returns:
+            ParseJobResponseDTO: 新建的任务
+
+        Raises:
+            FileNotFoundError: 文件记录或已上传的文件不存在，不创建任务
+        """
+        from app.services.matrix_service import MatrixService
+
+        self.log_service_call("submit_parse_job", fileid=fileid, mode=mode)
+        try:
+            app = current_app._get_current_object()
+            MatrixService()._get_13jt_path(fileid)
+            _ensure_job_table()
+
+            job_id = uuid.uuid4().hex
+            now = datetime.now()
+            with _jobs_engine().begin() as conn:
+                conn.execute(ParseJob.__table__.insert().values(
+                    id=job_id, file_id=int(fileid), mode=mode, state='pending', create_time=now, update_time=now
+                ))
+            self.log_database_operation("CREATE", "ParseJob", job_id, fileid=fileid)
+
+            if app.config.get('PARSE_JOB_ASYNC', True):
+                _get_executor(app).submit(self.run_pending_jobs, app)
+            else:
+                self.run_pending_jobs(app)
+
+            result = self.get_parse_job(job_id)
+            self.log_service_result("submit_parse_job", result, job_id=job_id)
+            return result
+
+        except FileNotFoundError:
+            self.log_not_found("File", fileid)
+            raise
+        except Exception as e:
+            self.log_error(e, {"method": "submit_parse_job", "fileid": fileid})
+            raise
+
+    def get_parse_job(self, job_id: str) -> Optional[ParseJobResponseDTO]:
+        """根据ID获取解析任务"""
+        self.log_service_call("get_parse_job", job_id=job_id)
+        try:
+            _ensure_job_table()
+            with _jobs_engine().connect() as conn:
+                row = conn.execute(
+                    select(ParseJob.__table__).where(ParseJob.__table__.c.id == job_id)
+                ).mappings().first()
+            if not row:
+                self.log_not_found("ParseJob", job_id)
+                return None
+
+            result = _to_response_dto(row)
+            self.log_service_result("get_parse_job", result, job_id=job_id)
+            return result
+
+        except Exception as e:
+            self.log_error(e, {"method": "get_parse_job", "job_id": job_id})
+            raise
+
+    def run_pending_jobs(self, app) -> int:
+        """
+        工作线程入口：循环认领并执行pending任务，直到没有可认领的任务
+
+        Returns:
+            int: 本次执行的任务数
+        """
+        executed = 0
+        with app.app_context():
+            while True:
+                job = _claim_next_job(_max_workers(app))
+                if job is None:
+                    return executed
+                with _running_lock:
+                    _running_jobs.add(job['id'])
+                try:
+                    self._run_job(job['id'], job['file_id'], job['mode'])
+                finally:
+                    with _running_lock:
+                        _running_jobs.discard(job['id'])
+                executed += 1
+
+    def _run_job(self, job_id: str, file_id: int, mode: str = 'skip'):
+        """执行单个任务并记录结果"""
+        from app.services.matrix_service import MatrixService
+
+        self.logger.info("Parse job started", job_id=job_id, file_id=file_id, mode=mode)
+        try:
+            counts = MatrixService().import_file(
+                str(file_id),
+                progress_callback=lambda progress: _update_job(job_id, progress=json.dumps(progress)),
+                mode=mode
+            )
+            _update_job(job_id, state='success', progress=json.dumps(counts), finish_time=datetime.now())
+            self.logger.info("Parse job finished", job_id=job_id, file_id=file_id)
+        except Exception as e:
+            db.session.rollback()
+            self.log_error(e, {"method": "_run_job", "job_id": job_id, "file_id": file_id})
+            _update_job(job_id, state='failed', error=str(e), finish_time=datetime.now())
+
+
+def _jobs_engine():
+    """jobs库引擎，任务状态通过独立连接读写，不与导入事务共用"""
+    return db.engines['jobs']
+
+
+def _ensure_job_table():
+    """创建任务表，早期版本创建的表缺少的列（如owner、heartbeat_time）直接补上；每个应用实例检查一次"""
+    engine = _jobs_engine()
+    if current_app.extensions.get('parse_job_table') is engine:
+        return
+    table = ParseJob.__table__
+    table.create(engine, checkfirst=True)
+    existing = {column['name'] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.c:
+            if column.name not in existing:
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}'
+                ))
+    current_app.extensions['parse_job_table'] = engine
+
+
+def _owner() -> str:
+    """当前进程的标识，gunicorn预加载应用后fork出的worker各不相同"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _max_workers(app) -> int:
+    """同时运行的任务上限，未配置时PostgreSQL为2，其他数据库为1"""
+    max_workers = app.config.get('PARSE_JOB_MAX_WORKERS')
+    if max_workers:
+        return max_workers
+    return 2 if db.engine.dialect.name == 'postgresql' else 1
+
+
+def _get_executor(app):
+    """获取进程内线程池，首次创建时启动心跳线程并恢复已退出进程遗留的任务"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_max_workers(app), thread_name_prefix='parse-job')
+            threading.Thread(
+                target=_heartbeat_loop, args=(app, _executor), name='parse-job-heartbeat', daemon=True
+            ).start()
+            _recover_stale_jobs(app.config.get('PARSE_JOB_STALE_SECONDS', 600))
+            _executor.submit(ParseJobService().run_pending_jobs, app)
+        return _executor
+
+
+def _heartbeat_loop(app, executor):
+    """心跳线程：更新本进程运行中任务的心跳，回收其他进程中断的任务；线程池被替换后退出"""
+    interval = app.config.get('PARSE_JOB_HEARTBEAT_SECONDS', 30)
+    while True:
+        time.sleep(interval)
+        if _executor is not executor:
+            return
+        with app.app_context():
+            try:
+                _beat_running_jobs()
+                if _recover_stale_jobs(app.config.get('PARSE_JOB_STALE_SECONDS', 600)):
+                    executor.submit(ParseJobService().run_pending_jobs, app)
+            except Exception as e:
+                ParseJobService().log_error(e, {"method": "_heartbeat_loop"})
+
+
+def _beat_running_jobs() -> int:
+    """更新本进程运行中任务的心跳时间，返回更新的任务数"""
+    with _running_lock:
+        job_ids = list(_running_jobs)
+    if not job_ids:
+        return 0
+    table = ParseJob.__table__
+    with _jobs_engine().begin() as conn:
+        return conn.execute(
+            update(table)
+            .where(table.c.id.in_(job_ids), table.c.state == 'running', table.c.owner == _owner())
+            .values(heartbeat_time=datetime.now())
+        ).rowcount
+
+
+def start_parse_job_workers(app):
+    """应用启动时创建线程池，重置中断的任务并继续执行遗留的pending任务"""
+    with app.app_context():
+        try:
+            _ensure_job_table()
+            _get_executor(app)
+        except Exception as e:
+            # jobs库不可用时不影响应用启动，下一次提交任务时再重试
+            ParseJobService().log_error(e, {"method": "start_parse_job_workers"})
+
+
+def _recover_stale_jobs(stale_seconds: int) -> int:
+    """
+    将执行进程已退出的running任务重置为pending（其导入事务已随进程退出回滚）
+
+    Returns:
+        int: 重置的任务数
+    """
+    table = ParseJob.__table__
+    now = datetime.now()
+    deadline = now - timedelta(seconds=stale_seconds)
+    recovered = 0
+    with _jobs_engine().begin() as conn:
+        running = conn.execute(
+            select(table.c.id, table.c.owner, table.c.heartbeat_time, table.c.update_time)
+            .where(table.c.state == 'running')
+        ).all()
+        for job in running:
+            if _is_owner_alive(job, deadline):
+                continue
+            # 心跳在读取之后又有更新说明进程仍在运行，不重置
+            heartbeat = (
+                table.c.heartbeat_time == job.heartbeat_time if job.heartbeat_time is not None
+                else table.c.heartbeat_time.is_(None)
+            )
+            recovered += conn.execute(
+                update(table)
+                .where(table.c.id == job.id, table.c.state == 'running', heartbeat)
+                .values(state='pending', owner=None, heartbeat_time=None, update_time=now)
+            ).rowcount
+    return recovered
+
+
+def _is_owner_alive(job, deadline: datetime) -> bool:
+    """running任务的执行进程是否仍在运行"""
+    last_seen = job.heartbeat_time or job.update_time
+    if last_seen < deadline:
+        return False
+    host, _, pid = (job.owner or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        # 其他主机上的进程（及没有记录执行进程的旧任务）只能按心跳判断
+        return True
+    if int(pid) == os.getpid():
+        # pid与本进程相同但不在执行中的任务属于已退出的同pid进程（如容器重启）
+        with _running_lock:
+            return job.id in _running_jobs
+    return _pid_exists(int(pid))
+
+
+def _pid_exists(pid: int) -> bool:
+    if os.name != 'posix':
+        # Windows上os.kill会结束进程，不能用来探测，只按心跳判断
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _claim_next_job(max_running: int):
+    """
+    原子地认领最早的pending任务
+
+    运行中任务数的判断与状态修改在同一条UPDATE中完成，
+    多个线程或进程同时认领时不会超过max_running。
+    """
+    table = ParseJob.__table__
+    running = select(func.count()).select_from(table).where(table.c.state == 'running').scalar_subquery()
+    while True:
+        with _jobs_engine().begin() as conn:
+            candidate = conn.execute(
+                select(table.c.id, table.c.file_id, table.c.mode)
+                .where(table.c.state == 'pending')
+                .order_by(table.c.create_time)
+                .limit(1)
+            ).mappings().first()
+            if candidate is None:
+                return None
+
+            now = datetime.now()
+            claimed = conn.execute(
+                update(table)
+                .where(table.c.id == candidate['id'], table.c.state == 'pending', running < max_running)
+                .values(state='running', owner=_owner(), heartbeat_time=now, start_time=now, update_time=now)
+            ).rowcount
+            if claimed:
+                return dict(candidate)
+            # 未认领成功：已达并发上限则放弃，否则是被其他工作线程抢先，重试下一个
+            if conn.execute(select(running)).scalar() >= max_running:
+                return None
+
+
+def _update_job(job_id: str, **values):
+    values['update_time'] = datetime.now()
+    table = ParseJob.__table__
+    with _jobs_engine().begin() as conn:
+        conn.execute(update(table).where(table.c.id == job_id).values(**values))
+
+
+def _to_response_dto(row) -> ParseJobResponseDTO:
+    progress: Dict[str, int] = json.loads(row['progress']) if row['progress'] else {}
+    duration = None
+    if row['start_time']:
+        end_time = row['finish_time'] or datetime.now()
+        duration = round((end_time - row['start_time']).total_seconds(), 3)
+    return ParseJobResponseDTO(
+        id=row['id'],
+        file_id=row['file_id'],
+        mode=row['mode'],
+        state=row['state'],
+        progress=progress,
+        total_rows=sum(progress.values()),
+        error=row['error'],
+        create_time=row['create_time'],
+        start_time=row['start_time'],
+        finish_time=row['finish_time'],
+        duration=duration
+    )
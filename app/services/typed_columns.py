@@ -0,0 +1,164 @@
+"""
+13jt字符串字段的类型化影子列
+
+13jt导入表的字段都按 String(100) 保存XML属性原文，数值和日期无法在SQL中直接比较、排序或聚合。
+需要在数据库中计算的字段另设一个类型化的影子列，列定义中用 info={'shadow_of': 源列名} 声明，例如
+
+    dj_num: Mapped[Optional[Decimal]] = mapped_column(Numeric(18, 4), info={'shadow_of': 'dj'})
+
+导入时由源列的原文转换得到（见 import_13jt_dynamic），原文保持不变；无法转换的值写NULL。
+已有数据库先用迁移（python manage.py migrate / upgrade）添加影子列，
+再用 backfill_shadow_columns（python manage.py backfill-typed-columns）补齐。
+"""
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Date, Numeric, Float, bindparam, inspect, or_, select
+
+_DATE_PATTERN = re.compile(r'^\s*(\d{4})\s*[-/.年]?\s*(\d{1,2})\s*[-/.月]?\s*(\d{1,2})')
+# 影子列为 Numeric(18, 4)，整数部分最多14位，超出的值写入时会溢出
+_NUMERIC_LIMIT = Decimal(10) ** 14
+
+
+def parse_numeric(value) -> Optional[Decimal]:
+    """把数值原文转换为Decimal，允许千分位逗号和首尾空白，空值、非数值、NaN、无穷大和绝对值不小于10^14的值返回None"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        value = str(value)
+    text = value.strip().replace(',', '')
+    if not text:
+        return None
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() and abs(number) < _NUMERIC_LIMIT else None
+
+
+def parse_float(value) -> Optional[float]:
+    number = parse_numeric(value)
+    return float(number) if number is not None else None
+
+
+def parse_date(value) -> Optional[date]:
+    """把日期原文转换为date，支持 2024-05-01、2024/5/1、2024.05.01、20240501、2024年5月1日，以及带时间的写法"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    match = _DATE_PATTERN.match(str(value))
+    if not match:
+        return None
+    try:
+        return date(*(int(part) for part in match.groups()))
+    except ValueError:
+        return None
+
+
+def _converter(column) -> Callable:
+    if isinstance(column.type, Date):
+        return parse_date
+    if isinstance(column.type, Float) or (isinstance(column.type, Numeric) and not column.type.asdecimal):
+        return parse_float
+    if isinstance(column.type, Numeric):
+        return parse_numeric
+    raise TypeError(f"影子列 {column.table.name}.{column.name} 的类型 {column.type} 不支持自动转换")
+
+
+@lru_cache(maxsize=None)
+def get_shadow_columns(table) -> Dict[str, Tuple[str, Callable]]:
+    """表中声明的影子列 {源列名: (影子列名, 转换函数)}，结果按表缓存，调用方不能修改"""
+    return {
+        column.info['shadow_of']: (column.name, _converter(column))
+        for column in table.columns
+        if 'shadow_of' in column.info
+    }
+
+
+def apply_shadow_values(row: dict, shadow_columns: Dict[str, Tuple[str, Callable]]) -> dict:
+    """按行中出现的源列填写影子列，返回row本身"""
+    for source, (shadow, convert) in shadow_columns.items():
+        if source in row:
+            row[shadow] = convert(row[source])
+    return row
+
+
+def missing_shadow_columns(bind, tables: Iterable) -> List[str]:
+    """
+    数据库中还不存在的影子列，create_all 不会给已有的表添加列，需要先执行迁移
+
+    Returns:
+        List[str]: ['表名.列名', ...]
+    """
+    inspector = inspect(bind)
+    missing = []
+    for table in tables:
+        existing = (
+            {column['name'] for column in inspector.get_columns(table.name)}
+            if inspector.has_table(table.name) else set()
+        )
+        missing.extend(
+            f'{table.name}.{shadow}' for shadow, _ in get_shadow_columns(table).values() if shadow not in existing
+        )
+    return missing
+
+
+def backfill_shadow_columns(executor, tables: Iterable, batch_size: int = 1000, progress_callback=None) -> int:
+    """
+    按ID分批重新计算已有行的影子列
+
+    只更新源列不全为空的行，可以重复执行；update_time 保持原值，不把补齐视为业务修改。
+    由调用方提交事务。
+
+    Args:
+        tables: 需要补齐的表
+        progress_callback: 每批之后以 (表名, 已处理到的ID, 累计更新行数) 回调
+
+    Returns:
+        int: 更新的行数
+    """
+    updated = 0
+    for table in tables:
+        shadow_columns = get_shadow_columns(table)
+        if not shadow_columns:
+            continue
+        sources = list(shadow_columns)
+        has_update_time = 'update_time' in table.c
+        read_columns = [table.c.id] + [table.c[source] for source in sources]
+        values = {shadow: bindparam(f'_{shadow}') for shadow, _ in shadow_columns.values()}
+        if has_update_time:
+            read_columns.append(table.c.update_time)
+            values['update_time'] = bindparam('_update_time')
+        statement = table.update().where(table.c.id == bindparam('_id')).values(values)
+
+        last_id = 0
+        while True:
+            rows = executor.execute(
+                select(*read_columns)
+                .where(table.c.id > last_id, or_(*(table.c[source].isnot(None) for source in sources)))
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            params = []
+            for row in rows:
+                param = {'_id': row[0]}
+                for source, value in zip(sources, row[1:]):
+                    shadow, convert = shadow_columns[source]
+                    param[f'_{shadow}'] = convert(value)
+                if has_update_time:
+                    param['_update_time'] = row[-1]
+                params.append(param)
+            executor.execute(statement, params)
+            updated += len(params)
+            last_id = rows[-1][0]
+            if progress_callback:
+                progress_callback(table.name, last_id, updated)
+    return updated
@@ -4,11 +4,14 @@
 import os
 import hashlib
 import mimetypes
-from datetime import datetime
-from typing import List, Optional
+import tempfile
+import unicodedata
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
-from flask import current_app, send_file
+from flask import current_app, request, Response
 from app.models.models_13jt import File
 from app.services.base_service import BaseService
 from app.dto.upload_dto import (
@@ -18,6 +21,27 @@ from app.dto.upload_dto import (
 from app.dto.common import PaginatedResponse, PaginationMeta
 from app.utils.response_builder import ResponseBuilder
 
+# 上传流每次读取的字节数
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 进程的umask，os.umask只能先设置再恢复，在导入时（单线程）读取一次
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def create_upload_temp_file(upload_dir: str, prefix: str = '.upload-', suffix: str = '.part') -> Tuple[int, str]:
+    """
+    在上传目录中创建临时文件，返回 (文件描述符, 路径)
+    
+    mkstemp创建的文件权限为0600，重命名后仍是如此；改为与普通创建文件一样按umask设置权限，
+    前置代理（X-Accel-Redirect/X-Sendfile）以其他用户运行时也能读取。
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=upload_dir)
+    if hasattr(os, 'fchmod'):
+        os.fchmod(fd, 0o666 & ~_UMASK)
+    return fd, temp_path
+
+
 
 class UploadService(BaseService):
     """文件上传服务类"""
@@ -54,28 +78,24 @@ class UploadService(BaseService):
             original_filename = secure_filename(file.filename)
             file_extension = self._get_file_extension(original_filename)
             
-            # 计算文件哈希
-            file_hash = self._calculate_file_hash(file)
+            # 确保上传目录存在
+            upload_dir = self._get_upload_directory()
+            os.makedirs(upload_dir, exist_ok=True)
+            
+            # 单次读取上传流：写入临时文件的同时计算哈希和大小
+            temp_path, file_size, file_hash = self._save_to_temp_file(file, upload_dir)
             
             # 检查文件是否已存在
             existing_file = File.query.filter_by(hash=file_hash).first()
             if existing_file:
+                os.remove(temp_path)
                 self.log_service_result("upload_single_file", "File already exists", file_id=existing_file.id)
                 raise ValueError(f"文件已存在，文件ID: {existing_file.id}, 文件名: {existing_file.filename}")
             
-            # 生成存储文件名
+            # 以内容寻址的文件名原子地替换到位
             storage_filename = f"{file_hash}{file_extension}"
-            
-            # 确保上传目录存在
-            upload_dir = self._get_upload_directory()
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # 保存文件
             file_path = os.path.join(upload_dir, storage_filename)
-            file.save(file_path)
-            
-            # 获取文件大小
-            file_size = os.path.getsize(file_path)
+            os.replace(temp_path, file_path)
             
             # 创建数据库记录
             db_file = File(
@@ -289,6 +309,11 @@ class UploadService(BaseService):
         """
         下载文件
         
+        - ETag为File.hash，Last-Modified为create_time，条件请求命中时返回304
+        - 支持单个字节范围的Range请求（206/416）及If-Range
+        - 配置了DOWNLOAD_ACCEL_REDIRECT_PREFIX或DOWNLOAD_SENDFILE_HEADER时只返回响应头，由前置代理发送文件
+        - 否则以wsgi.file_wrapper返回文件，gunicorn据此用os.sendfile零拷贝发送（含Range的片段）
+        
         Args:
             file_id: 文件ID
             
@@ -302,17 +327,59 @@ class UploadService(BaseService):
             if not file:
                 raise FileNotFoundError(f"文件ID {file_id} 不存在")
             
-            file_path = self._get_file_path(file.filename)
+            file_path = self._get_stored_file_path(file)
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"文件 {file.filename} 不存在于磁盘")
             
-            # 返回文件下载响应
-            return send_file(
-                file_path,
-                as_attachment=True,
-                download_name=file.filename,
-                mimetype=self._get_mime_type(file.filename)
-            )
+            file_size = os.path.getsize(file_path)
+            last_modified = None
+            if file.create_time:
+                last_modified = file.create_time.replace(microsecond=0).astimezone(timezone.utc)
+            
+            response = Response(mimetype=self._get_mime_type(file.filename))
+            response.set_etag(file.hash)
+            response.last_modified = last_modified
+            response.accept_ranges = 'bytes'
+            response.headers.set('Content-Disposition', 'attachment', **self._get_download_name_options(file.filename))
+            
+            if self._is_not_modified(file.hash, last_modified):
+                response.status_code = 304
+                return response
+            
+            accel_prefix = current_app.config.get('DOWNLOAD_ACCEL_REDIRECT_PREFIX')
+            sendfile_header = current_app.config.get('DOWNLOAD_SENDFILE_HEADER')
+            if accel_prefix:
+                # nginx自行处理Range和条件请求
+                response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(os.path.basename(file_path))
+                return response
+            if sendfile_header:
+                response.headers[sendfile_header] = os.path.abspath(file_path)
+                return response
+            
+            start, stop = 0, file_size
+            # 不支持multipart/byteranges：多个范围时忽略Range，返回完整文件
+            if (request.range and len(request.range.ranges) == 1
+                    and self._is_if_range_valid(file.hash, last_modified)):
+                byte_range = request.range.range_for_length(file_size)
+                if byte_range is None:
+                    response.status_code = 416
+                    response.headers['Content-Range'] = f'bytes */{file_size}'
+                    return response
+                start, stop = byte_range
+                response.status_code = 206
+                response.content_range = request.range.make_content_range(file_size)
+            
+            f = open(file_path, 'rb')
+            f.seek(start)
+            file_wrapper = request.environ.get('wsgi.file_wrapper')
+            if file_wrapper is not None:
+                # 服务器按Content-Length从当前偏移发送，gunicorn使用os.sendfile
+                response.response = file_wrapper(f, UPLOAD_CHUNK_SIZE)
+            else:
+                response.response = self._iter_file_range(f, stop - start)
+            response.direct_passthrough = True
+            response.content_length = stop - start
+            return response
             
         except FileNotFoundError:
             raise
@@ -320,19 +387,78 @@ class UploadService(BaseService):
             self.log_error(e, {"method": "download_file", "file_id": file_id})
             raise
     
+    def _is_not_modified(self, etag: str, last_modified: Optional[datetime]) -> bool:
+        """条件GET：有If-None-Match时只比较ETag，否则比较If-Modified-Since"""
+        if request.if_none_match:
+            return request.if_none_match.contains(etag)
+        if request.if_modified_since and last_modified:
+            return last_modified <= request.if_modified_since
+        return False
+    
+    def _is_if_range_valid(self, etag: str, last_modified: Optional[datetime]) -> bool:
+        """If-Range与当前文件不一致时忽略Range，返回完整文件"""
+        if_range = request.if_range
+        if if_range.etag:
+            return if_range.etag == etag
+        if if_range.date:
+            return last_modified is not None and if_range.date == last_modified
+        return True
+    
+    @staticmethod
+    def _get_download_name_options(filename: str) -> dict:
+        """Content-Disposition的文件名参数，非ASCII文件名另外提供RFC 5987编码的filename*"""
+        filename = filename or 'download'
+        try:
+            filename.encode('ascii')
+            return {'filename': filename}
+        except UnicodeEncodeError:
+            simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+            return {'filename': simple or 'download', 'filename*': f"UTF-8''{quote(filename, safe='')}"}
+    
+    @staticmethod
+    def _iter_file_range(f, length: int):
+        """没有wsgi.file_wrapper时按块读取指定长度"""
+        try:
+            while length > 0:
+                chunk = f.read(min(UPLOAD_CHUNK_SIZE, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+    
     def _validate_file(self, file: FileStorage) -> None:
-        """验证文件"""
+        """验证文件，文件大小在写入时检查（见_save_to_temp_file）"""
         # 检查文件扩展名
         if not self._allowed_file(file.filename):
             raise ValueError(f"不支持的文件类型: {file.filename}")
+    
+    def _save_to_temp_file(self, file: FileStorage, upload_dir: str) -> Tuple[str, int, str]:
+        """
+        把上传流按块写入上传目录下的临时文件，同时计算MD5和字节数
         
-        # 检查文件大小
-        file.seek(0, 2)  # 移动到文件末尾
-        file_size = file.tell()
-        file.seek(0)  # 重置到文件开头
+        超过max_file_size时立即中止并删除临时文件。临时文件与目标文件在同一目录，
+        之后可以用os.replace原子地重命名。
         
-        if file_size > self.max_file_size:
-            raise ValueError(f"文件过大: {file_size} bytes (最大允许: {self.max_file_size} bytes)")
+        Returns:
+            Tuple[str, int, str]: (临时文件路径, 文件大小, MD5)
+        """
+        fd, temp_path = create_upload_temp_file(upload_dir)
+        hash_md5 = hashlib.md5()
+        file_size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b""):
+                    file_size += len(chunk)
+                    if file_size > self.max_file_size:
+                        raise ValueError(f"文件过大: 超过 {self.max_file_size} bytes (最大允许: {self.max_file_size} bytes)")
+                    hash_md5.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path, file_size, hash_md5.hexdigest()
     
     def _allowed_file(self, filename: str) -> bool:
         """检查文件扩展名是否允许"""
@@ -345,15 +471,6 @@ class UploadService(BaseService):
             return '.' + filename.rsplit('.', 1)[1].lower()
         return ''
     
-    def _calculate_file_hash(self, file: FileStorage) -> str:
-        """计算文件哈希值"""
-        file.seek(0)
-        hash_md5 = hashlib.md5()
-        for chunk in iter(lambda: file.read(4096), b""):
-            hash_md5.update(chunk)
-        file.seek(0)
-        return hash_md5.hexdigest()
-    
     def _get_upload_directory(self) -> str:
         """获取上传目录"""
         upload_dir = current_app.config.get('UPLOAD_FOLDER', 'uploads')
@@ -366,6 +483,11 @@ class UploadService(BaseService):
         upload_dir = self._get_upload_directory()
         return os.path.join(upload_dir, filename)
     
+    def _get_stored_file_path(self, file: File) -> str:
+        """获取上传文件的存储路径，上传时以 hash + 扩展名 命名"""
+        file_extension = f".{file.filetype}" if file.filetype else ''
+        return self._get_file_path(f"{file.hash}{file_extension}")
+    
     def _get_mime_type(self, filename: str) -> str:
         """获取文件的MIME类型"""
         mime_type, _ = mimetypes.guess_type(filename)
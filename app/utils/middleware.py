@@ -4,7 +4,8 @@
 """
 import time
 from typing import Dict, Any
-from flask import request, g, Response
+from flask import request, g, Response, has_request_context
+from sqlalchemy import event
 from app.utils.logger import get_logger, log_request_info, log_response_info
 
 
@@ -153,4 +154,37 @@ def setup_performance_monitoring(app):
                 status_code=response.status_code
             )
         
-        return response 
\ No newline at end of file
+        return response
+
+
+def setup_sql_statement_counter(app):
+    """
+    设置SQL语句计数中间件
+
+    统计每个请求执行的SQL语句数（含各bind的引擎），SQL_DEBUG_HEADERS开启时写入响应头
+    X-SQL-Statement-Count。流式响应在after_request之后才读取数据，这部分语句不计入。
+    """
+    if not app.config.get('SQL_DEBUG_HEADERS'):
+        return
+
+    from app import db
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'sql_statement_count' in g:
+            g.sql_statement_count += 1
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', count_statement)
+
+    @app.before_request
+    def before_request_sql_counter():
+        """请求前重置计数"""
+        g.sql_statement_count = 0
+
+    @app.after_request
+    def after_request_sql_counter(response: Response):
+        """请求后写入响应头"""
+        if 'sql_statement_count' in g:
+            response.headers['X-SQL-Statement-Count'] = str(g.sql_statement_count)
+        return response
@@ -1,34 +1,20 @@
 ﻿import re
 
+# 全角字符（含全角空格）转半角，以及其余中文标点转英文标点的映射，合并为一张转换表
+_FULLWIDTH_TABLE = {0x3000: 0x0020, **{code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}}
+_CN_PUNCTUATION_TABLE = str.maketrans("，。！？【】（）％＃＠＆１２３４５６７８９０：；“”‘’", ",.!?[]()%#@&1234567890:;\"\"''")
+_CLEAN_TABLE = {**_CN_PUNCTUATION_TABLE, **_FULLWIDTH_TABLE}
+_WHITESPACE = re.compile(r"\s+")
+
+
 def clean_string(s: str = "") -> str:
     """
     清洗字符串：去除首尾空白、全角转半角、中文标点转英文标点，统一换行和制表符为空格。
     """
-    def fullwidth_to_halfwidth(ustring):
-        """全角转半角"""
-        rstring = ""
-        for uchar in ustring:
-            inside_code = ord(uchar)
-            # 全角空格直接转为半角空格
-            if inside_code == 0x3000:
-                inside_code = 0x0020
-            # 全角字符（除空格）根据关系转化
-            elif 0xFF01 <= inside_code <= 0xFF5E:
-                inside_code -= 0xFEE0
-            rstring += chr(inside_code)
-        return rstring
-
-    # 中文标点与英文标点映射
-    cn_punc = "，。！？【】（）％＃＠＆１２３４５６７８９０：；“”‘’"
-    en_punc = ",.!?[]()%#@&1234567890:;\"\"''"
-    table = str.maketrans(cn_punc, en_punc)
-
     s = s.strip()
-    s = fullwidth_to_halfwidth(s)
-    s = s.translate(table)
-    # 将 \r, \n, \r\n, \t 替换为一个空格
-    s = re.sub(r'[\r\n\t]+', ' ', s)
-    s = re.sub(r"\s+", " ", s)  # 多余空白合并为一个空格
+    s = s.translate(_CLEAN_TABLE)
+    # 换行、制表符等空白统一为空格，多余空白合并为一个空格
+    s = _WHITESPACE.sub(" ", s)
     s = s.replace("Φ", "φ").replace("φ", "直径")
     #s = s.replace("×", "X").replace("X", "x").replace("x", "*") #   “*”在数据库有可能导致奇怪问题，会被丢掉
     s = s.replace("*", "x").replace("×", "X").replace("x", "X")
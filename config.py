@@ -24,6 +24,63 @@ class Config:
     # 文件上传配置
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 50 * 1024 * 1024))  # 50MB
+    # 分块上传配置，每个分块是一个独立请求，分块大小不能超过MAX_CONTENT_LENGTH
+    CHUNKED_UPLOAD_CHUNK_SIZE = int(os.environ.get('CHUNKED_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024))  # 5MB
+    CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
+    CHUNKED_UPLOAD_SESSION_TTL = int(os.environ.get('CHUNKED_UPLOAD_SESSION_TTL', 24 * 3600))  # 超过该秒数无活动的会话被清理
+    # 文件下载交给前置代理发送，二选一：
+    # nginx配置internal location后填写其前缀，如 /protected-uploads/ ，响应头为 X-Accel-Redirect: <前缀><存储文件名>
+    DOWNLOAD_ACCEL_REDIRECT_PREFIX = os.environ.get('DOWNLOAD_ACCEL_REDIRECT_PREFIX')
+    # Apache(mod_xsendfile)/lighttpd填写 X-Sendfile 或 X-LIGHTTPD-send-file ，响应头的值为文件绝对路径
+    DOWNLOAD_SENDFILE_HEADER = os.environ.get('DOWNLOAD_SENDFILE_HEADER')
+    
+    # 解析任务配置，任务表存放在独立的SQLite库中，避免与导入事务争用锁
+    SQLALCHEMY_BINDS = {
+        'jobs': os.environ.get('JOBS_DATABASE_URL') or
+            'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'jobs.sqlite')
+    }
+    # 同时运行的解析任务上限，默认PostgreSQL为2，其他数据库为1：SQLite、MySQL上导入按表加锁分配主键，并发的导入只会互相等待
+    PARSE_JOB_MAX_WORKERS = int(os.environ['PARSE_JOB_MAX_WORKERS']) if os.environ.get('PARSE_JOB_MAX_WORKERS') else None
+    # 执行任务的进程每隔PARSE_JOB_HEARTBEAT_SECONDS秒更新心跳；超过PARSE_JOB_STALE_SECONDS没有心跳的运行中任务视为中断，
+    # 同一主机上的任务在其进程退出后立即视为中断
+    PARSE_JOB_HEARTBEAT_SECONDS = int(os.environ.get('PARSE_JOB_HEARTBEAT_SECONDS', 30))
+    PARSE_JOB_STALE_SECONDS = int(os.environ.get('PARSE_JOB_STALE_SECONDS', 600))
+    PARSE_JOB_ASYNC = True  # False时在提交请求内同步执行，便于测试
+    # 应用启动时即启动解析线程池，恢复上次进程遗留的任务；manage.py等命令行工具关闭
+    PARSE_JOB_AUTOSTART = os.environ.get('PARSE_JOB_AUTOSTART', 'true').lower() == 'true'
+    
+    # 完整分类树的进程内缓存：本进程通过DictService修改分类时立即失效，
+    # 其他进程的修改最迟在该秒数后可见，0表示不缓存
+    CLASSIFICATION_TREE_CACHE_TTL = int(os.environ.get('CLASSIFICATION_TREE_CACHE_TTL', 60))
+    # 字典表（单位、属性、一二级分类）的进程内快照，失效方式同上，0表示不缓存
+    DICT_CACHE_TTL = int(os.environ.get('DICT_CACHE_TTL', 60))
+    # 字典版本号保存到Redis（如 redis://localhost:6379/0），多个worker修改字典后互相立即失效；需安装redis（pip install ksf-restful[redis]）
+    DICT_VERSION_REDIS_URL = os.environ.get('DICT_VERSION_REDIS_URL')
+    # 访问Redis失败后改用本进程版本号的秒数，期间不再连接Redis
+    DICT_VERSION_REDIS_COOLDOWN = float(os.environ.get('DICT_VERSION_REDIS_COOLDOWN', 30))
+    # /dict/rcj-mc-classifies/bulk、/dict/rcj-mc2ejflids/bulk 每批upsert并提交的记录数
+    DICT_BULK_CHUNK_SIZE = int(os.environ.get('DICT_BULK_CHUNK_SIZE', 1000))
+    # /dict/rcj-mc2ejflids/lookup 一次请求最多查找的名称数
+    DICT_LOOKUP_MAX_NAMES = int(os.environ.get('DICT_LOOKUP_MAX_NAMES', 50000))
+    # /dict/search 一次最多返回的候选数，以及参与打分的候选名称上限（越大越准确，也越慢）
+    DICT_SEARCH_MAX_K = int(os.environ.get('DICT_SEARCH_MAX_K', 100))
+    DICT_SEARCH_MAX_CANDIDATES = int(os.environ.get('DICT_SEARCH_MAX_CANDIDATES', 5000))
+    # /dict/search 的索引按update_time增量更新，超过该秒数后全量读取一次，补上提交较晚的事务写入的行
+    DICT_SEARCH_RESYNC_SECONDS = int(os.environ.get('DICT_SEARCH_RESYNC_SECONDS', 600))
+    # RcjMCClassifyBig属性值的读取位置：wide为宽表的sx_列，sparse为稀疏表RcjMCClassifySx
+    # 切换为sparse时先停止写入并执行 python manage.py migrate-classify-sx 复制已有数据；
+    # sparse模式下通过ORM的写入同步到两处，wide模式下不写稀疏表；
+    # 其他取值在应用启动时报错
+    CLASSIFY_SX_STORAGE = os.environ.get('CLASSIFY_SX_STORAGE', 'wide')
+    # /matrix/m3 分页的最大每页数量，以及NDJSON流式响应每批从服务端游标读取的行数
+    M3_PAGE_MAX_LIMIT = int(os.environ.get('M3_PAGE_MAX_LIMIT', 10000))
+    M3_STREAM_BATCH_SIZE = int(os.environ.get('M3_STREAM_BATCH_SIZE', 1000))
+    # /matrix/m3/export 和 manage.py export-m3 生成的Arrow/Parquet文件缓存目录，相对路径基于项目根目录
+    M3_EXPORT_CACHE_DIR = os.environ.get('M3_EXPORT_CACHE_DIR', 'cache/m3_export')
+    # /matrix/m3/stats 进程内缓存的统计结果个数上限（按二级分类、分组属性和百分位数区分）
+    M3_STATS_CACHE_SIZE = int(os.environ.get('M3_STATS_CACHE_SIZE', 256))
+    # 在响应头 X-SQL-Statement-Count 中返回本次请求执行的SQL语句数，用于发现N+1查询，生产环境不建议开启
+    SQL_DEBUG_HEADERS = os.environ.get('SQL_DEBUG_HEADERS', 'false').lower() == 'true'
     
     @staticmethod
     def init_app(app):
@@ -37,6 +94,7 @@ class DevelopmentConfig(Config):
     LOG_LEVEL = 'DEBUG'
     LOG_FORMAT = 'text'  # 开发环境使用文本格式便于调试
     LOG_ENABLE_FILE = True  # 开发环境默认写入文件
+    SQL_DEBUG_HEADERS = True
     # 开发环境默认端口
     PORT = int(os.environ.get('FLASK_PORT') or 5678)
 
@@ -45,7 +103,10 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite:///:memory:'
+    SQLALCHEMY_BINDS = {'jobs': 'sqlite:///:memory:'}
+    PARSE_JOB_ASYNC = False
     WTF_CSRF_ENABLED = False
+    SQL_DEBUG_HEADERS = True
 
 class ProductionConfig(Config):
     """生产环境配置"""
@@ -7,6 +7,10 @@ import os
 import sys
 import click
 from flask.cli import FlaskGroup
+
+# 命令行工具不认领后台解析任务（配置类在导入app时读取环境变量）
+os.environ.setdefault('PARSE_JOB_AUTOSTART', 'false')
+
 from app import create_app, db
 from app.models import *  # 导入所有模型以确保Flask-Migrate能检测到
 
@@ -116,5 +120,149 @@ def check():
     except Exception as e:
         click.echo(f'❌ 数据库连接失败: {e}')
 
+@cli.command('import-13jt')
+@click.argument('paths', nargs=-1, type=click.Path(exists=True))
+@click.option('--workers', '-w', type=int, default=None, help='解析进程数，默认CPU核数')
+@click.option('--writers', type=int, default=1, help='写入连接数，只对PostgreSQL有效')
+@click.option('--batch-size', type=int, default=5000, help='每个写入批次的行数')
+@click.option('--backend', type=click.Choice(['auto', 'copy', 'executemany']), default='auto',
+              help='写入方式，auto在PostgreSQL上使用COPY')
+@click.option('--mode', type=click.Choice(['skip', 'replace']), default='skip',
+              help='已导入的文件: skip跳过，replace删除已导入的行及其分类关联后重新导入')
+def import_13jt(paths, workers, writers, batch_size, backend, mode):
+    """并行导入13jt文件（参数为文件或目录，默认resources/13jt）"""
+    from app.services.import_13jt_dynamic import IMPORTER_VERSION
+    from app.services.import_13jt_parallel import collect_13jt_paths, import_13jt_parallel
+
+    files = collect_13jt_paths(paths or ['resources/13jt'])
+    if not files:
+        click.echo('没有找到.13jt或.13JT文件')
+        return
+    click.echo(f'找到 {len(files)} 个13jt文件，解析进程: {workers or os.cpu_count()}，写入连接: {writers}')
+
+    def report(result):
+        name = os.path.basename(result.path)
+        if result.error:
+            click.echo(f'✗ {name}: {result.error}')
+        elif result.skipped and result.importer_version not in (None, IMPORTER_VERSION):
+            click.echo(f'- {name}: 文件已由导入器版本 {result.importer_version} 导入，跳过 (file_id={result.file_id})，'
+                       f'使用 --mode replace 按当前版本 {IMPORTER_VERSION} 重新导入')
+        elif result.skipped:
+            click.echo(f'- {name}: 文件已导入，跳过 (file_id={result.file_id})')
+        else:
+            click.echo(f'✓ {name}: {result.rows} 行，解析 {result.parse_seconds:.2f}秒，'
+                       f'写入 {result.write_seconds:.2f}秒，{result.rows_per_second:.0f} 行/秒')
+
+    with app.app_context():
+        db.create_all()
+        summary = import_13jt_parallel(files, db.engine, workers=workers, writers=writers,
+                                       batch_size=batch_size, backend=backend, mode=mode, on_result=report)
+
+    click.echo('-' * 100)
+    click.echo(f'导入完成: 成功 {len(summary.succeeded)}，跳过 {len(summary.skipped)}，'
+               f'失败 {len(summary.failed)}，共 {len(files)} 个文件')
+    click.echo(f'总耗时: {summary.elapsed_seconds:.2f}秒，{summary.files_per_second:.2f} 文件/秒，'
+               f'{summary.total_rows} 行，{summary.rows_per_second:.0f} 行/秒')
+    if summary.failed:
+        click.echo('失败文件:')
+        for result in summary.failed:
+            click.echo(f'  {result.path}: {result.error}')
+        sys.exit(1)
+
+@cli.command('cleanup-uploads')
+@click.option('--ttl', type=int, default=None, help='清理超过该秒数无活动的会话，默认CHUNKED_UPLOAD_SESSION_TTL')
+def cleanup_uploads(ttl):
+    """清理过期的分块上传会话"""
+    from app.services.chunked_upload_service import ChunkedUploadService
+
+    with app.app_context():
+        removed = ChunkedUploadService().cleanup_expired_sessions(ttl)
+    click.echo(f'已清理 {removed} 个过期的上传会话')
+
+@cli.command('refresh-classify-summary')
+@click.option('--file-id', 'file_ids', type=int, multiple=True, help='只刷新指定文件，可重复，默认所有文件')
+def refresh_classify_summary(file_ids):
+    """重新计算文件分类汇总（绕过ORM修改分类关联后使用）"""
+    from app.services.file_classify_summary import refresh_all_file_classify_summaries
+
+    with app.app_context():
+        db.create_all()
+        refreshed = refresh_all_file_classify_summaries(db.session, file_ids or None)
+        db.session.commit()
+    click.echo(f'已刷新 {refreshed} 个文件的分类汇总')
+
+@cli.command('migrate-classify-sx')
+@click.option('--batch-size', type=int, default=1000, help='每批读取的分类记录数')
+def migrate_classify_sx(batch_size):
+    """把RcjMCClassifyBig的sx_列复制到稀疏表RcjMCClassifySx（可重复执行）"""
+    from app.services.classify_projection import backfill_sx_values
+
+    def report(last_id, written):
+        db.session.commit()
+        click.echo(f'已处理到分类ID {last_id}，写入 {written} 个属性值')
+
+    with app.app_context():
+        db.create_all()
+        written = backfill_sx_values(db.session, batch_size=batch_size, progress_callback=report)
+        db.session.commit()
+    click.echo(f'迁移完成，共写入 {written} 个属性值；设置 CLASSIFY_SX_STORAGE=sparse 后从稀疏表读取')
+
+@cli.command('backfill-typed-columns')
+@click.option('--table', 'table_names', multiple=True, help='只处理指定的13jt表，可重复，默认所有有影子列的表')
+@click.option('--batch-size', type=int, default=1000, help='每批更新的行数')
+def backfill_typed_columns(table_names, batch_size):
+    """按原文重新计算13jt表的类型化影子列（如 Rcjhzmx.dj_num，可重复执行）"""
+    from app.services.import_13jt_dynamic import get_all_models
+    from app.services.typed_columns import backfill_shadow_columns, get_shadow_columns, missing_shadow_columns
+
+    tables = [model.__table__ for model in get_all_models().values() if get_shadow_columns(model.__table__)]
+    if table_names:
+        unknown = set(table_names) - {table.name for table in tables}
+        if unknown:
+            click.echo(f'❌ 没有影子列的表: {", ".join(sorted(unknown))}')
+            sys.exit(1)
+        tables = [table for table in tables if table.name in table_names]
+
+    def report(table_name, last_id, updated):
+        db.session.commit()
+        click.echo(f'{table_name}: 已处理到ID {last_id}，累计更新 {updated} 行')
+
+    with app.app_context():
+        missing = missing_shadow_columns(db.engine, tables)
+        if missing:
+            click.echo(f'❌ 数据库中缺少影子列: {", ".join(missing)}')
+            click.echo('请先生成并应用迁移添加这些列: python manage.py migrate -m "add typed shadow columns" && python manage.py upgrade')
+            sys.exit(1)
+        updated = backfill_shadow_columns(db.session, tables, batch_size=batch_size, progress_callback=report)
+        db.session.commit()
+    click.echo(f'补齐完成，共更新 {updated} 行')
+
+@cli.command('export-m3')
+@click.option('--ejflid', 'ejflids', multiple=True, help='只导出指定二级分类，可重复，默认所有有分类记录的二级分类')
+@click.option('--format', 'fmt', type=click.Choice(['parquet', 'arrow']), default='parquet', help='导出格式')
+def export_m3(ejflids, fmt):
+    """把二级分类的M3记录导出为Parquet/Arrow文件（写入M3_EXPORT_CACHE_DIR，数据未变化时复用）"""
+    from app.services.m3_export import M3ExportService, ExportUnavailableError
+
+    service = M3ExportService()
+    with app.app_context():
+        try:
+            if ejflids:
+                exported = []
+                for ejflid in ejflids:
+                    result = service.export_m3(ejflid, fmt)
+                    if result is None:
+                        click.echo(f'✗ {ejflid}: 二级分类不存在')
+                    else:
+                        exported.append((ejflid, *result))
+            else:
+                exported = service.export_all(fmt)
+        except ExportUnavailableError as e:
+            click.echo(f'❌ {e}')
+            sys.exit(1)
+    for ejflid, path, version in exported:
+        click.echo(f'✓ {ejflid}: {path} (版本 {version})')
+    click.echo(f'导出完成，共 {len(exported)} 个文件')
+
 if __name__ == '__main__':
     cli() 
\ No newline at end of file
@@ -13,6 +13,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # 设置测试环境变量
 os.environ['FLASK_ENV'] = 'testing'
 os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+os.environ['PARSE_JOB_AUTOSTART'] = 'false'
 
 
 @pytest.fixture(scope="session")
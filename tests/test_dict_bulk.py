@@ -0,0 +1,146 @@
+"""
+人材机名称映射、名称分类批量导入测试
+"""
+import json
+
+import pytest
+from app import create_app, db
+from app.models.dict import RcjYjfl, RcjEjfl, RcjMC2Ejflid, RcjMCClassify
+from app.services import bulk_upsert
+from app.services.dict_service import DictService
+
+
+@pytest.fixture
+def app():
+    """创建测试应用"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        yjfl = RcjYjfl(id='01', yjflmc='黑色及有色金属')
+        db.session.add_all([
+            RcjEjfl(id='0101', ejflmc='钢筋', yjfl=yjfl),
+            RcjEjfl(id='0103', ejflmc='钢丝', yjfl=yjfl),
+            RcjMCClassify(cleaned_rcj_original_mc='螺纹钢', yjflid='01', ejflid='0103'),
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def classify(name, yjflid='01', ejflid='0101', **extra):
+    return dict(cleaned_rcj_original_mc=name, yjflid=yjflid, yjflmc='黑色及有色金属',
+                ejflid=ejflid, ejflmc='钢筋', **extra)
+
+
+class TestDictBulkUpsert:
+    """批量导入测试类"""
+
+    @pytest.fixture(autouse=True)
+    def mock_db(self):
+        """使用真实数据库"""
+        yield None
+
+    def test_classifies_created_updated_and_rejected(self, app):
+        """测试逐条返回新增、更新和校验失败的结果"""
+        app.config['DICT_BULK_CHUNK_SIZE'] = 2
+        rows = [
+            classify('盘圆'),
+            classify('螺纹钢'),
+            classify('线材', ejflid='9999'),
+            classify('圆钢', yjflid='99'),
+            classify('盘圆', ejflid='0103'),
+            classify('方钢', unknown='x'),
+            classify(''),
+            classify('钢' * 301),
+            '钢丝',
+            classify('冷拔丝', yjflid=None, ejflid=None),
+        ]
+        result = DictService().bulk_upsert_rcj_mc_classifies(rows)
+
+        assert (result.total, result.created, result.updated, result.failed) == (10, 2, 1, 7)
+        statuses = [item['status'] for item in result.results]
+        assert statuses == ['created', 'updated', 'error', 'error', 'error', 'error', 'error', 'error', 'error', 'created']
+        assert result.results[2]['error'] == '指定的二级分类ID不存在'
+        assert result.results[3]['error'] == '指定的一级分类ID不存在'
+        assert '第 0 条' in result.results[4]['error']
+        assert result.results[5]['error'].startswith('字段错误')
+        assert '不能为空' in result.results[6]['error']
+        assert '最大长度' in result.results[7]['error']
+
+        updated = RcjMCClassify.query.filter_by(cleaned_rcj_original_mc='螺纹钢').one()
+        assert result.results[1]['id'] == updated.id
+        assert updated.ejflid == '0101'
+        assert RcjMCClassify.query.filter_by(cleaned_rcj_original_mc='盘圆').one().id == result.results[0]['id']
+        assert RcjMCClassify.query.count() == 3
+
+    def test_mc2ejflids_upsert(self, app):
+        """测试名称映射已存在时更新二级分类"""
+        service = DictService()
+        first = service.bulk_upsert_rcj_mc2ejflids([
+            {'orignal_rcjmc': '钢筋 HRB400', 'ejflid': '0101'},
+            {'orignal_rcjmc': '镀锌钢丝', 'ejflid': '0103'},
+        ])
+        assert first.created == 2
+        second = service.bulk_upsert_rcj_mc2ejflids([
+            {'orignal_rcjmc': '钢筋 HRB400', 'ejflid': '0103'},
+            {'orignal_rcjmc': '镀锌钢丝', 'ejflid': ''},
+        ])
+        assert [item['status'] for item in second.results] == ['updated', 'error']
+        assert second.results[0]['id'] == first.results[0]['id']
+        assert RcjMC2Ejflid.query.get(first.results[0]['id']).ejflid == '0103'
+
+    def test_fallback_without_on_conflict(self, app, monkeypatch):
+        """测试不支持upsert语句的数据库分别插入和更新，结果相同"""
+        monkeypatch.setattr(bulk_upsert, '_upsert_statement', lambda *args: None)
+        result = DictService().bulk_upsert_rcj_mc_classifies([classify('螺纹钢'), classify('盘圆')])
+        assert [item['status'] for item in result.results] == ['updated', 'created']
+        assert RcjMCClassify.query.filter_by(cleaned_rcj_original_mc='螺纹钢').one().ejflid == '0101'
+
+    def test_fallback_without_unique_index(self, app):
+        """测试已有数据库的名称列上只有普通索引时退回分别插入和更新"""
+        table = RcjMC2Ejflid.__table__
+        db.session.execute(db.text('DROP INDEX ix_dict_rcjmc2ejflid_orignal_rcjmc'))
+        db.session.execute(db.text(f'CREATE INDEX ix_dict_rcjmc2ejflid_orignal_rcjmc ON {table.name} (orignal_rcjmc)'))
+        db.session.commit()
+        assert not bulk_upsert.has_unique_key(db.session, table, 'orignal_rcjmc')
+        assert bulk_upsert.has_unique_key(db.session, table, 'id')
+
+        service = DictService()
+        first = service.bulk_upsert_rcj_mc2ejflids([{'orignal_rcjmc': '钢筋 HRB400', 'ejflid': '0101'}])
+        second = service.bulk_upsert_rcj_mc2ejflids([
+            {'orignal_rcjmc': '钢筋 HRB400', 'ejflid': '0103'},
+            {'orignal_rcjmc': '镀锌钢丝', 'ejflid': '0103'},
+        ])
+        assert [item['status'] for item in second.results] == ['updated', 'created']
+        assert second.results[0]['id'] == first.results[0]['id']
+        assert RcjMC2Ejflid.query.count() == 2
+
+    def test_bulk_endpoints(self, client):
+        """测试接口接受JSON数组和NDJSON，NDJSON中无法解析的行单独报错"""
+        response = client.post('/api/v1/dict/rcj-mc-classifies/bulk', json=[classify('盘圆'), classify('螺纹钢')])
+        assert response.status_code == 200
+        assert response.get_json()['created'] == 1
+        assert response.get_json()['updated'] == 1
+
+        body = '\n'.join([
+            json.dumps({'orignal_rcjmc': '钢筋 HRB400', 'ejflid': '0101'}, ensure_ascii=False),
+            '',
+            '{"orignal_rcjmc": ',
+            json.dumps({'orignal_rcjmc': '镀锌钢丝', 'ejflid': '0103'}, ensure_ascii=False),
+        ])
+        response = client.post('/api/v1/dict/rcj-mc2ejflids/bulk', data=body.encode('utf-8'),
+                               content_type='application/x-ndjson')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [item['status'] for item in data['results']] == ['created', 'error', 'created']
+        assert data['results'][1]['error'].startswith('JSON格式错误')
+
+        response = client.post('/api/v1/dict/rcj-mc2ejflids/bulk', json={'orignal_rcjmc': '钢筋', 'ejflid': '0101'})
+        assert response.status_code == 400
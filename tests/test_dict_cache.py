@@ -0,0 +1,198 @@
+"""
+字典快照缓存测试
+"""
+import dataclasses
+
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.models.dict import DwType, Dw, RcjYjfl, RcjEjfl, RcjEjflSx
+from app.dto.dict import RcjEjflSxRequestDTO, RcjEjflUpdateRequestDTO, DwUpdateRequestDTO
+from app.services import dict_version
+from app.services.dict_cache import SNAPSHOT_DICTS, get_dict_cache, get_dict_snapshot
+from app.services.dict_service import DictService
+from app.services.matrix_service import MatrixService
+
+
+def create_test_app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        weight = DwType(id='01', typeName='重量')
+        ton = Dw(id='0010', dw='t', type=weight)
+        kg = Dw(id='0011', dw='kg', type=weight)
+        yjfl = RcjYjfl(id='01', yjflmc='黑色及有色金属')
+        rebar = RcjEjfl(id='0101', ejflmc='钢筋', yjfl=yjfl)
+        rebar._sxs = [RcjEjflSx(id='0002', sx='直径'), RcjEjflSx(id='0001', sx='牌号')]
+        rebar._dws = [ton, kg]
+        db.session.add_all([rebar, RcjEjfl(id='0103', ejflmc='钢丝', yjfl=yjfl)])
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def app():
+    """创建测试应用"""
+    app = create_test_app()
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class FakeRedis:
+    """只实现版本号用到的hash命令，多个应用实例共用一个对象即模拟共用一个Redis"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.reads = 0
+
+    def hmget(self, key, fields):
+        self.reads += 1
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    def hincrby(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = values.get(field, 0) + amount
+        return values[field]
+
+
+class UnavailableRedis:
+    """每次访问都超时的Redis"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def hmget(self, key, fields):
+        self.calls += 1
+        raise TimeoutError('Timeout reading from socket')
+
+    def hincrby(self, key, field, amount):
+        self.calls += 1
+        raise TimeoutError('Timeout reading from socket')
+
+
+class TestDictCache:
+    """字典快照缓存测试类"""
+
+    @pytest.fixture(autouse=True)
+    def mock_db(self):
+        """使用真实数据库"""
+        yield None
+
+    def test_snapshot_indexes(self, app):
+        """测试快照的ID、名称索引及二级分类的属性、单位列表"""
+        snapshot = get_dict_snapshot()
+        assert snapshot.dws['0010'].dw == 't'
+        assert snapshot.dws_by_name['kg'].id == '0011'
+        assert snapshot.dw_types_by_name['重量'].id == '01'
+        assert snapshot.yjfls_by_name['黑色及有色金属'].id == '01'
+        assert [ejfl.id for ejfl in snapshot.ejfls_by_name['钢筋']] == ['0101']
+        assert snapshot.ejfls['0101'].sxids == ('0001', '0002')
+        assert snapshot.ejfls['0101'].dwids == ('0010', '0011')
+        assert [sx.sx for sx in snapshot.ejfl_sxs['0101']] == ['牌号', '直径']
+        assert [dw.dw for dw in snapshot.ejfl_dws['0101']] == ['t', 'kg']
+        assert snapshot.ejfl_sxs['0103'] == ()
+        assert snapshot.sizes() == {'dw_types': 1, 'dws': 2, 'sxs': 2, 'yjfls': 1, 'ejfls': 2}
+
+        with pytest.raises(TypeError):
+            snapshot.ejfls['0105'] = snapshot.ejfls['0101']
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            snapshot.ejfls['0101'].ejflmc = '钢材'
+
+    def test_hits_and_invalidation_on_write(self, app):
+        """测试重复读取命中缓存，经DictService修改字典后重新构建"""
+        cache = get_dict_cache()
+        first = get_dict_snapshot()
+        assert get_dict_snapshot() is first
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        service = DictService()
+        service.create_rcj_ejfl_sx(RcjEjflSxRequestDTO(id='0003', sx='长度'))
+        service.update_rcj_ejfl('0103', RcjEjflUpdateRequestDTO(sx_ids=['0003']))
+        snapshot = get_dict_snapshot()
+        assert snapshot is not first
+        assert snapshot.ejfls['0103'].sxids == ('0003',)
+        assert cache.misses == 2
+
+        service.update_dw('0011', DwUpdateRequestDTO(dw='千克'))
+        assert get_dict_snapshot().dws_by_name['千克'].id == '0011'
+        assert cache.misses == 3
+
+    def test_ttl_zero_disables_cache(self, app):
+        """测试DICT_CACHE_TTL为0时每次读取都重新构建"""
+        app.config['DICT_CACHE_TTL'] = 0
+        assert get_dict_snapshot() is not get_dict_snapshot()
+        assert get_dict_cache().hits == 0
+
+    def test_redis_version_shared_between_apps(self, app):
+        """测试版本号保存在Redis时，一个实例的修改使另一个实例的快照失效"""
+        redis = FakeRedis()
+        other = create_test_app()
+        for instance in (app, other):
+            instance.config['DICT_VERSION_REDIS_URL'] = 'redis://localhost:6379/0'
+            instance.extensions['dict_version_redis'] = redis
+
+        with other.app_context():
+            assert get_dict_snapshot().sxs_by_name.get('长度') is None
+            # 快照的三个版本号一次读取
+            assert redis.reads == 1
+
+        DictService().create_rcj_ejfl_sx(RcjEjflSxRequestDTO(id='0003', sx='长度'))
+        assert redis.hashes[dict_version.REDIS_KEY] == {dict_version.EJFL_SX: 1}
+
+        with other.app_context():
+            # 两个实例的测试库是各自的内存数据库，这里只验证另一个实例发现版本变化后重新构建
+            assert get_dict_snapshot().version == (0, 1, 0)
+            assert get_dict_cache().misses == 2
+            db.session.remove()
+            db.drop_all()
+
+    def test_redis_cooldown_after_failure(self, app):
+        """测试Redis访问失败后冷却期内只用本进程版本号，不再连接Redis"""
+        redis = UnavailableRedis()
+        app.config['DICT_VERSION_REDIS_URL'] = 'redis://localhost:6379/0'
+        app.config['DICT_VERSION_REDIS_COOLDOWN'] = 30
+        app.extensions['dict_version_redis'] = redis
+
+        assert dict_version.get_dict_versions(SNAPSHOT_DICTS) == (0, 0, 0)
+        assert dict_version.bump_dict_version(dict_version.UNIT) == 1
+        assert dict_version.get_dict_version(dict_version.UNIT) == 1
+        assert redis.calls == 1
+
+        # 冷却期结束后重新尝试Redis
+        app.extensions['dict_version_redis_retry_at'] = 0.0
+        assert dict_version.bump_dict_version(dict_version.UNIT) == 2
+        assert redis.calls == 2
+
+    def test_m3_reads_ejfl_from_snapshot(self, app):
+        """测试M3查询从快照取二级分类，不再查询字典表"""
+        service = MatrixService()
+        service.get_m3('0101')
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            service.get_m3('0101')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        assert not any('dict_' in statement or 'association_' in statement for statement in statements)
+
+    def test_cache_stats_endpoint(self, client):
+        """测试缓存统计接口"""
+        get_dict_snapshot()
+        get_dict_snapshot()
+        response = client.get('/api/v1/dict/cache')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['hits'] == 1 and data['misses'] == 1
+        assert data['hit_ratio'] == 0.5
+        assert data['sizes']['ejfls'] == 2
@@ -0,0 +1,105 @@
+"""
+字典查询的SQL语句数测试
+"""
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.models.dict import DwType, Dw, RcjYjfl, RcjEjfl, RcjEjflSx
+from app.services.dict_service import DictService
+
+ROWS = 30
+
+
+@pytest.fixture
+def app():
+    """创建测试应用，写入带关联的单位和二级分类"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        types = [DwType(id=f'{i:02d}', typeName=f'类别{i}') for i in range(3)]
+        dws = [Dw(id=f'{i:04d}', dw=f'单位{i}', type=types[i % 3]) for i in range(ROWS)]
+        sxs = [RcjEjflSx(id=f'{i:04d}', sx=f'属性{i}') for i in range(ROWS)]
+        yjfls = [RcjYjfl(id=f'{i:02d}', yjflmc=f'一级分类{i}') for i in range(3)]
+        for i in range(ROWS):
+            ejfl = RcjEjfl(id=f'{i:04d}', ejflmc=f'二级分类{i}', yjfl=yjfls[i % 3])
+            ejfl._sxs = [sxs[i], sxs[(i + 1) % ROWS]]
+            ejfl._dws = [dws[i]]
+            db.session.add(ejfl)
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def count_queries(func):
+    """统计执行func期间发出的SQL语句数"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        result = func()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return result, len(statements)
+
+
+class TestDictQueryBudget:
+    """字典列表和详情的查询次数测试类"""
+
+    @pytest.fixture(autouse=True)
+    def mock_db(self):
+        """使用真实数据库"""
+        yield None
+
+    @pytest.mark.parametrize('per_page', [5, ROWS])
+    def test_get_dws(self, app, per_page):
+        """测试单位列表的语句数与每页数量无关：计数 + 本页（含类别）"""
+        db.session.expire_all()
+        result, queries = count_queries(lambda: DictService().get_dws(page=1, per_page=per_page))
+        assert len(result.data) == per_page
+        assert all(dw.type is not None for dw in result.data)
+        assert queries == 2
+
+    @pytest.mark.parametrize('per_page', [5, ROWS])
+    def test_get_rcj_ejfls(self, app, per_page):
+        """测试二级分类列表的语句数与每页数量无关：计数 + 本页（含一级分类） + 属性 + 单位"""
+        db.session.expire_all()
+        result, queries = count_queries(lambda: DictService().get_rcj_ejfls(page=1, per_page=per_page))
+        assert len(result.data) == per_page
+        first = result.data[0]
+        assert sorted(first.sxs) == ['属性0', '属性1']
+        assert first.dws == ['单位0']
+        assert first.yjfl.yjflmc == '一级分类0'
+        assert queries == 4
+
+    def test_get_details(self, app):
+        """测试详情的语句数固定"""
+        db.session.expire_all()
+        dw, queries = count_queries(lambda: DictService().get_dw_by_id('0001'))
+        assert dw.type.typeName == '类别1'
+        assert queries == 1
+
+        db.session.expire_all()
+        ejfl, queries = count_queries(lambda: DictService().get_rcj_ejfl_by_id('0001'))
+        assert sorted(ejfl.sxs) == ['属性1', '属性2']
+        assert ejfl.yjfl.yjflmc == '一级分类1'
+        assert queries == 3
+
+    def test_statement_count_header(self, client):
+        """测试响应头返回本次请求的SQL语句数"""
+        response = client.get(f'/api/v1/dict/dws?per_page={ROWS}')
+        assert response.status_code == 200
+        assert response.headers['X-SQL-Statement-Count'] == '2'
+
+        response = client.get(f'/api/v1/dict/rcj-ejfls?per_page={ROWS}')
+        assert response.status_code == 200
+        assert response.headers['X-SQL-Statement-Count'] == '4'
@@ -0,0 +1,536 @@
+"""
+13jt导入测试
+"""
+import pytest
+import os
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from app import create_app, db
+import app.services.import_13jt_dynamic as import_13jt_dynamic
+
+
+SAMPLE_13JT = """<?xml version="1.0" encoding="utf-8"?>
+<JingJiBiao BiaoDuanNo="BD01" Xmmc="测试项目" Jsfs="1" Version="1.0">
+    <ToubiaoXx Bztime="2024-05-01" />
+    <Dxgcxx Dxgcbh="01" Dxgcmc="单项工程">
+        <Dwgcxx Dwgcbh="0101" Dwgcmc="单位工程">
+            <Qdxm>
+                <Qdbt Xmbm="010101" Mc="清单标题">
+                    <Qdmx Xmbm="010101001" Mc="挖土方" />
+                    <Qdmx Xmbm="010101002" Mc="回填土" />
+                </Qdbt>
+            </Qdxm>
+            <Rcjhz>
+                <Rcjhzmx Rcjbm="R001" Mc="普通硅酸盐水泥" Dw="t" Dj="450.5" Sl="10" Hj="4505" />
+                <Rcjhzmx Rcjbm="R002" Mc="中砂" Dw="m3" Dj="120" Sl="3" Hj="360" />
+                <Rcjhzmx Rcjbm="R003" Mc="综合工日" Dw="工日" Dj="150" Sl="20" Hj="3000" />
+            </Rcjhz>
+        </Dwgcxx>
+    </Dxgcxx>
+</JingJiBiao>
+"""
+
+
+@pytest.fixture
+def app():
+    """创建测试应用"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def sample_13jt_path():
+    """写入示例13jt文件"""
+    fd, path = tempfile.mkstemp(suffix='.13jt')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(SAMPLE_13JT)
+    yield path
+    os.remove(path)
+
+
+def snapshot_13jt_tables(models):
+    """按表导出所有行（忽略时间戳），用于比较导入结果"""
+    result = {}
+    for table_name, model in models.items():
+        columns = [c for c in model.__table__.columns if c.name not in ('create_time', 'update_time')]
+        rows = db.session.execute(
+            db.select(*columns).order_by(model.__table__.c.id)
+        ).all()
+        result[table_name] = [tuple(row) for row in rows]
+    return result
+
+
+class TestStreamingImport:
+    """流式导入测试类"""
+
+    def test_streaming_matches_tree_import(self, app, sample_13jt_path):
+        """测试流式导入与整树导入结果一致"""
+        models = import_13jt_dynamic.get_all_models()
+
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, engine='tree')
+        expected = snapshot_13jt_tables(models)
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, engine='stream')
+        actual = snapshot_13jt_tables(models)
+
+        assert actual == expected
+        assert len(actual['origin_13jt_rcjhzmx']) == 3
+        assert len(actual['origin_13jt_qdmx']) == 2
+
+    def test_streaming_sets_parent_foreign_keys(self, app, sample_13jt_path):
+        """测试流式导入设置多层级外键"""
+        from app.models.models_13jt import Rcjhz, Rcjhzmx, Dwgcxx
+
+        models = import_13jt_dynamic.get_all_models()
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 7, engine='stream')
+
+        rcjhz = Rcjhz.query.one()
+        dwgcxx = Dwgcxx.query.one()
+        for rcjhzmx in Rcjhzmx.query.all():
+            assert rcjhzmx.file_id == 7
+            assert rcjhzmx.rcjhz_id == rcjhz.id
+            assert rcjhzmx.dwgcxx_id == dwgcxx.id
+            assert rcjhzmx.dxgcxx_id == dwgcxx.dxgcxx_id
+
+    def test_streaming_small_flush_batches(self, app, sample_13jt_path):
+        """测试较小的批量flush不影响结果"""
+        models = import_13jt_dynamic.get_all_models()
+        import_13jt_dynamic.process_xml_stream(
+            sample_13jt_path, models, db.session, [(1, 'file_id')], flush_every=1
+        )
+        db.session.commit()
+
+        from app.models.models_13jt import Rcjhzmx
+        assert [r.rcjbm for r in Rcjhzmx.query.order_by(Rcjhzmx.id)] == ['R001', 'R002', 'R003']
+
+
+class TestBulkImport:
+    """批量导入测试类"""
+
+    def test_bulk_matches_tree_import(self, app, sample_13jt_path):
+        """测试批量导入与整树导入结果一致"""
+        models = import_13jt_dynamic.get_all_models()
+
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, engine='tree')
+        expected = snapshot_13jt_tables(models)
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, engine='bulk')
+        actual = snapshot_13jt_tables(models)
+
+        assert actual == expected
+
+    def test_bulk_ids_continue_after_existing_rows(self, app, sample_13jt_path):
+        """测试第二次导入时主键从已有最大ID之后分配，且批次边界不影响外键"""
+        from app.models.models_13jt import Rcjhz, Rcjhzmx
+
+        models = import_13jt_dynamic.get_all_models()
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1)
+        counts = import_13jt_dynamic.process_xml_bulk(
+            sample_13jt_path, models, db.session, [(2, 'file_id')], batch_size=2
+        )
+        db.session.commit()
+
+        assert counts['origin_13jt_rcjhzmx'] == 3
+        assert [r.id for r in Rcjhzmx.query.order_by(Rcjhzmx.id)] == [1, 2, 3, 4, 5, 6]
+        second_rcjhz = Rcjhz.query.filter_by(file_id=2).one()
+        assert {r.rcjhz_id for r in Rcjhzmx.query.filter_by(file_id=2)} == {second_rcjhz.id}
+
+    def test_id_allocator_locks_table_on_sqlite(self, tmp_path):
+        """测试SQLite上分配ID时取得写锁，另一个导入要等前一个提交后才能从新的最大ID继续分配"""
+        from sqlalchemy import create_engine
+        from sqlalchemy.exc import OperationalError
+        from app.models.models_13jt import Rcjhzmx
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'ids.sqlite'}", connect_args={'timeout': 0.1})
+        table = Rcjhzmx.__table__
+        table.create(engine)
+        with engine.connect() as first, engine.connect() as second:
+            assert import_13jt_dynamic.IdAllocator(first).next_id(table) == 1
+            with pytest.raises(OperationalError):
+                import_13jt_dynamic.IdAllocator(second).next_id(table)
+            second.rollback()
+
+            first.execute(table.insert(), {'id': 1, 'create_time': datetime.now(), 'update_time': datetime.now()})
+            first.commit()
+            assert import_13jt_dynamic.IdAllocator(second).next_id(table) == 2
+        engine.dispose()
+
+    def test_id_allocator_mysql_locking_read(self):
+        """测试MySQL上以加锁读取最大ID，表名由方言处理引号"""
+        from unittest.mock import MagicMock
+        from sqlalchemy.engine import Connection
+        from sqlalchemy.dialects import mysql
+        from app.models.models_13jt import Rcjhzmx
+
+        connection = MagicMock(spec=Connection)
+        connection.dialect = mysql.pymysql.dialect()
+        connection.execute.return_value.scalar.return_value = 41
+        allocator = import_13jt_dynamic.IdAllocator(connection)
+
+        assert [allocator.next_id(Rcjhzmx.__table__) for _ in range(2)] == [42, 43]
+        connection.execute.assert_called_once()
+        sql = str(connection.execute.call_args[0][0].compile(dialect=connection.dialect))
+        assert sql.endswith('FOR UPDATE')
+        assert '"' not in sql
+
+    def test_unknown_engine(self, app, sample_13jt_path):
+        """测试未知导入引擎"""
+        models = import_13jt_dynamic.get_all_models()
+        with pytest.raises(ValueError):
+            import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, engine='unknown')
+
+
+class TestImportSchema:
+    """预编译导入模式测试类"""
+
+    def test_compile_schema(self, app):
+        """测试标签到模型的分发表及列白名单"""
+        from app.models.models_13jt import Rcjhzmx
+
+        schema = import_13jt_dynamic.compile_import_schema(import_13jt_dynamic.get_all_models())
+        spec = schema['rcjhzmx']
+
+        assert spec.model is Rcjhzmx
+        assert {'mc', 'dj', 'sl', 'hj'} <= spec.columns
+        assert 'id' not in spec.columns
+        assert 'create_time' not in spec.columns
+        assert spec.parent_fk_columns == {'file_id', 'jingjibiao_id', 'dxgcxx_id', 'dwgcxx_id', 'rcjhz_id'}
+
+    def test_build_row_uses_whitelist(self, app):
+        """测试只保留白名单中的属性，外键和主键不能由XML属性覆盖"""
+        schema = import_13jt_dynamic.get_import_schema()
+        row = schema['rcjhzmx'].build_row({'Mc': '中砂', 'Dj': '120', 'Id': '99', 'Rcjhz_id': '5', 'Unknown': 'x'})
+
+        assert row == {'mc': '中砂', 'dj': '120', 'dj_num': Decimal('120')}
+
+    def test_schema_is_cached(self, app):
+        """测试同一组模型只编译一次"""
+        assert import_13jt_dynamic.get_import_schema() is import_13jt_dynamic.get_import_schema()
+
+
+class TestParallelImport:
+    """多进程并行导入测试类"""
+
+    def test_parallel_matches_bulk_import(self, app, sample_13jt_path):
+        """测试并行导入与单文件批量导入结果一致"""
+        from app.services.import_13jt_parallel import import_13jt_parallel
+
+        models = import_13jt_dynamic.get_all_models()
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1)
+        expected = snapshot_13jt_tables(models)
+        del expected['origin_13jt_file']
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+        summary = import_13jt_parallel([sample_13jt_path], db.engine, workers=1, batch_size=2)
+        actual = snapshot_13jt_tables(models)
+
+        assert summary.succeeded[0].file_id == 1
+        assert summary.total_rows == sum(len(rows) for rows in expected.values())
+        assert len(actual.pop('origin_13jt_file')) == 1
+        assert actual == expected
+
+    def test_parallel_continues_past_failures(self, app, sample_13jt_path, tmp_path):
+        """测试解析失败的文件不影响其他文件，重复文件被跳过"""
+        from app.models.models_13jt import File, Rcjhz, Rcjhzmx
+        from app.services.import_13jt_parallel import import_13jt_parallel
+
+        second = tmp_path / 'second.13jt'
+        second.write_text(SAMPLE_13JT.replace('R001', 'R101'), encoding='utf-8')
+        duplicate = tmp_path / 'duplicate.13jt'
+        duplicate.write_text(SAMPLE_13JT, encoding='utf-8')
+        broken = tmp_path / 'broken.13jt'
+        broken.write_text('<JingJiBiao><Dxgcxx>', encoding='utf-8')
+
+        reported = []
+        summary = import_13jt_parallel(
+            [sample_13jt_path, str(second), str(duplicate), str(broken)], db.engine,
+            workers=2, on_result=reported.append
+        )
+
+        assert len(reported) == 4
+        assert len(summary.succeeded) == 2
+        assert len(summary.skipped) == 1
+        assert [r.path for r in summary.failed] == [str(broken)]
+        assert File.query.count() == 2
+        for file in File.query.all():
+            rcjhz = Rcjhz.query.filter_by(file_id=file.id).one()
+            assert {r.rcjhz_id for r in Rcjhzmx.query.filter_by(file_id=file.id)} == {rcjhz.id}
+        assert summary.rows_per_second > 0
+
+
+    def test_parallel_imports_uploaded_file(self, app, sample_13jt_path):
+        """测试已上传未解析的文件导入到已有的File行下，再次导入时按导入清单跳过"""
+        from app.models import ImportManifest
+        from app.models.models_13jt import File, Rcjhzmx
+        from app.services.import_13jt_parallel import import_13jt_parallel
+
+        file_hash = import_13jt_dynamic.calculate_file_hash(sample_13jt_path)
+        db.session.add(File(id=5, hash=file_hash, filename='uploaded.13jt', filesize=1, filetype='13jt'))
+        db.session.commit()
+
+        summary = import_13jt_parallel([sample_13jt_path], db.engine, workers=1)
+        assert summary.succeeded[0].file_id == 5
+        assert File.query.count() == 1
+        assert Rcjhzmx.query.filter_by(file_id=5).count() == 3
+        assert ImportManifest.query.one().file_id == 5
+
+        summary = import_13jt_parallel([sample_13jt_path], db.engine, workers=1)
+        assert summary.skipped[0].file_id == 5
+        assert summary.skipped[0].importer_version == import_13jt_dynamic.IMPORTER_VERSION
+        # 按导入清单在主进程中跳过，没有解析文件
+        assert summary.skipped[0].parse_seconds == 0.0
+
+        summary = import_13jt_parallel([sample_13jt_path], db.engine, workers=1, mode='replace')
+        assert summary.succeeded[0].file_id == 5
+        assert Rcjhzmx.query.count() == 3
+
+    def test_parallel_keeps_legacy_import(self, app, sample_13jt_path):
+        """测试没有导入清单但已有行的文件补写清单后跳过，不删除已有的行"""
+        from app.models import ImportManifest
+        from app.models.models_13jt import File, Rcjhzmx
+        from app.services.import_13jt_parallel import import_13jt_parallel
+
+        models = import_13jt_dynamic.get_all_models()
+        db.session.add(File(id=1, hash=import_13jt_dynamic.calculate_file_hash(sample_13jt_path),
+                            filename='legacy.13jt', filesize=1, filetype='13jt'))
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1)
+        old_ids = {r.id for r in Rcjhzmx.query}
+
+        summary = import_13jt_parallel([sample_13jt_path], db.engine, workers=1)
+
+        assert summary.skipped[0].file_id == 1
+        assert {r.id for r in Rcjhzmx.query} == old_ids
+        assert ImportManifest.query.one().file_id == 1
+
+
+class TestInsertBackends:
+    """批量写入方式测试类"""
+
+    def test_resolve_insert_backend(self):
+        """测试auto在PostgreSQL上选择COPY，其他数据库回退到executemany"""
+        assert import_13jt_dynamic.resolve_insert_backend('postgresql') == 'copy'
+        assert import_13jt_dynamic.resolve_insert_backend('sqlite') == 'executemany'
+        assert import_13jt_dynamic.resolve_insert_backend('mysql') == 'executemany'
+        assert import_13jt_dynamic.resolve_insert_backend('postgresql', 'executemany') == 'executemany'
+        with pytest.raises(ValueError):
+            import_13jt_dynamic.resolve_insert_backend('sqlite', 'copy')
+        with pytest.raises(ValueError):
+            import_13jt_dynamic.resolve_insert_backend('sqlite', 'unknown')
+
+    @pytest.mark.parametrize('driver', ['psycopg2', 'psycopg'])
+    def test_copy_rows_csv(self, app, driver):
+        """测试COPY语句及CSV数据：缺失列为NULL，空字符串与引号被保留"""
+        from unittest.mock import MagicMock
+        from sqlalchemy.engine import Connection
+        from sqlalchemy.dialects.postgresql import psycopg, psycopg2
+        from app.models.models_13jt import Rcjhzmx
+
+        connection = MagicMock(spec=Connection)
+        connection.dialect = {'psycopg2': psycopg2, 'psycopg': psycopg}[driver].dialect()
+        cursor = connection.connection.dbapi_connection.cursor.return_value
+        captured = {}
+        cursor.copy_expert.side_effect = lambda sql, buffer: captured.update(sql=sql, data=buffer.read())
+        copy = MagicMock()
+        copy.write.side_effect = lambda data: captured.update(data=data)
+        cursor.copy.return_value.__enter__.return_value = copy
+        cursor.copy.side_effect = lambda sql: captured.update(sql=sql) or cursor.copy.return_value
+
+        import_13jt_dynamic.copy_rows(connection, Rcjhzmx.__table__, [
+            {'id': 1, 'mc': '中"砂', 'dw': ''},
+            {'id': 2, 'dj': '120'},
+        ])
+
+        assert captured['sql'] == 'COPY origin_13jt_rcjhzmx (id, mc, dw, dj) FROM STDIN WITH (FORMAT csv)'
+        assert captured['data'] == '"1","中""砂","",\n"2",,,"120"\n'
+        cursor.close.assert_called_once()
+
+    def test_bulk_executemany_backend(self, app, sample_13jt_path):
+        """测试显式指定executemany写入"""
+        from app.models.models_13jt import Rcjhzmx
+
+        models = import_13jt_dynamic.get_all_models()
+        counts = import_13jt_dynamic.import_13jt_file(
+            sample_13jt_path, models, db.session, 1, backend='executemany'
+        )
+        assert counts['origin_13jt_rcjhzmx'] == Rcjhzmx.query.count() == 3
+
+
+class TestImportManifest:
+    """导入清单及重复导入模式测试类"""
+
+    def test_skip_does_not_duplicate_rows(self, app, sample_13jt_path):
+        """测试skip模式重复导入时不产生重复行"""
+        from app.models import ImportManifest
+        from app.models.models_13jt import Rcjhzmx
+
+        models = import_13jt_dynamic.get_all_models()
+        first = import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, mode='skip')
+        second = import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, mode='skip')
+
+        assert first == second
+        assert Rcjhzmx.query.count() == 3
+        manifest = ImportManifest.query.one()
+        assert manifest.file_id == 1
+        assert manifest.importer_version == import_13jt_dynamic.IMPORTER_VERSION
+
+    def test_replace_reloads_rows(self, app, sample_13jt_path):
+        """测试replace模式删除已导入的行及其分类关联后重新导入"""
+        from app.models.models_13jt import Rcjhzmx
+        from app.models.RcjMCClassifyBig import RcjItem2ClassifyRleationship
+
+        models = import_13jt_dynamic.get_all_models()
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, mode='skip')
+        old_ids = {r.id for r in Rcjhzmx.query}
+        db.session.execute(RcjItem2ClassifyRleationship.insert().values(
+            rcjhzmx_id=min(old_ids), rcjmcclassifybig_id=1, create_time=db.func.now(), update_time=db.func.now()
+        ))
+        db.session.commit()
+
+        counts = import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, mode='replace')
+
+        assert counts['origin_13jt_rcjhzmx'] == Rcjhzmx.query.count() == 3
+        assert db.session.execute(db.select(db.func.count()).select_from(RcjItem2ClassifyRleationship)).scalar() == 0
+
+    def test_skip_keeps_legacy_import(self, app, sample_13jt_path):
+        """测试没有导入清单的旧数据在skip模式下补写清单后跳过，不删除已有行及其分类关联"""
+        from app.models import ImportManifest
+        from app.models.models_13jt import Rcjhzmx
+        from app.models.RcjMCClassifyBig import RcjItem2ClassifyRleationship
+
+        models = import_13jt_dynamic.get_all_models()
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1)
+        old_ids = {r.id for r in Rcjhzmx.query}
+        db.session.execute(RcjItem2ClassifyRleationship.insert().values(
+            rcjhzmx_id=min(old_ids), rcjmcclassifybig_id=1, create_time=db.func.now(), update_time=db.func.now()
+        ))
+        db.session.commit()
+
+        counts = import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, mode='skip')
+
+        assert counts['origin_13jt_rcjhzmx'] == 3
+        assert {r.id for r in Rcjhzmx.query} == old_ids
+        assert db.session.execute(db.select(db.func.count()).select_from(RcjItem2ClassifyRleationship)).scalar() == 1
+        manifest = ImportManifest.query.one()
+        assert manifest.file_id == 1
+        assert import_13jt_dynamic.verify_13jt_import(sample_13jt_path, models, db.session, 1)['match'] is True
+
+    def test_verify(self, app, sample_13jt_path):
+        """测试verify比较文件、清单与数据库行数"""
+        models = import_13jt_dynamic.get_all_models()
+
+        report = import_13jt_dynamic.verify_13jt_import(sample_13jt_path, models, db.session, 1)
+        assert report['imported'] is False
+        assert report['match'] is False
+        assert report['tables']['origin_13jt_rcjhzmx'] == {'file': 3, 'manifest': 0, 'database': 0}
+
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, mode='skip')
+        report = import_13jt_dynamic.verify_13jt_import(sample_13jt_path, models, db.session, 1)
+        assert report['match'] is True
+
+        # 绕过清单再导入一次，数据库行数与清单不一致
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1)
+        report = import_13jt_dynamic.verify_13jt_import(sample_13jt_path, models, db.session, 1)
+        assert report['match'] is False
+        assert report['tables']['origin_13jt_rcjhzmx'] == {'file': 3, 'manifest': 3, 'database': 6}
+
+    def test_unknown_mode(self, app, sample_13jt_path):
+        """测试未知导入模式"""
+        models = import_13jt_dynamic.get_all_models()
+        with pytest.raises(ValueError):
+            import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, mode='verify')
+
+
+class TestTypedShadowColumns:
+    """类型化影子列测试类"""
+
+    def test_parse_values(self):
+        """测试数值、日期原文的转换，无法转换时为None"""
+        from app.services.typed_columns import parse_numeric, parse_date
+
+        assert parse_numeric(' 1,234.50 ') == Decimal('1234.50')
+        assert parse_numeric('-3') == Decimal('-3')
+        assert parse_numeric('-99999999999999.9999') == Decimal('-99999999999999.9999')
+        for value in (None, '', '  ', '-', 'abc', 'NaN', 'Infinity', '1e14', '-100000000000000', 10 ** 20):
+            assert parse_numeric(value) is None
+
+        assert parse_date('2024-05-01') == date(2024, 5, 1)
+        assert parse_date('2024/5/1 10:30:00') == date(2024, 5, 1)
+        assert parse_date('20240501') == date(2024, 5, 1)
+        assert parse_date('2024年5月1日') == date(2024, 5, 1)
+        for value in (None, '', '2024-13-01', '五月'):
+            assert parse_date(value) is None
+
+    @pytest.mark.parametrize('engine', ['tree', 'bulk'])
+    def test_import_fills_shadow_columns(self, app, sample_13jt_path, engine):
+        """测试导入时同时写入原文和影子列"""
+        from app.models.models_13jt import Rcjhzmx, Toubiaoxx
+
+        models = import_13jt_dynamic.get_all_models()
+        import_13jt_dynamic.import_13jt_file(sample_13jt_path, models, db.session, 1, engine=engine)
+
+        rows = Rcjhzmx.query.order_by(Rcjhzmx.id).all()
+        assert [r.dj for r in rows] == ['450.5', '120', '150']
+        assert [r.dj_num for r in rows] == [Decimal('450.5'), Decimal('120'), Decimal('150')]
+        assert [r.hj_num for r in rows] == [Decimal('4505'), Decimal('360'), Decimal('3000')]
+        assert Toubiaoxx.query.one().bztime_date == date(2024, 5, 1)
+
+        total = db.session.query(db.func.sum(Rcjhzmx.sl_num)).filter(Rcjhzmx.dj_num > 130).scalar()
+        assert total == Decimal('30')
+
+    def test_backfill(self, app):
+        """测试补齐已有行的影子列，update_time保持不变，可重复执行"""
+        from app.models.models_13jt import Rcjhzmx
+        from app.services.typed_columns import backfill_shadow_columns
+
+        update_time = datetime(2024, 1, 1, 8, 0, 0)
+        values = ['12.5', 'abc', None] * 3
+        db.session.execute(Rcjhzmx.__table__.insert(), [
+            {'id': i + 1, 'mc': f'材料{i}', 'dj': value, 'sl': '2', 'create_time': update_time,
+             'update_time': update_time}
+            for i, value in enumerate(values)
+        ])
+        db.session.commit()
+
+        batches = []
+        for _ in range(2):
+            updated = backfill_shadow_columns(
+                db.session, [Rcjhzmx.__table__], batch_size=4,
+                progress_callback=lambda table, last_id, count: batches.append(last_id)
+            )
+            db.session.commit()
+            assert updated == 9
+        assert batches == [4, 8, 9] * 2
+
+        rows = Rcjhzmx.query.order_by(Rcjhzmx.id).all()
+        assert [r.dj_num for r in rows] == [Decimal('12.5'), None, None] * 3
+        assert all(r.sl_num == Decimal('2') for r in rows)
+        assert all(r.update_time == update_time for r in rows)
+
+    def test_missing_shadow_columns(self, app):
+        """测试检查已有表中缺少的影子列（create_all不会添加列）"""
+        from app.models.models_13jt import Rcjhzmx
+        from app.services.typed_columns import missing_shadow_columns
+
+        table = Rcjhzmx.__table__
+        assert missing_shadow_columns(db.engine, [table]) == []
+
+        db.session.execute(db.text(f'ALTER TABLE {table.name} DROP COLUMN hj_num'))
+        db.session.commit()
+        assert missing_shadow_columns(db.engine, [table]) == [f'{table.name}.hj_num']
@@ -0,0 +1,113 @@
+"""
+M3列式导出测试
+"""
+import os
+from datetime import date
+
+import pytest
+from app import create_app, db
+from app.models.dict import RcjEjfl, RcjEjflSx
+from app.models.RcjMCClassifyBig import RcjMCClassifyBig
+from app.services import m3_export
+from app.services.m3_export import M3ExportService, ExportUnavailableError
+from app.services.matrix_service import MatrixService
+
+
+@pytest.fixture
+def app(tmp_path):
+    """创建测试应用，导出文件写入临时目录"""
+    app = create_app('testing')
+    app.config['M3_EXPORT_CACHE_DIR'] = str(tmp_path / 'm3_export')
+    app.config['M3_STREAM_BATCH_SIZE'] = 4
+
+    with app.app_context():
+        db.create_all()
+        ejfl = RcjEjfl(id='0101', ejflmc='钢筋')
+        ejfl._sxs = [RcjEjflSx(id='0001', sx='牌号'), RcjEjflSx(id='0002', sx='直径')]
+        db.session.add(ejfl)
+        db.session.add_all([
+            RcjMCClassifyBig(ejflid='0101', ejflmc='钢筋', original_rcjmc=f'钢筋{i}', rcjdw='t',
+                             rcjdj=3000.0 + i, bjsj=date(2024, 1, i + 1), sx_0001=f'HRB{i}',
+                             sx_0002=None if i % 2 else f'{i}mm')
+            for i in range(10)
+        ])
+        db.session.add(RcjMCClassifyBig(ejflid='0103', ejflmc='钢丝'))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class TestM3Export:
+    """M3导出测试类"""
+
+    @pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+    def test_export_matches_m3(self, app, fmt):
+        """测试导出文件的列和值与get_m3一致，分多个RecordBatch写出"""
+        pa = pytest.importorskip('pyarrow')
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        path, _ = M3ExportService().export_m3('0101', fmt)
+        if fmt == 'parquet':
+            table = pa.parquet.read_table(path)
+        else:
+            reader = pa.ipc.open_file(path)
+            assert reader.num_record_batches == 3
+            table = reader.read_all()
+
+        expected = MatrixService().get_m3('0101')
+        rows = table.to_pylist()
+        assert table.column_names == list(expected[0].keys())
+        assert table.schema.field('bjsj').type == pa.date32()
+        for row in rows:
+            row['bjsj'] = row['bjsj'].strftime('%Y-%m-%d')
+        assert rows == expected
+
+    def test_cache_reused_until_data_changes(self, app):
+        """测试数据未变化时复用缓存文件，记录变化后生成新版本并删除旧文件"""
+        pytest.importorskip('pyarrow')
+        service = M3ExportService()
+        path, version = service.export_m3('0101', 'arrow')
+        mtime = os.stat(path).st_mtime_ns
+        assert service.export_m3('0101', 'arrow') == (path, version)
+        assert os.stat(path).st_mtime_ns == mtime
+
+        db.session.add(RcjMCClassifyBig(ejflid='0101', ejflmc='钢筋', original_rcjmc='钢筋新'))
+        db.session.commit()
+        new_path, new_version = service.export_m3('0101', 'arrow')
+        assert new_version != version
+        assert not os.path.exists(path)
+        assert os.listdir(os.path.dirname(new_path)) == [os.path.basename(new_path)]
+
+    def test_export_endpoint(self, client):
+        """测试导出接口返回文件并支持ETag条件请求"""
+        pytest.importorskip('pyarrow')
+        response = client.get('/api/v1/matrix/m3/export?ejflid=0101&format=arrow')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/vnd.apache.arrow.file'
+        etag = response.headers['ETag']
+        response.close()
+
+        response = client.get('/api/v1/matrix/m3/export?ejflid=0101&format=arrow',
+                              headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert client.get('/api/v1/matrix/m3/export?ejflid=9999').status_code == 404
+
+    def test_export_endpoint_validation(self, client, monkeypatch):
+        """测试参数错误返回400，未安装pyarrow时返回501"""
+        assert client.get('/api/v1/matrix/m3/export').status_code == 400
+        assert client.get('/api/v1/matrix/m3/export?ejflid=0101&format=csv').status_code == 400
+
+        def missing_pyarrow():
+            raise ExportUnavailableError('M3导出需要安装pyarrow')
+
+        monkeypatch.setattr(m3_export, '_import_pyarrow', missing_pyarrow)
+        response = client.get('/api/v1/matrix/m3/export?ejflid=0101')
+        assert response.status_code == 501
+        assert response.get_json()['code'] == 'INTERNAL_ERROR'
@@ -0,0 +1,156 @@
+"""
+M3价格统计测试
+"""
+import statistics
+from datetime import date
+
+import pytest
+from app import create_app, db
+from app.models.dict import RcjEjfl, RcjEjflSx
+from app.models.RcjMCClassifyBig import RcjMCClassifyBig
+from app.services import m3_stats
+from app.services.m3_stats import M3StatsService, StatsUnavailableError, compute_group_stats, encode_groups
+from app.services.classify_projection import backfill_sx_values
+
+# (牌号, 直径, 单价)，HRB400/12mm 组中的 9000 为异常值
+ROWS = [
+    ('HRB400', '12mm', 4000.0), ('HRB400', '12mm', 4100.0), ('HRB400', '12mm', 4050.0),
+    ('HRB400', '12mm', 4080.0), ('HRB400', '12mm', 9000.0),
+    ('HRB400', '16mm', 3900.0), ('HRB400', '16mm', 3950.0),
+    ('HPB300', '12mm', 3800.0),
+    ('HPB300', None, 3700.0), ('HPB300', None, 3750.0),
+]
+
+
+@pytest.fixture
+def app():
+    """创建测试应用"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        ejfl = RcjEjfl(id='0101', ejflmc='钢筋')
+        ejfl._sxs = [RcjEjflSx(id='0001', sx='牌号'), RcjEjflSx(id='0002', sx='直径')]
+        db.session.add(ejfl)
+        db.session.add_all([
+            RcjMCClassifyBig(ejflid='0101', ejflmc='钢筋', rcjdj=price, bjsj=date(2024, 1 + i % 12, 1),
+                             sx_0001=grade, sx_0002=diameter)
+            for i, (grade, diameter, price) in enumerate(ROWS)
+        ])
+        # 没有单价的记录不参与统计
+        db.session.add(RcjMCClassifyBig(ejflid='0101', ejflmc='钢筋', sx_0001='HRB400', sx_0002='12mm'))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class TestGroupStats:
+    """分组统计计算测试类"""
+
+    def test_matches_reference(self):
+        """测试分组统计与逐组计算的结果一致"""
+        np = pytest.importorskip('numpy')
+        rng = np.random.default_rng(0)
+        prices = rng.lognormal(8, 0.5, 5000)
+        keys = [rng.choice(['A', 'B', 'C', None], 5000).tolist(), rng.choice(['x', 'y', ''], 5000).tolist()]
+        codes = encode_groups(keys, 5000)
+        groups = compute_group_stats(prices, codes, ids=np.arange(5000), percentiles=(10, 90))
+
+        assert len(groups) == len({(a, b) for a, b in zip(*keys)}) == 12
+        for group in groups:
+            key = (keys[0][group['row']], keys[1][group['row']])
+            members = prices[[i for i in range(5000) if (keys[0][i], keys[1][i]) == key]]
+            assert group['count'] == len(members)
+            assert group['min'] == members.min() and group['max'] == members.max()
+            assert group['mean'] == pytest.approx(members.mean())
+            assert group['median'] == pytest.approx(statistics.median(members))
+            assert group['percentiles']['10'] == pytest.approx(np.percentile(members, 10))
+            assert group['percentiles']['90'] == pytest.approx(np.percentile(members, 90))
+            q1, q3 = np.percentile(members, [25, 75])
+            outliers = (members < q1 - 1.5 * (q3 - q1)) | (members > q3 + 1.5 * (q3 - q1))
+            assert group['outlier_count'] == outliers.sum()
+            assert len(group['outlier_ids']) == min(outliers.sum(), m3_stats.MAX_OUTLIER_IDS)
+
+    def test_empty(self):
+        """测试没有数据时返回空列表"""
+        pytest.importorskip('numpy')
+        assert compute_group_stats([], []) == []
+
+
+class TestM3Stats:
+    """M3价格统计服务测试类"""
+
+    @pytest.mark.parametrize('storage', ['wide', 'sparse'])
+    def test_stats_by_attribute_combination(self, app, storage):
+        """测试二级分类汇总和按属性值组合分组的统计"""
+        pytest.importorskip('numpy')
+        if storage == 'sparse':
+            backfill_sx_values(db.session)
+            db.session.commit()
+        app.config['CLASSIFY_SX_STORAGE'] = storage
+
+        result = M3StatsService().get_m3_stats('0101')
+        assert sorted(result['group_by']) == ['0001', '0002']
+        assert result['summary']['count'] == len(ROWS)
+        assert result['summary']['median'] == statistics.median(price for _, _, price in ROWS)
+        assert result['summary']['bjsj_min'] == '2024-01-01'
+        assert result['summary']['bjsj_max'] == '2024-10-01'
+
+        groups = {(g['key']['0001'], g['key']['0002']): g for g in result['groups']}
+        assert set(groups) == {('HRB400', '12mm'), ('HRB400', '16mm'), ('HPB300', '12mm'), ('HPB300', None)}
+        rebar = groups[('HRB400', '12mm')]
+        assert rebar['count'] == 5
+        assert rebar['median'] == 4080.0
+        assert rebar['outlier_count'] == 1
+        assert len(rebar['outlier_ids']) == 1
+        assert groups[('HPB300', None)]['mean'] == 3725.0
+
+    def test_group_subset_and_cache(self, app):
+        """测试按部分属性分组，结果缓存到分类记录变化为止"""
+        pytest.importorskip('numpy')
+        service = M3StatsService()
+        result = service.get_m3_stats('0101', ['0001'], percentiles=[50])
+        assert [g['key'] for g in result['groups']] == [{'0001': 'HPB300'}, {'0001': 'HRB400'}]
+        assert result['summary']['percentiles'] == {'50': result['summary']['median']}
+        assert service.get_m3_stats('0101', ['0001'], percentiles=[50]) is result
+
+        db.session.add(RcjMCClassifyBig(ejflid='0101', ejflmc='钢筋', rcjdj=1.0, sx_0001='HPB300'))
+        db.session.commit()
+        updated = service.get_m3_stats('0101', ['0001'], percentiles=[50])
+        assert updated is not result
+        assert updated['summary']['count'] == len(ROWS) + 1
+
+        assert service.get_m3_stats('0101', [])['groups'] == []
+        with pytest.raises(ValueError):
+            service.get_m3_stats('0101', ['0003'])
+
+    def test_stats_endpoint(self, client):
+        """测试统计接口的参数处理"""
+        pytest.importorskip('numpy')
+        response = client.get('/api/v1/matrix/m3/stats?ejflid=0101&sxids=0002&percentiles=10,90')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['group_by'] == ['0002']
+        assert set(data['summary']['percentiles']) == {'10', '90'}
+
+        assert client.get('/api/v1/matrix/m3/stats?ejflid=9999').status_code == 404
+        assert client.get('/api/v1/matrix/m3/stats?ejflid=0101&sxids=0003').status_code == 400
+
+    def test_stats_endpoint_validation(self, client, monkeypatch):
+        """测试参数错误返回400，未安装numpy时返回501"""
+        assert client.get('/api/v1/matrix/m3/stats').status_code == 400
+        assert client.get('/api/v1/matrix/m3/stats?ejflid=0101&percentiles=abc').status_code == 400
+        assert client.get('/api/v1/matrix/m3/stats?ejflid=0101&percentiles=101').status_code == 400
+
+        def missing_numpy():
+            raise StatsUnavailableError('M3统计需要安装numpy')
+
+        monkeypatch.setattr(m3_stats, '_import_numpy', missing_numpy)
+        response = client.get('/api/v1/matrix/m3/stats?ejflid=0101')
+        assert response.status_code == 501
@@ -0,0 +1,465 @@
+"""
+文件分类树及人材机名称分类查询测试
+"""
+import json
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from config import config
+from app.models.models_13jt import File, Rcjhzmx, Jingjibiao, Toubiaoxx
+from app.models.RcjMCClassifyBig import RcjMCClassifyBig, RcjMCClassifySx, RcjItem2ClassifyRleationship
+from app.models.file_classify_summary import FileClassifySummary
+from app.models.dict import RcjYjfl, RcjEjfl, RcjEjflSx
+from app.dto.dict import RcjYjflRequestDTO, RcjEjflRequestDTO, RcjYjflUpdateRequestDTO
+from app.services.dict_service import DictService
+from app.services.dict_cache import get_dict_snapshot
+from app.services.matrix_service import MatrixService
+from app.services.classify_projection import ClassifyProjection, backfill_sx_values, load_sx_values
+from app.services.file_classify_summary import (
+    get_file_classify_summary, query_file_classify_counts, refresh_file_classify_summary
+)
+
+
+@pytest.fixture
+def app():
+    """创建测试应用"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def create_classified_file(rcjhzmx_count, filename='test.13jt', hash_value='abc123'):
+    """创建一个文件及其rcjhzmx，rcjhzmx轮流关联到三个分类"""
+    file = File(hash=hash_value, filename=filename, filesize=0, filetype='13jt')
+    db.session.add(file)
+    db.session.flush()
+
+    classifies = [
+        RcjMCClassifyBig(yjflid='01', yjflmc='黑色及有色金属', ejflid='0101', ejflmc='钢筋'),
+        RcjMCClassifyBig(yjflid='01', yjflmc='黑色及有色金属', ejflid='0103', ejflmc='钢丝'),
+        RcjMCClassifyBig(yjflid='04', yjflmc='水泥、砖瓦灰砂石及混凝土制品', ejflid='0401', ejflmc='水泥'),
+        RcjMCClassifyBig(yjflid='04', yjflmc='水泥、砖瓦灰砂石及混凝土制品', ejflid='0401', ejflmc='水泥'),
+        # 没有二级分类的记录不计入
+        RcjMCClassifyBig(yjflid='05', yjflmc='木、竹材料及其制品', ejflid='', ejflmc=''),
+    ]
+    db.session.add_all(classifies)
+    for i in range(rcjhzmx_count):
+        rcjhzmx = Rcjhzmx(file_id=file.id, mc=f'材料{i}')
+        rcjhzmx.classify_info.append(classifies[i % len(classifies)])
+        db.session.add(rcjhzmx)
+    db.session.commit()
+    return file.id
+
+
+def count_queries(func):
+    """统计执行func期间发出的SQL语句数"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        result = func()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return result, len(statements)
+
+
+class TestFileClassificationTree:
+    """文件分类树测试类"""
+
+    def test_tree_structure(self, app):
+        """测试树形结构：同一分类被多条rcjhzmx引用只计一次"""
+        fileid = create_classified_file(10)
+
+        tree = MatrixService().get_tree(str(fileid))
+        assert len(tree) == 1
+        root = tree[0].to_dict()
+        assert root['title'] == 'test.13jt (4)'
+        assert root['key'] == f'file-{fileid}'
+        assert [node['key'] for node in root['children']] == ['yjfl-01', 'yjfl-04']
+
+        metal, cement = root['children']
+        assert metal['title'] == '01-黑色及有色金属 (2)'
+        assert [child['title'] for child in metal['children']] == ['0101-钢筋 (1)', '0103-钢丝 (1)']
+        assert cement['title'] == '04-水泥、砖瓦灰砂石及混凝土制品 (2)'
+        assert [child['key'] for child in cement['children']] == ['ejfl-0401']
+        assert cement['children'][0]['count'] == 2
+
+    def test_file_without_rcjhzmx(self, app):
+        """测试文件不存在或没有rcjhzmx时返回空列表"""
+        file = File(hash='empty', filename='empty.13jt', filesize=0, filetype='13jt')
+        db.session.add(file)
+        db.session.commit()
+
+        assert MatrixService().get_tree(str(file.id)) == []
+        assert MatrixService().get_tree('999') == []
+
+    def test_query_count_independent_of_rcjhzmx_count(self, app):
+        """测试查询数不随rcjhzmx数量增长"""
+        small = create_classified_file(5, 'small.13jt', 'small')
+        large = create_classified_file(200, 'large.13jt', 'large')
+        service = MatrixService()
+
+        db.session.expire_all()
+        _, small_queries = count_queries(lambda: service.get_tree(str(small)))
+        db.session.expire_all()
+        tree, large_queries = count_queries(lambda: service.get_tree(str(large)))
+
+        assert tree[0].count == 4
+        assert large_queries == small_queries
+        assert large_queries <= 2
+
+
+class TestFileClassifySummary:
+    """文件分类汇总表测试类"""
+
+    def test_summary_filled_on_link_changes(self, app):
+        """测试通过ORM修改关联后汇总表随flush刷新"""
+        fileid = create_classified_file(10)
+        assert get_file_classify_summary(db.session, fileid) == [
+            ('01', '黑色及有色金属', '0101', '钢筋', 1),
+            ('01', '黑色及有色金属', '0103', '钢丝', 1),
+            ('04', '水泥、砖瓦灰砂石及混凝土制品', '0401', '水泥', 2),
+        ]
+
+        # 去掉所有关联到钢丝的记录
+        for rcjhzmx in Rcjhzmx.query.filter_by(file_id=fileid).all():
+            rcjhzmx.classify_info = [c for c in rcjhzmx.classify_info if c.ejflid != '0103']
+        db.session.commit()
+        assert [row[2] for row in get_file_classify_summary(db.session, fileid)] == ['0101', '0401']
+
+        # 修改分类名称
+        classify = RcjMCClassifyBig.query.filter_by(ejflid='0101').first()
+        classify.ejflmc = '钢筋（盘圆）'
+        db.session.commit()
+        assert get_file_classify_summary(db.session, fileid)[0][3] == '钢筋（盘圆）'
+
+    def test_refresh_after_direct_link_writes(self, app):
+        """测试绕过ORM写关联表后手动刷新"""
+        fileid = create_classified_file(3)
+        db.session.execute(RcjItem2ClassifyRleationship.delete())
+        db.session.commit()
+        assert len(get_file_classify_summary(db.session, fileid)) == 3
+
+        assert refresh_file_classify_summary(db.session, fileid) == 0
+        db.session.commit()
+        assert FileClassifySummary.query.filter_by(file_id=fileid).count() == 0
+        assert MatrixService().get_tree(str(fileid))[0].count == 0
+
+    def test_tree_fills_missing_summary(self, app):
+        """测试汇总表上线前导入的文件（没有汇总行）回退到明细聚合并补写汇总"""
+        fileid = create_classified_file(10)
+        db.session.execute(FileClassifySummary.__table__.delete())
+        db.session.commit()
+
+        tree = MatrixService().get_tree(str(fileid))
+        assert tree[0].count == 4
+        assert [node.key for node in tree[0].children] == ['yjfl-01', 'yjfl-04']
+        assert len(get_file_classify_summary(db.session, fileid)) == 3
+
+    def test_summary_matches_detail_aggregate(self, app):
+        """测试汇总表与明细聚合结果一致"""
+        fileid = create_classified_file(50)
+        assert get_file_classify_summary(db.session, fileid) == sorted(
+            query_file_classify_counts(db.session, fileid), key=lambda row: row[2]
+        )
+
+
+class TestClassificationTree:
+    """完整分类树测试类"""
+
+    @pytest.fixture(autouse=True)
+    def mock_db(self):
+        """DictService使用真实的数据库会话（覆盖conftest中的模拟）"""
+        yield None
+
+    @pytest.fixture
+    def classifications(self, app):
+        db.session.add_all([
+            RcjYjfl(id='02', yjflmc='水泥'),
+            RcjYjfl(id='01', yjflmc='金属'),
+            RcjYjfl(id='03', yjflmc=None),
+            RcjEjfl(id='0103', yjfl_id='01', ejflmc='钢丝'),
+            RcjEjfl(id='0101', yjfl_id='01', ejflmc='钢筋'),
+            RcjEjfl(id='0201', yjfl_id='02', ejflmc=None),
+        ])
+        db.session.commit()
+
+    def test_tree_structure(self, classifications):
+        """测试一级、二级分类按ID排序，没有二级分类的一级分类也保留"""
+        root = MatrixService().get_tree()[0].to_dict()
+        assert root['title'] == '完整分类树 (3)'
+        assert [node['title'] for node in root['children']] == ['金属 (2)', '水泥 (1)', '一级分类03 (0)']
+        assert [child['key'] for child in root['children'][0]['children']] == ['ejfl-0101', 'ejfl-0103']
+        assert root['children'][1]['children'][0]['title'] == '二级分类0201 (1)'
+
+    def test_cached_until_dict_changes(self, classifications):
+        """测试分类树缓存命中不查询数据库，DictService修改分类后重新构建"""
+        service = MatrixService()
+        service.get_tree()
+        tree, queries = count_queries(lambda: service.get_tree())
+        assert queries == 0
+        assert tree[0].count == 3
+
+        dict_service = DictService()
+        dict_service.create_rcj_ejfl(RcjEjflRequestDTO(id='0301', ejflmc='木材', yjfl_id='03'))
+        assert service.get_tree()[0].count == 4
+
+        dict_service.update_rcj_yjfl('01', RcjYjflUpdateRequestDTO(yjflmc='黑色金属'))
+        assert service.get_tree()[0].children[0].title == '黑色金属 (2)'
+
+        dict_service.create_rcj_yjfl(RcjYjflRequestDTO(id='04', yjflmc='木材'))
+        assert len(service.get_tree()[0].children) == 4
+
+    def test_cache_disabled(self, app, classifications):
+        """测试缓存时间为0时每次都查询"""
+        app.config['CLASSIFICATION_TREE_CACHE_TTL'] = 0
+        service = MatrixService()
+        service.get_tree()
+        _, queries = count_queries(lambda: service.get_tree())
+        assert queries == 1
+
+
+class TestRcjMCClassifiesByFile:
+    """按文件和二级分类查询人材机名称分类测试类"""
+
+    @pytest.fixture
+    def classified_file(self, app):
+        file = File(hash='abc123', filename='test.13jt', filesize=0, filetype='13jt')
+        db.session.add(file)
+        db.session.flush()
+        jingjibiao = Jingjibiao(file_id=file.id)
+        db.session.add(jingjibiao)
+        db.session.flush()
+        db.session.add_all([
+            Toubiaoxx(file_id=file.id, jingjibiao_id=jingjibiao.id, bztime='2024-05-01'),
+            Toubiaoxx(file_id=file.id, jingjibiao_id=jingjibiao.id, bztime='2024-06-01'),
+        ])
+
+        ejfl = RcjEjfl(id='0101', ejflmc='钢筋')
+        ejfl._sxs = [RcjEjflSx(id='0002', sx='直径'), RcjEjflSx(id='0001', sx='牌号')]
+        db.session.add(ejfl)
+
+        rebar = RcjMCClassifyBig(ejflid='0101', ejflmc='钢筋', cleaned_rcjmc='钢筋', parsed_rcjmc='螺纹钢筋',
+                                 sx_0001='HRB400', sx_0002='12')
+        wire = RcjMCClassifyBig(ejflid='0103', ejflmc='钢丝', cleaned_rcjmc='钢丝')
+        first = Rcjhzmx(file_id=file.id, jingjibiao_id=jingjibiao.id, mc='螺纹钢筋 HRB400 Φ12', dw='t', dj='4200')
+        second = Rcjhzmx(file_id=file.id, jingjibiao_id=jingjibiao.id, mc='钢筋', dw='t', dj='4100')
+        first.classify_info = [rebar, wire]
+        second.classify_info = [rebar]
+        db.session.add_all([first, second])
+        db.session.commit()
+        return file.id, first.id
+
+    def test_payload(self, classified_file):
+        """测试只返回该二级分类，同一分类只返回一次"""
+        fileid, first_id = classified_file
+        result = MatrixService().get_rcj_mc_classifies_by_fileid(str(fileid), '0101')
+        assert result == [{
+            'id': first_id,
+            'original_rcjmc': '螺纹钢筋 HRB400 Φ12',
+            'dw': 't',
+            'dj': '4200',
+            'bjsj': '2024-05-01',
+            'cleaned_rcjmc': '钢筋',
+            'parsed_rcjmc': '螺纹钢筋',
+            '0002': '12',
+            '0001': 'HRB400',
+        }]
+
+    def test_query_count(self, classified_file):
+        """测试查询数固定，不随rcjhzmx数量增长"""
+        fileid, _ = classified_file
+        # 字典快照只在第一次读取时构建，不计入单次查询
+        get_dict_snapshot()
+        db.session.expire_all()
+        result, queries = count_queries(
+            lambda: MatrixService().get_rcj_mc_classifies_by_fileid(str(fileid), '0101')
+        )
+        assert len(result) == 1
+        assert queries <= 4
+
+    def test_sparse_storage(self, app, classified_file):
+        """测试稀疏存储时返回相同的结果"""
+        fileid, _ = classified_file
+        wide = MatrixService().get_rcj_mc_classifies_by_fileid(str(fileid), '0101')
+        backfill_sx_values(db.session)
+        db.session.commit()
+
+        app.config['CLASSIFY_SX_STORAGE'] = 'sparse'
+        assert MatrixService().get_rcj_mc_classifies_by_fileid(str(fileid), '0101') == wide
+
+    def test_unknown_ejfl(self, classified_file):
+        """测试二级分类不存在时返回空列表"""
+        fileid, _ = classified_file
+        assert MatrixService().get_rcj_mc_classifies_by_fileid(str(fileid), '9999') == []
+
+
+class TestClassifyProjection:
+    """RcjMCClassifyBig列投影测试类"""
+
+    @pytest.fixture
+    def m3_rows(self, app):
+        ejfl = RcjEjfl(id='0101', ejflmc='钢筋')
+        ejfl._sxs = [RcjEjflSx(id='0002', sx='直径'), RcjEjflSx(id='0001', sx='牌号'), RcjEjflSx(id='9999', sx='无此列')]
+        db.session.add(ejfl)
+        db.session.add_all([
+            RcjMCClassifyBig(yjflid='01', yjflmc='黑色及有色金属', ejflid='0101', ejflmc='钢筋', original_rcjmc='螺纹钢',
+                             rcjdw='t', rcjdj=4200.0, sx_0001='HRB400', sx_0002='12', sx_0003='不应返回'),
+            RcjMCClassifyBig(yjflid='01', yjflmc='黑色及有色金属', ejflid='0103', ejflmc='钢丝', original_rcjmc='钢丝'),
+        ])
+        db.session.commit()
+
+    def test_select_only_projected_columns(self, app):
+        """测试查询只包含基础列和存在的属性列"""
+        projection = ClassifyProjection(['0002', '0001', '9999'], base_columns=('id', 'ejflid'))
+        assert [column.name for column in projection.columns] == ['id', 'ejflid', 'sx_0002', 'sx_0001']
+        assert projection.sx_values((1, '0101', '12', 'HRB400')) == {'0002': '12', '0001': 'HRB400', '9999': None}
+        assert projection.base_values(('x', 1, '0101', '12', 'HRB400'), offset=1) == {'id': 1, 'ejflid': '0101'}
+
+    def test_get_m3(self, m3_rows):
+        """测试get_m3返回与整行加载时相同的字典"""
+        result = MatrixService().get_m3('0101')
+        assert len(result) == 1
+        item = result[0]
+        assert item['original_rcjmc'] == '螺纹钢'
+        assert item['dw'] == 't'
+        assert item['dj'] == 4200.0
+        assert item['bjsj'] is None
+        assert item['yjflmc'] == '黑色及有色金属'
+        assert sorted(list(item)[-3:]) == ['0001', '0002', '9999']
+        assert (item['0002'], item['0001'], item['9999']) == ('12', 'HRB400', None)
+        assert 'sx_0003' not in item
+
+        assert MatrixService().get_m3('9999') == []
+
+    def test_sparse_storage(self, app, m3_rows):
+        """测试稀疏存储迁移后读取结果与宽表一致"""
+        wide = MatrixService().get_m3('0101')
+
+        assert backfill_sx_values(db.session, batch_size=1) == 3
+        assert backfill_sx_values(db.session) == 3
+        db.session.commit()
+        assert RcjMCClassifySx.query.count() == 3
+
+        app.config['CLASSIFY_SX_STORAGE'] = 'sparse'
+        assert MatrixService().get_m3('0101') == wide
+        assert load_sx_values(db.session, [wide[0]['id'], 999], ['0001', '9999']) == {
+            wide[0]['id']: {'0001': 'HRB400', '9999': None},
+            999: {'0001': None, '9999': None},
+        }
+
+    def test_sparse_sync_on_orm_writes(self, app, m3_rows):
+        """测试sparse模式下通过ORM新增、修改、删除分类记录后稀疏表同步更新"""
+        def sparse_values(classify_id):
+            return dict(db.session.query(RcjMCClassifySx.sx_id, RcjMCClassifySx.value).filter_by(classify_id=classify_id).all())
+
+        app.config['CLASSIFY_SX_STORAGE'] = 'sparse'
+        classify = RcjMCClassifyBig(ejflid='0101', original_rcjmc='盘圆', sx_0001='HPB300')
+        db.session.add(classify)
+        db.session.commit()
+        assert sparse_values(classify.id) == {'0001': 'HPB300'}
+
+        classify = RcjMCClassifyBig.query.filter_by(original_rcjmc='螺纹钢').one()
+        classify.sx_0004 = '9'
+        db.session.commit()
+        assert sparse_values(classify.id) == {'0001': 'HRB400', '0002': '12', '0003': '不应返回', '0004': '9'}
+
+        classify.sx_0002 = '16'
+        classify.sx_0003 = None
+        db.session.commit()
+        assert sparse_values(classify.id) == {'0001': 'HRB400', '0002': '16', '0004': '9'}
+
+        # 只修改非属性列不重写稀疏表
+        classify.rcjdj = 4300.0
+        db.session.commit()
+        assert sparse_values(classify.id) == {'0001': 'HRB400', '0002': '16', '0004': '9'}
+
+        classify_id = classify.id
+        db.session.delete(classify)
+        db.session.commit()
+        assert sparse_values(classify_id) == {}
+
+    def test_wide_storage_skips_sparse_sync(self, app, m3_rows):
+        """测试wide模式下ORM写入不写稀疏表"""
+        classify = RcjMCClassifyBig.query.filter_by(original_rcjmc='螺纹钢').one()
+        classify.sx_0002 = '16'
+        db.session.add(RcjMCClassifyBig(ejflid='0101', original_rcjmc='盘圆', sx_0001='HPB300'))
+        db.session.commit()
+        db.session.delete(classify)
+        db.session.commit()
+        assert RcjMCClassifySx.query.count() == 0
+
+    def test_unknown_sx_storage_rejected(self, monkeypatch):
+        """测试未知的属性值存储方式在启动时报错"""
+        monkeypatch.setattr(config['testing'], 'CLASSIFY_SX_STORAGE', 'Sparse')
+        with pytest.raises(ValueError, match='CLASSIFY_SX_STORAGE'):
+            create_app('testing')
+
+
+class TestM3Pagination:
+    """M3游标分页与流式响应测试类"""
+
+    @pytest.fixture
+    def m3_category(self, app):
+        ejfl = RcjEjfl(id='0101', ejflmc='钢筋')
+        ejfl._sxs = [RcjEjflSx(id='0001', sx='牌号')]
+        db.session.add(ejfl)
+        db.session.add_all([
+            RcjMCClassifyBig(ejflid='0101', ejflmc='钢筋', original_rcjmc=f'钢筋{i}', sx_0001=f'HRB{i}')
+            for i in range(25)
+        ])
+        db.session.add(RcjMCClassifyBig(ejflid='0103', ejflmc='钢丝'))
+        db.session.commit()
+
+    @pytest.fixture
+    def client(self, app):
+        return app.test_client()
+
+    def test_keyset_pages(self, client, m3_category):
+        """测试按after_id翻页，最后一页没有next_after_id"""
+        ids = []
+        after_id = None
+        for _ in range(3):
+            url = '/api/v1/matrix/m3?ejflid=0101&limit=10'
+            if after_id is not None:
+                url += f'&after_id={after_id}'
+            response = client.get(url)
+            assert response.status_code == 200
+            page = response.get_json()
+            ids.extend(item['id'] for item in page['data'])
+            after_id = page['meta']['next_after_id']
+        assert after_id is None
+        assert page['meta']['has_next'] is False
+        assert len(page['data']) == 5
+        assert ids == sorted(ids) and len(set(ids)) == 25
+        assert ids == [item['id'] for item in MatrixService().get_m3('0101')]
+
+    def test_ndjson_stream(self, app, client, m3_category):
+        """测试NDJSON流式响应按批读取并逐行输出"""
+        app.config['M3_STREAM_BATCH_SIZE'] = 4
+        response = client.get('/api/v1/matrix/m3?ejflid=0101&format=ndjson&after_id=0')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        items = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert items == MatrixService().get_m3('0101')
+
+        response = client.get('/api/v1/matrix/m3?ejflid=0101&limit=3',
+                              headers={'Accept': 'application/x-ndjson'})
+        assert len(response.get_data(as_text=True).splitlines()) == 3
+
+    def test_legacy_list_and_invalid_params(self, client, m3_category):
+        """测试不传分页参数时仍返回列表，非法参数返回400"""
+        response = client.get('/api/v1/matrix/m3?ejflid=0101')
+        assert isinstance(response.get_json(), list)
+        assert len(response.get_json()) == 25
+
+        assert client.get('/api/v1/matrix/m3?ejflid=0101&limit=0').status_code == 400
+        assert client.get('/api/v1/matrix/m3?ejflid=0101&after_id=abc').status_code == 400
+        assert client.get('/api/v1/matrix/m3?ejflid=0101&limit=100000').status_code == 400
@@ -0,0 +1,119 @@
+"""
+人材机名称查找索引测试
+"""
+import pytest
+from app import create_app, db
+from app.models.dict import RcjYjfl, RcjEjfl, RcjMC2Ejflid, RcjMCClassify
+from app.dto.dict import RcjMC2EjflidRequestDTO
+from app.services.dict_service import DictService
+from app.services.name_index import NameIndexCache, get_name_index, normalize_name
+
+
+@pytest.fixture
+def app():
+    """创建测试应用"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        yjfl = RcjYjfl(id='01', yjflmc='黑色及有色金属')
+        db.session.add_all([
+            RcjEjfl(id='0101', ejflmc='钢筋', yjfl=yjfl),
+            RcjEjfl(id='0103', ejflmc='钢丝', yjfl=yjfl),
+            RcjMC2Ejflid(orignal_rcjmc='钢筋 ＨＲＢ４００ Φ12', ejflid='0101'),
+            RcjMC2Ejflid(orignal_rcjmc='没有分类', ejflid=None),
+            RcjMCClassify(cleaned_rcj_original_mc='镀锌钢丝', ejflid='0103'),
+            # 名称映射与名称分类冲突时以名称映射为准
+            RcjMCClassify(cleaned_rcj_original_mc='钢筋 ＨＲＢ４００ Φ12', ejflid='0103'),
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class TestNameIndex:
+    """名称查找索引测试类"""
+
+    @pytest.fixture(autouse=True)
+    def mock_db(self):
+        """使用真实数据库"""
+        yield None
+
+    def test_normalize_name(self):
+        """测试归一形式统一全角、大小写、直径符号和空白"""
+        assert normalize_name('钢筋 ＨＲＢ４００ Φ12') == normalize_name('钢筋hrb400  φ12') == '钢筋HRB400直径12'
+
+    def test_lookup(self, app):
+        """测试原样匹配、归一匹配和找不到的名称"""
+        results = DictService().lookup_rcj_mc_ejflids(
+            ['钢筋 ＨＲＢ４００ Φ12', '钢筋hrb400 φ12', ' 镀锌钢丝 ', '没有分类', '铝板', '', None]
+        )
+        assert [(item['ejflid'], item['match'], item['source']) for item in results] == [
+            ('0101', 'exact', 'mc2ejflid'),
+            ('0101', 'normalized', 'mc2ejflid'),
+            ('0103', 'normalized', 'classify'),
+            (None, None, None),
+            (None, None, None),
+            (None, None, None),
+            (None, None, None),
+        ]
+        assert results[0]['ejflmc'] == '钢筋'
+        assert results[0]['name'] == '钢筋 ＨＲＢ４００ Φ12'
+
+    def test_reload_on_dict_change(self, app):
+        """测试经DictService修改名称映射后重新构建索引"""
+        index = get_name_index()
+        assert get_name_index() is index
+
+        service = DictService()
+        service.create_rcj_mc2ejflid(RcjMC2EjflidRequestDTO(ejflid='0103', orignal_rcjmc='冷拔丝'))
+        assert get_name_index() is not index
+        assert service.lookup_rcj_mc_ejflids(['冷拔丝'])[0]['ejflid'] == '0103'
+
+        service.bulk_upsert_rcj_mc2ejflids([{'orignal_rcjmc': '冷拔丝', 'ejflid': '0101'}])
+        assert service.lookup_rcj_mc_ejflids(['冷拔丝'])[0]['ejflid'] == '0101'
+
+    def test_ttl_probe_without_rebuild(self, app):
+        """测试超过TTL时两张表没有变化则继续使用原索引，绕过DictService的修改在核对时发现"""
+        cache = app.extensions.setdefault('name_index', NameIndexCache())
+        index = cache.get_index()
+
+        cache._expires_at = 0.0
+        assert cache.get_index() is index
+
+        db.session.add(RcjMCClassify(cleaned_rcj_original_mc='冷拔丝', ejflid='0103'))
+        db.session.commit()
+        assert cache.get_index() is index
+        cache._expires_at = 0.0
+        rebuilt = cache.get_index()
+        assert rebuilt is not index
+        assert rebuilt.lookup('冷拔丝')[0] == ('0103', 'classify')
+
+    def test_serve_old_index_while_rebuilding(self, app):
+        """测试其他线程正在重新构建时直接返回旧索引，不等待"""
+        cache = app.extensions.setdefault('name_index', NameIndexCache())
+        index = cache.get_index()
+        DictService().create_rcj_mc2ejflid(RcjMC2EjflidRequestDTO(ejflid='0103', orignal_rcjmc='冷拔丝'))
+
+        with cache._lock:
+            assert cache.get_index() is index
+        assert cache.get_index().lookup('冷拔丝')[0] == ('0103', 'mc2ejflid')
+
+    def test_lookup_endpoint(self, client, app):
+        """测试批量查找接口"""
+        response = client.post('/api/v1/dict/rcj-mc2ejflids/lookup', json={'names': ['镀锌钢丝', '铝板']})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['matched'] == 1
+        assert [item['ejflid'] for item in data['data']] == ['0103', None]
+
+        assert client.post('/api/v1/dict/rcj-mc2ejflids/lookup', json=['镀锌钢丝']).status_code == 400
+        assert client.post('/api/v1/dict/rcj-mc2ejflids/lookup', json={'names': [1]}).status_code == 400
+        app.config['DICT_LOOKUP_MAX_NAMES'] = 1
+        assert client.post('/api/v1/dict/rcj-mc2ejflids/lookup', json={'names': ['a', 'b']}).status_code == 400
@@ -0,0 +1,142 @@
+"""
+人材机名称模糊搜索测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from app import create_app, db
+from app.models.dict import RcjYjfl, RcjEjfl, RcjMC2Ejflid, RcjMCClassify
+from app.dto.dict import RcjMC2EjflidRequestDTO, RcjMC2EjflidUpdateRequestDTO
+from app.services.dict_service import DictService
+from app.services.name_search import NameSearchIndex, bigrams, get_name_search_index
+
+
+@pytest.fixture
+def app():
+    """创建测试应用"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        yjfl = RcjYjfl(id='01', yjflmc='黑色及有色金属')
+        db.session.add_all([
+            RcjEjfl(id='0101', ejflmc='钢筋', yjfl=yjfl),
+            RcjEjfl(id='0103', ejflmc='钢丝', yjfl=yjfl),
+            RcjMC2Ejflid(orignal_rcjmc='螺纹钢筋 HRB400 Φ12', ejflid='0101'),
+            RcjMC2Ejflid(orignal_rcjmc='圆钢 HPB300', ejflid='0101'),
+            RcjMCClassify(cleaned_rcj_original_mc='镀锌钢丝', ejflid='0103'),
+            RcjMCClassify(cleaned_rcj_original_mc='镀锌铁丝', ejflid='0103'),
+            RcjMCClassify(cleaned_rcj_original_mc='', ejflid='0103'),
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def _names(results):
+    return [item['name'] for item in results]
+
+
+class TestNameSearch:
+    """名称模糊搜索测试类"""
+
+    @pytest.fixture(autouse=True)
+    def mock_db(self):
+        """使用真实数据库"""
+        yield None
+
+    def test_bigrams(self):
+        """测试按归一后的名称切分二元组"""
+        assert bigrams('钢 丝') == bigrams('钢丝') == {'钢丝'}
+        assert bigrams('丝') == {'丝'}
+        assert bigrams('  ') == set()
+        assert bigrams('hrb') == {'HR', 'RB'}
+
+    def test_search_ranking(self, app):
+        """测试按Dice系数排序，并带出二级分类名称"""
+        results = DictService().search_rcj_mc_names('镀锌钢丝网', 3)
+        assert _names(results) == ['镀锌钢丝', '镀锌铁丝']
+        assert results[0]['score'] == round(2 * 3 / (4 + 3), 4)
+        assert results[0]['source'] == 'classify'
+        assert results[0]['ejflmc'] == '钢丝'
+
+        results = DictService().search_rcj_mc_names('钢筋hrb400', 1)
+        assert _names(results) == ['螺纹钢筋 HRB400 Φ12']
+        assert results[0]['source'] == 'mc2ejflid'
+        assert results[0]['ejflid'] == '0101'
+        assert DictService().search_rcj_mc_names('铝板') == []
+
+    def test_candidate_limit(self):
+        """测试候选数超过上限后常见的二元组不再引入新候选"""
+        index = NameSearchIndex()
+        index._put('classify', 1, '镀锌钢丝', None)
+        index._put('classify', 2, '钢丝绳', None)
+        assert _names(index.search('镀锌钢丝', 10, max_candidates=1)) == ['镀锌钢丝']
+        assert _names(index.search('镀锌钢丝', 10)) == ['镀锌钢丝', '钢丝绳']
+
+    def test_incremental_refresh(self, app):
+        """测试经DictService修改后增量更新索引，而不是重新构建"""
+        index = get_name_search_index()
+        assert len(index) == 4
+
+        service = DictService()
+        created = service.create_rcj_mc2ejflid(RcjMC2EjflidRequestDTO(ejflid='0103', orignal_rcjmc='冷拔低碳钢丝'))
+        assert get_name_search_index() is index
+        assert _names(service.search_rcj_mc_names('冷拔钢丝', 1)) == ['冷拔低碳钢丝']
+
+        service.update_rcj_mc2ejflid(created.id, RcjMC2EjflidUpdateRequestDTO(orignal_rcjmc='冷轧带肋钢筋'))
+        assert _names(service.search_rcj_mc_names('冷拔', 5)) == []
+        assert _names(service.search_rcj_mc_names('冷轧带肋', 1)) == ['冷轧带肋钢筋']
+
+        service.delete_rcj_mc2ejflid(created.id)
+        assert service.search_rcj_mc_names('冷轧带肋', 5) == []
+
+        service.bulk_upsert_rcj_mc_classifies([{'cleaned_rcj_original_mc': '镀锌钢绞线', 'ejflid': '0103'}])
+        assert '镀锌钢绞线' in _names(service.search_rcj_mc_names('镀锌钢绞线', 5))
+        assert len(index) == 5
+
+    def test_late_commit_resync(self, app):
+        """测试update_time早于增量读取范围的行在行数不一致或定期全量读取时补上"""
+        index = NameSearchIndex()
+        index.refresh(db.session, resync_interval=3600)
+        assert len(index) == 4
+        table = RcjMC2Ejflid.__table__
+        late = datetime.now() - timedelta(hours=1)
+
+        # 新增的行：行数与索引不一致，全量读取该来源
+        db.session.execute(table.insert().values(orignal_rcjmc='冷拔低碳钢丝', ejflid='0103', update_time=late))
+        db.session.commit()
+        index.refresh(db.session, resync_interval=3600)
+        assert _names(index.search('冷拔钢丝', 1)) == ['冷拔低碳钢丝']
+
+        # 修改的行：行数不变，等到定期全量读取
+        db.session.execute(
+            table.update().where(table.c.orignal_rcjmc == '圆钢 HPB300')
+            .values(orignal_rcjmc='冷轧带肋钢筋', update_time=late)
+        )
+        db.session.commit()
+        index.refresh(db.session, resync_interval=3600)
+        assert index.search('冷轧带肋', 5) == []
+        index._resync_at.clear()
+        index.refresh(db.session, resync_interval=3600)
+        assert _names(index.search('冷轧带肋', 1)) == ['冷轧带肋钢筋']
+        assert _names(index.search('圆钢', 5)) == []
+        assert len(index) == 5
+
+    def test_search_endpoint(self, client, app):
+        """测试搜索接口及参数校验"""
+        response = client.get('/api/v1/dict/search', query_string={'q': '镀锌丝', 'k': 1})
+        assert response.status_code == 200
+        assert [item['name'] for item in response.get_json()['data']] == ['镀锌钢丝']
+
+        assert client.get('/api/v1/dict/search').status_code == 400
+        assert client.get('/api/v1/dict/search', query_string={'q': '钢丝', 'k': 0}).status_code == 400
+        assert client.get('/api/v1/dict/search', query_string={'q': '钢丝', 'k': 101}).status_code == 400
+        app.config['DICT_SEARCH_MAX_K'] = 5
+        assert client.get('/api/v1/dict/search', query_string={'q': '钢丝', 'k': 6}).status_code == 400
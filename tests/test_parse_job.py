@@ -0,0 +1,266 @@
+"""
+文件解析任务测试
+"""
+import pytest
+import os
+import tempfile
+from app import create_app, db
+from app.models.models_13jt import File, Rcjhzmx
+from app.services.parse_job_service import ParseJobService
+
+
+SAMPLE_13JT = """<?xml version="1.0" encoding="utf-8"?>
+<JingJiBiao Xmmc="测试项目">
+    <Dxgcxx Dxgcmc="单项工程">
+        <Dwgcxx Dwgcmc="单位工程">
+            <Rcjhz>
+                <Rcjhzmx Rcjbm="R001" Mc="普通硅酸盐水泥" Dw="t" Dj="450.5" />
+                <Rcjhzmx Rcjbm="R002" Mc="中砂" Dw="m3" Dj="120" />
+            </Rcjhz>
+        </Dwgcxx>
+    </Dxgcxx>
+</JingJiBiao>
+"""
+
+
+@pytest.fixture
+def app():
+    """创建测试应用"""
+    app = create_app('testing')
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """创建测试客户端"""
+    return app.test_client()
+
+
+@pytest.fixture
+def uploaded_13jt(app):
+    """在上传目录中准备一个已上传的13jt文件"""
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'abc123.13jt'), 'w', encoding='utf-8') as f:
+        f.write(SAMPLE_13JT)
+    file = File(hash='abc123', filename='test.13jt', filesize=len(SAMPLE_13JT), filetype='13jt')
+    db.session.add(file)
+    db.session.commit()
+    return file.id
+
+
+class TestParseJob:
+    """解析任务测试类"""
+
+    def test_submit_returns_job(self, client, uploaded_13jt):
+        """测试提交解析任务返回任务ID，任务完成后可查询进度"""
+        response = client.get(f'/api/v1/matrix/fileparser?fileid={uploaded_13jt}')
+        assert response.status_code == 202
+        job = response.get_json()
+        assert job['id']
+        assert job['file_id'] == uploaded_13jt
+
+        response = client.get(f"/api/v1/matrix/jobs/{job['id']}")
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['state'] == 'success'
+        assert data['progress']['origin_13jt_rcjhzmx'] == 2
+        assert data['total_rows'] == 6
+        assert data['duration'] is not None
+        assert Rcjhzmx.query.filter_by(file_id=uploaded_13jt).count() == 2
+
+    def test_missing_file_not_submitted(self, client, app, uploaded_13jt):
+        """测试文件记录或磁盘文件不存在时直接返回404，不创建任务"""
+        response = client.get('/api/v1/matrix/fileparser?fileid=999')
+        assert response.status_code == 404
+        assert '999' in response.get_json()['message']
+
+        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], 'abc123.13jt'))
+        response = client.get(f'/api/v1/matrix/fileparser?fileid={uploaded_13jt}')
+        assert response.status_code == 404
+
+    def test_failed_job_records_error(self, client, app, uploaded_13jt, monkeypatch):
+        """测试导入出错时任务失败并记录原因"""
+        from app.services.matrix_service import MatrixService
+
+        def broken_import(self, fileid, **kwargs):
+            raise ValueError(f'文件 {fileid} 格式错误')
+
+        monkeypatch.setattr(MatrixService, 'import_file', broken_import)
+        response = client.get(f'/api/v1/matrix/fileparser?fileid={uploaded_13jt}')
+        assert response.status_code == 202
+        job_id = response.get_json()['id']
+
+        data = client.get(f'/api/v1/matrix/jobs/{job_id}').get_json()
+        assert data['state'] == 'failed'
+        assert '格式错误' in data['error']
+
+    def test_resubmit_skips_imported_file(self, client, uploaded_13jt):
+        """测试重复提交同一文件不会重复导入，replace模式重新导入"""
+        for mode in ('skip', 'skip', 'replace'):
+            response = client.get(f'/api/v1/matrix/fileparser?fileid={uploaded_13jt}&mode={mode}')
+            assert response.get_json()['state'] == 'success'
+            assert response.get_json()['mode'] == mode
+        assert Rcjhzmx.query.filter_by(file_id=uploaded_13jt).count() == 2
+
+    def test_verify_mode(self, client, uploaded_13jt):
+        """测试verify模式同步返回行数比较结果"""
+        client.get(f'/api/v1/matrix/fileparser?fileid={uploaded_13jt}')
+        response = client.get(f'/api/v1/matrix/fileparser?fileid={uploaded_13jt}&mode=verify')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['match'] is True
+        assert data['tables']['origin_13jt_rcjhzmx'] == {'file': 2, 'manifest': 2, 'database': 2}
+
+        response = client.get('/api/v1/matrix/fileparser?fileid=999&mode=verify')
+        assert response.status_code == 404
+
+    def test_invalid_mode(self, client):
+        """测试非法导入模式"""
+        response = client.get('/api/v1/matrix/fileparser?fileid=1&mode=append')
+        assert response.status_code == 400
+
+    def test_invalid_fileid(self, client):
+        """测试非法文件ID"""
+        response = client.get('/api/v1/matrix/fileparser?fileid=abc')
+        assert response.status_code == 400
+
+    def test_job_not_found(self, client):
+        """测试查询不存在的任务"""
+        response = client.get('/api/v1/matrix/jobs/notexist')
+        assert response.status_code == 404
+
+    def test_concurrency_limit(self, app, uploaded_13jt):
+        """测试运行中的任务达到上限时不再认领新任务"""
+        from app.services import parse_job_service
+
+        app.config['PARSE_JOB_MAX_WORKERS'] = 1
+        app.config['PARSE_JOB_ASYNC'] = True
+        service = ParseJobService()
+        # 阻止自动执行，只插入pending任务
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(parse_job_service, '_get_executor', lambda app: type('E', (), {'submit': lambda *a, **k: None})())
+            first = service.submit_parse_job(str(uploaded_13jt))
+            second = service.submit_parse_job(str(uploaded_13jt))
+
+        claimed = parse_job_service._claim_next_job(1)
+        assert claimed['id'] == first.id
+        assert parse_job_service._claim_next_job(1) is None
+        assert service.get_parse_job(second.id).state == 'pending'
+
+    def test_recover_stale_running_jobs(self, app, uploaded_13jt):
+        """测试本进程已不再执行的running任务被重置为pending"""
+        from app.services import parse_job_service
+
+        app.config['PARSE_JOB_ASYNC'] = True
+        service = ParseJobService()
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(parse_job_service, '_get_executor', lambda app: type('E', (), {'submit': lambda *a, **k: None})())
+            job = service.submit_parse_job(str(uploaded_13jt))
+
+        parse_job_service._claim_next_job(2)
+        assert service.get_parse_job(job.id).state == 'running'
+
+        parse_job_service._recover_stale_jobs(-1)
+        assert service.get_parse_job(job.id).state == 'pending'
+
+    def test_recover_only_jobs_of_exited_processes(self, app, uploaded_13jt, monkeypatch):
+        """测试只重置执行进程已退出的任务，进程仍在运行时即使长时间没有进度也不重置"""
+        import socket
+        import subprocess
+        import sys
+        from datetime import datetime, timedelta
+        from app.models.parse_job import ParseJob
+        from app.services import parse_job_service
+
+        host = socket.gethostname()
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        now = datetime.now()
+        long_ago = now - timedelta(hours=1)
+        owners = {
+            'own-running': (f'{host}:{os.getpid()}', now),
+            'own-leftover': (f'{host}:{os.getpid()}', now),
+            'exited-process': (f'{host}:{exited.pid}', now),
+            'other-host': ('other-host:1', now),
+            'other-host-silent': ('other-host:1', long_ago),
+        }
+        parse_job_service._ensure_job_table()
+        with parse_job_service._jobs_engine().begin() as conn:
+            conn.execute(ParseJob.__table__.insert(), [
+                {'id': job_id, 'file_id': uploaded_13jt, 'mode': 'skip', 'state': 'running', 'owner': owner,
+                 'heartbeat_time': heartbeat, 'create_time': long_ago, 'update_time': long_ago}
+                for job_id, (owner, heartbeat) in owners.items()
+            ])
+        monkeypatch.setattr(parse_job_service, '_running_jobs', {'own-running'})
+
+        assert parse_job_service._beat_running_jobs() == 1
+        assert parse_job_service._recover_stale_jobs(600) == 3
+        service = ParseJobService()
+        assert {job_id: service.get_parse_job(job_id).state for job_id in owners} == {
+            'own-running': 'running',
+            'own-leftover': 'pending',
+            'exited-process': 'pending',
+            'other-host': 'running',
+            'other-host-silent': 'pending',
+        }
+
+    def test_job_table_upgraded(self, app):
+        """测试早期版本创建的任务表自动补上执行进程和心跳列"""
+        from sqlalchemy import inspect, text
+        from app.models.parse_job import ParseJob
+        from app.services import parse_job_service
+
+        engine = parse_job_service._jobs_engine()
+        ParseJob.__table__.drop(engine, checkfirst=True)
+        with engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE matrix_parse_job (id VARCHAR(32) PRIMARY KEY, file_id INTEGER NOT NULL, '
+                'mode VARCHAR(10) NOT NULL, state VARCHAR(10) NOT NULL, progress TEXT, error TEXT, '
+                'start_time DATETIME, finish_time DATETIME, create_time DATETIME NOT NULL, update_time DATETIME NOT NULL)'
+            ))
+        app.extensions.pop('parse_job_table', None)
+
+        parse_job_service._ensure_job_table()
+        columns = {column['name'] for column in inspect(engine).get_columns('matrix_parse_job')}
+        assert {'owner', 'heartbeat_time'} <= columns
+
+    def test_workers_resume_jobs_on_startup(self, app, uploaded_13jt):
+        """测试应用启动时重置中断的任务并执行遗留的任务，不必等待新的提交"""
+        from datetime import datetime, timedelta
+        from app.models.parse_job import ParseJob
+        from app.services import parse_job_service
+
+        parse_job_service._ensure_job_table()
+        long_ago = datetime.now() - timedelta(hours=1)
+        with parse_job_service._jobs_engine().begin() as conn:
+            conn.execute(ParseJob.__table__.insert(), [
+                {'id': 'pending-job', 'file_id': uploaded_13jt, 'mode': 'skip', 'state': 'pending',
+                 'create_time': long_ago, 'update_time': long_ago},
+                {'id': 'stale-job', 'file_id': uploaded_13jt, 'mode': 'skip', 'state': 'running',
+                 'create_time': long_ago, 'update_time': long_ago},
+            ])
+
+        app.config['PARSE_JOB_ASYNC'] = True
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(parse_job_service, '_executor', None)
+            parse_job_service.start_parse_job_workers(app)
+            parse_job_service._executor.shutdown(wait=True)
+
+        service = ParseJobService()
+        assert service.get_parse_job('pending-job').state == 'success'
+        assert service.get_parse_job('stale-job').state == 'success'
+        assert Rcjhzmx.query.filter_by(file_id=uploaded_13jt).count() == 2
+
+    def test_default_max_workers(self, app):
+        """测试未配置并发上限时非PostgreSQL数据库只运行一个任务"""
+        from app.services import parse_job_service
+
+        assert app.config['PARSE_JOB_MAX_WORKERS'] is None
+        assert parse_job_service._max_workers(app) == 1
+        app.config['PARSE_JOB_MAX_WORKERS'] = 3
+        assert parse_job_service._max_workers(app) == 3
@@ -431,4 +431,229 @@ class TestUploadService:
         
         # 验证抛出异常
         with pytest.raises(FileNotFoundError, match="文件ID 1 不存在"):
-            self.upload_service.delete_file(1) 
\ No newline at end of file
+            self.upload_service.delete_file(1) 
+
+class TestStreamingUpload:
+    """单次读取上传流测试类"""
+
+    def test_hash_and_size_computed_while_writing(self, app):
+        """测试写入时计算的哈希和大小与文件内容一致，且不残留临时文件"""
+        import hashlib
+        content = b"0123456789" * 300000  # 3MB，跨越多个块
+        service = UploadService()
+
+        result = service.upload_single_file(FileUploadRequestDTO(
+            file=FileStorage(stream=BytesIO(content), filename="big.txt")
+        ))
+
+        expected_hash = hashlib.md5(content).hexdigest()
+        assert result.hash == expected_hash
+        assert result.file_size == len(content)
+        assert os.listdir(app.config['UPLOAD_FOLDER']) == [f"{expected_hash}.txt"]
+
+    @pytest.mark.skipif(not hasattr(os, 'fchmod'), reason='需要POSIX文件权限')
+    def test_saved_file_respects_umask(self, app):
+        """测试保存的文件按umask设置权限，而不是mkstemp的0600"""
+        from app.services import upload_service
+
+        result = UploadService().upload_single_file(FileUploadRequestDTO(
+            file=FileStorage(stream=BytesIO(b"mode"), filename="mode.txt")
+        ))
+
+        mode = os.stat(os.path.join(app.config['UPLOAD_FOLDER'], f"{result.hash}.txt")).st_mode & 0o777
+        assert mode == 0o666 & ~upload_service._UMASK
+
+    def test_size_limit_enforced_while_writing(self, app):
+        """测试超过大小限制时中止写入并删除临时文件"""
+        service = UploadService()
+        service.max_file_size = 1024 * 1024
+
+        with pytest.raises(ValueError, match="文件过大"):
+            service.upload_single_file(FileUploadRequestDTO(
+                file=FileStorage(stream=BytesIO(b"x" * (2 * 1024 * 1024)), filename="large.txt")
+            ))
+
+        assert os.listdir(app.config['UPLOAD_FOLDER']) == []
+        assert File.query.count() == 0
+
+    def test_duplicate_removes_temp_file(self, app):
+        """测试重复文件上传时删除临时文件"""
+        service = UploadService()
+        content = b"duplicate content"
+        service.upload_single_file(FileUploadRequestDTO(file=FileStorage(stream=BytesIO(content), filename="a.txt")))
+
+        with pytest.raises(ValueError, match="文件已存在"):
+            service.upload_single_file(FileUploadRequestDTO(file=FileStorage(stream=BytesIO(content), filename="b.txt")))
+
+        assert len(os.listdir(app.config['UPLOAD_FOLDER'])) == 1
+
+
+class TestChunkedUpload:
+    """分块上传测试类"""
+
+    def _create_session(self, client, content, chunk_size, **extra):
+        response = client.post('/api/v1/upload/sessions', json={
+            'filename': 'big.13jt', 'file_size': len(content), 'chunk_size': chunk_size, **extra
+        })
+        assert response.status_code == 201
+        return response.get_json()
+
+    def test_chunks_in_any_order(self, client, app):
+        """测试乱序上传分块、查询缺失分块并完成合并"""
+        import hashlib
+        content = os.urandom(2500)
+        session = self._create_session(client, content, 1000, hash=hashlib.md5(content).hexdigest())
+        session_id = session['session_id']
+        assert session['total_chunks'] == 3
+        assert session['missing_chunks'] == [0, 1, 2]
+
+        client.put(f'/api/v1/upload/sessions/{session_id}/chunks/2', data=content[2000:])
+        client.put(f'/api/v1/upload/sessions/{session_id}/chunks/0', data=content[:1000])
+        data = client.get(f'/api/v1/upload/sessions/{session_id}').get_json()
+        assert data['missing_chunks'] == [1]
+
+        response = client.post(f'/api/v1/upload/sessions/{session_id}/complete')
+        assert response.status_code == 400
+
+        client.put(f'/api/v1/upload/sessions/{session_id}/chunks/1', data=content[1000:2000])
+        response = client.post(f'/api/v1/upload/sessions/{session_id}/complete')
+        assert response.status_code == 201
+        data = response.get_json()
+        assert data['hash'] == hashlib.md5(content).hexdigest()
+        assert data['file_size'] == len(content)
+
+        stored_path = os.path.join(app.config['UPLOAD_FOLDER'], data['hash'] + '.13jt')
+        with open(stored_path, 'rb') as f:
+            assert f.read() == content
+        if hasattr(os, 'fchmod'):
+            from app.services import upload_service
+            assert os.stat(stored_path).st_mode & 0o777 == 0o666 & ~upload_service._UMASK
+        assert client.get(f'/api/v1/upload/sessions/{session_id}').status_code == 404
+
+    def test_chunk_size_validated(self, client):
+        """测试分块大小与会话不一致时拒绝"""
+        session = self._create_session(client, b'x' * 2000, 1000)
+        response = client.put(f"/api/v1/upload/sessions/{session['session_id']}/chunks/0", data=b'x' * 999)
+        assert response.status_code == 400
+        response = client.put(f"/api/v1/upload/sessions/{session['session_id']}/chunks/5", data=b'x' * 1000)
+        assert response.status_code == 400
+        data = client.get(f"/api/v1/upload/sessions/{session['session_id']}").get_json()
+        assert data['missing_chunks'] == [0, 1]
+
+    def test_hash_mismatch_and_duplicate(self, client):
+        """测试哈希不一致及与已有文件重复"""
+        content = b'y' * 1500
+        session = self._create_session(client, content, 1000, hash='0' * 32)
+        for index, start in enumerate(range(0, len(content), 1000)):
+            client.put(f"/api/v1/upload/sessions/{session['session_id']}/chunks/{index}",
+                       data=content[start:start + 1000])
+        response = client.post(f"/api/v1/upload/sessions/{session['session_id']}/complete")
+        assert response.status_code == 400
+        assert '哈希不一致' in response.get_json()['details']
+
+        for expected_status in (201, 409):
+            session = self._create_session(client, content, 1000)
+            for index, start in enumerate(range(0, len(content), 1000)):
+                client.put(f"/api/v1/upload/sessions/{session['session_id']}/chunks/{index}",
+                           data=content[start:start + 1000])
+            response = client.post(f"/api/v1/upload/sessions/{session['session_id']}/complete")
+            assert response.status_code == expected_status
+
+    def test_invalid_session(self, client):
+        """测试不存在的会话及非法参数"""
+        assert client.get('/api/v1/upload/sessions/notexist').status_code == 404
+        assert client.put('/api/v1/upload/sessions/' + '0' * 32 + '/chunks/0', data=b'x').status_code == 404
+        response = client.post('/api/v1/upload/sessions', json={'filename': 'a.exe', 'file_size': 10})
+        assert response.status_code == 400
+
+    def test_cleanup_expired_sessions(self, client, app):
+        """测试清理无活动的会话及合并中断遗留的临时文件"""
+        from app.services.chunked_upload_service import ChunkedUploadService
+
+        session = self._create_session(client, b'z' * 10, 10)
+        stray = os.path.join(app.config['UPLOAD_FOLDER'], '.upload-crashed.part')
+        with open(stray, 'wb') as f:
+            f.write(b'partial')
+        service = ChunkedUploadService()
+        assert service.cleanup_expired_sessions(ttl=3600) == 0
+        assert os.path.exists(stray)
+        assert service.cleanup_expired_sessions(ttl=-1) == 1
+        assert client.get(f"/api/v1/upload/sessions/{session['session_id']}").status_code == 404
+        assert not os.path.exists(stray)
+
+
+class TestFileDownload:
+    """文件下载测试类"""
+
+    @pytest.fixture
+    def uploaded(self, client):
+        content = bytes(range(256)) * 40
+        response = client.post(
+            '/api/v1/upload/files',
+            data={'file': (BytesIO(content), 'data.txt')},
+            content_type='multipart/form-data'
+        )
+        return response.get_json(), content
+
+    def test_download_with_validators(self, client, uploaded):
+        """测试完整下载返回ETag和Last-Modified，条件请求返回304"""
+        data, content = uploaded
+        url = f"/api/v1/upload/files/{data['id']}/download"
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.data == content
+        assert response.headers['ETag'] == f'"{data["hash"]}"'
+        assert response.headers['Accept-Ranges'] == 'bytes'
+        assert 'attachment' in response.headers['Content-Disposition']
+
+        last_modified = response.headers['Last-Modified']
+        response = client.get(url, headers={'If-None-Match': f'"{data["hash"]}"'})
+        assert response.status_code == 304
+        assert response.data == b''
+
+        response = client.get(url, headers={'If-Modified-Since': last_modified})
+        assert response.status_code == 304
+
+    def test_range_requests(self, client, uploaded):
+        """测试Range、If-Range、多个范围及无法满足的范围"""
+        data, content = uploaded
+        url = f"/api/v1/upload/files/{data['id']}/download"
+
+        response = client.get(url, headers={'Range': 'bytes=100-199'})
+        assert response.status_code == 206
+        assert response.data == content[100:200]
+        assert response.headers['Content-Range'] == f'bytes 100-199/{len(content)}'
+
+        response = client.get(url, headers={'Range': 'bytes=-10'})
+        assert response.data == content[-10:]
+
+        response = client.get(url, headers={'Range': 'bytes=100-199', 'If-Range': '"stale"'})
+        assert response.status_code == 200
+        assert response.data == content
+
+        response = client.get(url, headers={'Range': f'bytes={len(content) + 10}-'})
+        assert response.status_code == 416
+
+        # 多个范围时忽略Range，返回完整文件
+        response = client.get(url, headers={'Range': 'bytes=0-9,20-29'})
+        assert response.status_code == 200
+        assert response.data == content
+        assert 'Content-Range' not in response.headers
+
+    def test_proxy_headers(self, client, app, uploaded):
+        """测试配置前置代理时只返回X-Accel-Redirect或X-Sendfile响应头"""
+        data, _ = uploaded
+        url = f"/api/v1/upload/files/{data['id']}/download"
+
+        app.config['DOWNLOAD_ACCEL_REDIRECT_PREFIX'] = '/protected-uploads/'
+        response = client.get(url)
+        assert response.headers['X-Accel-Redirect'] == f"/protected-uploads/{data['hash']}.txt"
+        assert response.data == b''
+
+        app.config['DOWNLOAD_ACCEL_REDIRECT_PREFIX'] = None
+        app.config['DOWNLOAD_SENDFILE_HEADER'] = 'X-Sendfile'
+        response = client.get(url)
+        assert response.headers['X-Sendfile'] == os.path.join(
+            os.path.abspath(app.config['UPLOAD_FOLDER']), f"{data['hash']}.txt"
+        )